@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the quality control tests and readers.
+
+Every benchmark runs over synthetic daily records (see synthetic.py) of
+10, 50 and 100 years. The best and median wall time of several runs and
+the peak memory allocated by a run (traced with tracemalloc) are saved
+to a JSON file, which can be compared with the results of a previous
+version.
+
+Usage
+-----
+    python benchmarks/run_benchmarks.py [--years 10 50 100]
+                                        [--repeat 5] [--output FILE]
+                                        [--compare PREVIOUS_FILE]
+                                        [--filter NAME]
+
+Author
+------
+    Roberto A. Real-Rangel (Institute of Engineering UNAM; Mexico)
+
+License
+-------
+    GNU General Public License
+"""
+from collections import OrderedDict
+import argparse
+import datetime as dt
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import xarray as xr
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+        __file__))))
+
+from tsqc import data_manager as dmgr  # noqa: E402
+from tsqc import quality_control_tests as qct  # noqa: E402
+import synthetic  # noqa: E402
+
+DEFAULT_YEARS = [10, 50, 100]
+
+# Name, function and arguments of every benchmark. The functions
+# receive the fixtures of a record length (see make_fixtures).
+BENCHMARKS = OrderedDict([
+        ('range_test', lambda f: qct.range_test(
+                f['series'], climatology=False)),
+        ('climatology_test', lambda f: qct.range_test(
+                f['series'], climatology=True)),
+        ('spikes_data_test', lambda f: qct.spikes_data_test(f['series'])),
+        ('change_rate_test', lambda f: qct.change_rate_test(f['series'])),
+        ('flat_series_test', lambda f: qct.flat_series_test(f['series'])),
+        ('tmp_outlier_test', lambda f: qct.tmp_outlier_test(f['series'])),
+        ('read_bdcn_file', lambda f: dmgr.read_bdcn_file(f['bdcn_file'])),
+        ('read_bandas_file', lambda f: dmgr.read_bandas_file(
+                f['bandas_file'], backend='sqlite'))])
+
+
+def make_fixtures(years, directory):
+    """Synthetic series and files of a record length."""
+    station = synthetic.synthetic_station(years=years)
+    bdcn_file = os.path.join(directory, '{:05d}.csv'.format(years))
+    bandas_file = os.path.join(directory, '{:05d}.sqlite'.format(years))
+    synthetic.write_bdcn_file(station, bdcn_file, station=str(years))
+    synthetic.write_bandas_file(station, bandas_file)
+    return({
+            'series': station['tmax'],
+            'bdcn_file': bdcn_file,
+            'bandas_file': bandas_file})
+
+
+def measure(function, fixtures, repeat=5):
+    """Best and median wall time (in seconds) of several runs of a
+    benchmark, and the peak memory allocated by one run (in bytes).
+    """
+    seconds = []
+
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        function(fixtures)
+        seconds.append(time.perf_counter() - start)
+
+    # Tracing slows down the run, so memory is measured apart.
+    gc.collect()
+    tracemalloc.start()
+
+    try:
+        function(fixtures)
+        _, peak = tracemalloc.get_traced_memory()
+
+    finally:
+        tracemalloc.stop()
+
+    return(OrderedDict([
+            ('best_seconds', min(seconds)),
+            ('median_seconds', float(np.median(seconds))),
+            ('peak_memory', peak),
+            ('repeat', repeat)]))
+
+
+def environment():
+    """Versions of the code and its dependencies."""
+    try:
+        revision = subprocess.check_output(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.STDOUT).decode().strip()
+
+    except (OSError, subprocess.CalledProcessError):
+        revision = ''
+
+    return(OrderedDict([
+            ('revision', revision),
+            ('date', dt.datetime.now().isoformat()),
+            ('python', platform.python_version()),
+            ('numpy', np.__version__),
+            ('xarray', xr.__version__),
+            ('machine', platform.machine()),
+            ('processor', platform.processor())]))
+
+
+def run_benchmarks(years=DEFAULT_YEARS, repeat=5, names=None):
+    """Runs the benchmarks for every record length.
+
+    Parameters
+    ----------
+        years: list (default is [10, 50, 100])
+            Record lengths, in years.
+        repeat: integer (default is 5)
+            Number of timed runs of every benchmark.
+        names: list (optional)
+            Benchmarks to run (see BENCHMARKS). By default, all.
+
+    Returns
+    -------
+        collections.OrderedDict
+            Environment and results of every benchmark and record
+            length.
+    """
+    names = list(BENCHMARKS) if not names else names
+    results = []
+    directory = tempfile.mkdtemp(prefix='tsqc_benchmarks_')
+
+    try:
+        for length in years:
+            fixtures = make_fixtures(length, directory)
+
+            for name in names:
+                result = OrderedDict([('benchmark', name), ('years', length)])
+                result.update(measure(BENCHMARKS[name], fixtures, repeat))
+                print("{benchmark:>18} {years:>4} years: "
+                      "{best_seconds:9.4f} s {peak_memory:>12,d} B".format(
+                              **result))
+                results.append(result)
+
+    finally:
+        shutil.rmtree(directory)
+
+    return(OrderedDict([
+            ('environment', environment()),
+            ('results', results)]))
+
+
+def compare(results, previous, tolerance=0.2):
+    """Prints the ratio of the best times and peak memory of two runs,
+    marking the changes above the tolerance.
+    """
+    old = {(i['benchmark'], i['years']): i for i in previous['results']}
+
+    for result in results['results']:
+        key = (result['benchmark'], result['years'])
+
+        if key not in old:
+            continue
+
+        time_ratio = result['best_seconds'] / old[key]['best_seconds']
+        memory_ratio = (float(result['peak_memory']) /
+                        max(old[key]['peak_memory'], 1))
+        marks = [
+                label for label, ratio in [
+                        ('slower', time_ratio), ('more memory', memory_ratio)]
+                if ratio > 1 + tolerance]
+        print("{:>18} {:>4} years: time x{:.2f}, memory x{:.2f} {}".format(
+                key[0], key[1], time_ratio, memory_ratio,
+                ', '.join(marks).upper()))
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(
+            description='Benchmarks of the quality control tests.')
+    parser.add_argument('--years', type=int, nargs='+',
+                        default=DEFAULT_YEARS,
+                        help='Record lengths, in years.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of timed runs of every benchmark.')
+    parser.add_argument('--filter', dest='names', nargs='+',
+                        choices=list(BENCHMARKS),
+                        help='Benchmarks to run.')
+    parser.add_argument('--output', default='benchmark_results.json',
+                        help='Output JSON file.')
+    parser.add_argument('--compare', default=None,
+                        help='JSON file of a previous run.')
+    args = parser.parse_args(argv)
+    results = run_benchmarks(
+            years=args.years, repeat=args.repeat, names=args.names)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=4)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Synthetic records for the benchmarks.
+
+Daily series with seasonality, gaps, injected spikes and flat
+stretches, and the BDCN and BANDAS (SQLite) files that hold them.
+
+Author
+------
+    Roberto A. Real-Rangel (Institute of Engineering UNAM; Mexico)
+
+License
+-------
+    GNU General Public License
+"""
+import io
+import os
+import sqlite3
+
+import numpy as np
+import xarray as xr
+
+BDCN_HEADER = [
+        u'SERVICIO METEOROLÓGICO NACIONAL',
+        u'BASE DE DATOS CLIMATOLÓGICA NACIONAL',
+        u'',
+        u'',
+        u'ESTACIÓN       : {station}',
+        u'NOMBRE         : SYNTHETIC',
+        u'ESTADO         : SYNTHETIC',
+        u'MUNICIPIO      : SYNTHETIC',
+        u'SITUACIÓN      : OPERANDO',
+        u'ORGANISMO      : CONAGUA-DGE',
+        u'CVE-OMM        : null',
+        u'LATITUD        : 19.3300°',
+        u'LONGITUD       : -99.1800°',
+        u'ALTITUD        : 2,240 msnm',
+        u'',
+        u'EMISIÓN        : 01/01/2019',
+        u'',
+        u'FECHA      PRECIP   EVAP   TMAX   TMIN',
+        u'---------- ------ ------ ------ ------']
+
+
+def synthetic_station(years=10, seed=0, start='1960-01-01'):
+    """ Daily records of a synthetic climatological station.
+
+    Parameters
+    ----------
+        years: integer (default is 10)
+            Length of the records, in years.
+        seed: integer (default is 0)
+            Seed of the random number generator.
+        start: string (default is '1960-01-01')
+            First date of the records.
+
+    Returns
+    -------
+        xarray.Dataset
+            Precipitation ('prec'), evaporation ('evap'), maximum and
+            minimum temperature ('tmax' and 'tmin'), and discharge
+            ('disc'), rounded to one decimal as in the BDCN files.
+    """
+    rng = np.random.RandomState(seed)
+    time = np.arange(
+            np.datetime64(start),
+            np.datetime64(start) + np.timedelta64(int(365.25 * years), 'D'))
+    n = len(time)
+    season = np.sin(2 * np.pi * np.arange(n) / 365.25)
+    wet = rng.uniform(size=n) < 0.25 + 0.2 * season
+    data = {
+            'prec': np.where(wet, rng.gamma(0.7, 9.0, n), 0.0),
+            'evap': 5 + 2 * season + rng.gamma(2.0, 0.5, n),
+            'tmax': 27 + 5 * season + rng.normal(0, 2, n),
+            'tmin': 11 + 5 * season + rng.normal(0, 2, n),
+            'disc': np.exp(2 + 1.5 * season + rng.normal(0, 0.3, n))}
+
+    for var, values in data.items():
+        # Gaps of 1 to 30 days covering about 5 % of the records.
+        for first in rng.randint(0, n, n // 300):
+            values[first:first + rng.randint(1, 31)] = np.nan
+
+        # Spikes and flat stretches.
+        spikes = rng.randint(0, n, max(1, n // 2000))
+        values[spikes] = values[spikes] * 6 + 10
+
+        for first in rng.randint(0, n, max(1, n // 3000)):
+            values[first:first + 6] = values[first]
+
+        data[var] = np.round(values, 1)
+
+    return(xr.Dataset(
+            data_vars={var: ('time', values) for var, values in data.items()},
+            coords={'time': time}))
+
+
+def write_bdcn_file(dataset, output_file, station='00000'):
+    """Writes the records of a synthetic station in the BDCN format."""
+    def field(value):
+        return('Nulo' if np.isnan(value) else '{:.1f}'.format(value))
+
+    dates = dataset['time'].values.astype('datetime64[D]').astype('str')
+    columns = [dataset[i].values for i in ['prec', 'evap', 'tmax', 'tmin']]
+    lines = [i.format(station=int(station)) for i in BDCN_HEADER]
+
+    for row, date in enumerate(dates):
+        year, month, day = date.split('-')
+        lines.append(u'{}/{}/{} {:>6} {:>6} {:>6} {:>6}'.format(
+                day, month, year, *[field(i[row]) for i in columns]))
+
+    lines.append(u'')
+
+    with io.open(str(output_file), 'w', encoding='latin1') as f:
+        f.write(u'\n'.join(lines) + u'\n')
+
+
+def write_bandas_file(dataset, output_file, var='disc'):
+    """Writes the records of a variable of a synthetic station as the
+    daily table of a BANDAS file, in SQLite (see
+    data_manager.export_bandas_sqlite). The name of the file is the
+    station ID (e.g., 00000.sqlite).
+    """
+    time = dataset['time'].values.astype('datetime64[D]')
+    values = dataset[var].values
+    months = time.astype('datetime64[M]')
+    month_list, row = np.unique(months, return_inverse=True)
+    days = np.full((len(month_list), 31), np.nan)
+    days[row.ravel(), (time - months).astype('int')] = values
+    table_name = 'DD' + os.path.splitext(os.path.basename(str(output_file)))[0]
+    columns = ['ANO', 'MES'] + ['D' + str(i + 1) for i in range(31)]
+    rows = [
+            [int(str(month)[:4]), int(str(month)[5:7])] +
+            [None if np.isnan(i) else float(i) for i in days[position]]
+            for position, month in enumerate(month_list)]
+
+    connection = sqlite3.connect(str(output_file))
+
+    try:
+        connection.execute('DROP TABLE IF EXISTS ' + table_name)
+        connection.execute('CREATE TABLE {} ({})'.format(
+                table_name, ', '.join(i + ' REAL' for i in columns)))
+        connection.executemany('INSERT INTO {} VALUES ({})'.format(
+                table_name, ', '.join('?' * len(columns))), rows)
+        connection.commit()
+
+    finally:
+        connection.close()
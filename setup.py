@@ -9,5 +9,9 @@ setup(
      author_email='rrealr@iingen.unam.mx',
      license='GPL-3.0',
      packages=['tsqc'],
+     entry_points={
+             'console_scripts': [
+                     'tsqc-batch = tsqc.batch:main',
+                     'tsqc-index = tsqc.archive_index:main']},
      zip_safe=False
      )
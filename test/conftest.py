@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""Fixtures of the tests: synthetic station datasets and files."""
+import io
+import sqlite3
+
+import numpy as np
+import pytest
+import xarray as xr
+
+BDCN_HEADER = [
+        'SERVICIO METEOROLÓGICO NACIONAL',
+        'BASE DE DATOS CLIMATOLÓGICA NACIONAL',
+        '',
+        '',
+        'ESTACIÓN       : {}',
+        'NOMBRE         : SYNTHETIC',
+        'ESTADO         : SYNTHETIC',
+        'MUNICIPIO      : SYNTHETIC',
+        'SITUACIÓN      : OPERANDO',
+        'ORGANISMO      : CONAGUA-DGE',
+        'CVE-OMM        : null',
+        'LATITUD        : 19.3300°',
+        'LONGITUD       : -99.1800°',
+        'ALTITUD        : 2,240 msnm',
+        '',
+        'EMISIÓN        : 01/01/2019',
+        '',
+        'FECHA      PRECIP   EVAP   TMAX   TMIN',
+        '---------- ------ ------ ------ ------']
+
+
+def synthetic_station(years=10, seed=0, start='1980-01-01'):
+    """Daily dataset of a station (prec, evap, tmax and tmin), with
+    seasonal cycles, missing values, a few outliers and a flat run.
+    Values are rounded to one decimal, as in the BDCN files.
+    """
+    rng = np.random.RandomState(seed)
+    start = np.datetime64(start, 'D')
+    time = np.arange(start, start + np.timedelta64(int(365.25 * years), 'D'))
+    angle = np.arange(len(time)) / 365.25 * 2 * np.pi
+    variables = {
+            'prec': rng.gamma(0.6, 8, len(time)) * (rng.rand(len(time)) < 0.4),
+            'evap': 4 + 2 * np.sin(angle) + rng.gamma(2, 0.5, len(time)),
+            'tmax': 28 + 5 * np.sin(angle) + rng.normal(0, 2, len(time)),
+            'tmin': 12 + 5 * np.sin(angle) + rng.normal(0, 2, len(time))}
+    dataset = xr.Dataset(coords={
+            'time': time.astype('datetime64[ns]') + np.timedelta64(8, 'h')})
+
+    for var in ['prec', 'evap', 'tmax', 'tmin']:
+        values = variables[var]
+        values[rng.randint(0, len(time), len(time) // 50)] = np.nan
+        values[rng.randint(0, len(time), 5)] *= 8
+        dataset[var] = ('time', np.round(values, 1))
+
+    dataset['tmax'][500:506] = 30.0
+    return(dataset)
+
+
+def write_bdcn(output_file, dataset, station=3):
+    """Writes a dataset as a BDCN station file (see
+    data_manager.read_bdcn_file).
+    """
+    def field(value):
+        return('Nulo' if np.isnan(value) else '{:.1f}'.format(value))
+
+    lines = [i.format(station) for i in BDCN_HEADER]
+
+    for row, day in enumerate(dataset['time'].values.astype('datetime64[D]')):
+        year, month, day = str(day).split('-')
+        lines.append('{}/{}/{} {:>6} {:>6} {:>6} {:>6}'.format(
+                day, month, year, *[
+                        field(dataset[var].values[row])
+                        for var in ['prec', 'evap', 'tmax', 'tmin']]))
+
+    with io.open(str(output_file), 'w', encoding='latin1') as f:
+        f.write('\n'.join(lines + ['']) + '\n')
+
+    return(str(output_file))
+
+
+def bandas_rows(years=3, seed=0):
+    """Rows of a daily discharge table of BANDAS (year, month and the
+    values of the days 1 to 31), with missing values (None or empty
+    strings), values of days that do not exist (e.g., February 30), a
+    repeated month, a missing month and rows out of order.
+    """
+    rng = np.random.RandomState(seed)
+    rows = []
+
+    for year in range(2000, 2000 + years):
+        for month in range(1, 13):
+            values = np.round(rng.gamma(2, 50, 31), 3).tolist()
+            values[rng.randint(31)] = None
+            values[rng.randint(31)] = ''
+            rows.append([year, month] + values)
+
+    rows.append(list(rows[16]))
+    rows[16][5] = 1e4
+    del rows[19]
+    rows[3], rows[30] = rows[30], rows[3]
+    return(rows)
+
+
+def write_bandas_sqlite(output_file, rows):
+    """Writes the rows of a daily discharge table as a BANDAS file
+    converted to SQLite (see data_manager.export_bandas_sqlite).
+    """
+    table_name = 'DD' + output_file.stem
+    columns = ['ANO', 'MES'] + ['D' + str(i + 1) for i in range(31)]
+    connection = sqlite3.connect(str(output_file))
+
+    try:
+        connection.execute('CREATE TABLE {} ({})'.format(
+                table_name, ', '.join(i + ' REAL' for i in columns)))
+        connection.executemany(
+                'INSERT INTO {} VALUES ({})'.format(
+                        table_name, ', '.join('?' * len(columns))),
+                rows)
+        connection.commit()
+
+    finally:
+        connection.close()
+
+    return(str(output_file))
+
+
+@pytest.fixture
+def station():
+    return(synthetic_station())
+
+
+@pytest.fixture
+def bdcn_file(tmp_path, station):
+    return(write_bdcn(tmp_path / '00003.csv', station))
+
+
+@pytest.fixture
+def bandas_file(tmp_path):
+    return(write_bandas_sqlite(tmp_path / '10001.sqlite', bandas_rows()))
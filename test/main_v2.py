@@ -10,6 +10,8 @@ import toml
 import xarray as xr
 
 import lib.data_manager as dmgr
+import lib.flags as flags
+import lib.gap_filling as gap_filling
 import lib.quality_control_tests as qct
 
 settings = toml.load(
@@ -29,7 +31,7 @@ X = xr.open_dataset(filename_or_obj=settings['general']['input_file'])
 for var in X.var():
     # Perform tests to raw data.
     if settings['level_1_tests']['gross_range_test']:
-        X[var + 'gross_range_test'] = qct.range_test(
+        X[var + '_gross_range_test'] = qct.range_test(
             input_ts=X[var],
             threshold=4.89164,
             climatology=False)
@@ -66,25 +68,24 @@ for var in X.var():
             threshold=4.89164)
 
     # Remove suspicious values.
-    tests = [i for i in X.var().keys() if i != var]
-    is_outlier = X[tests[0]].copy()
-
-    for test in tests:
-        is_outlier = (is_outlier | X[test])
+    X = flags.pack_flags(X)
+    is_outlier = flags.outlier_mask(X[var + flags.FLAG_SUFFIX])
 
     X[var + '_filtered'] = X[var].copy()
     X[var + '_filtered'][is_outlier] = np.nan
 
     # Fill short missing periods (<=3 days)
-    all_nans_filled = X.disc_filtered.interpolate_na(dim='time')
-    missing_data_grouper = (
-        X.disc_filtered.isnull() != X.disc_filtered.isnull().shift(time=1)
-        ).astype(int).cumsum()
-
-    for group in all_nans_filled.groupby(missing_data_grouper).groups.values():
-        if (len(group) > 3) & (np.isnan(X.disc_filtered.values[group[0]])):
-            all_nans_filled[{'time': group}] = np.nan
-
-    X[var + '_filled'] = all_nans_filled
-
-X.to_netcdf(settings['general']['output_file'])
+    X[var + '_filled'] = gap_filling.fill_gaps(
+        input_ts=X[var + '_filtered'],
+        max_gap=3,
+        method='linear')
+    X[var + '_filled'].attrs.update(gap_filling.gap_statistics(
+        X[var + '_filtered'],
+        max_gap=3,
+        method='linear'))
+
+if not flags.output_parameters(settings)['packed_flags']:
+    X = flags.unpack_flags(X)
+
+X.to_netcdf(settings['general']['output_file'],
+            encoding=flags.output_encoding(X, settings))
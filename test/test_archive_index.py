@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Tests of the metadata index of an archive of stations."""
+from pathlib2 import Path
+import numpy as np
+import pytest
+
+from tsqc import archive_index
+from tsqc import data_manager as dmgr
+from tsqc import quality_control_tests as qct
+from conftest import synthetic_station
+from conftest import write_bdcn
+
+
+@pytest.fixture
+def archive(tmp_path):
+    """Station files of several lengths and missing data ratios."""
+    input_files = []
+
+    for i, years in enumerate([5, 12, 20]):
+        station = synthetic_station(years=years, seed=i)
+        station['prec'][:365 * i] = np.nan
+        input_files.append(write_bdcn(
+                tmp_path / '{:05d}.csv'.format(i + 1), station,
+                station=i + 1))
+
+    return(input_files)
+
+
+def test_screening_queries(tmp_path, archive):
+    index_file = str(tmp_path / 'index.sqlite')
+    (tmp_path / '00009.csv').write_text('Not a station file.')
+    status = archive_index.build_index(
+            archive + [str(tmp_path / '00009.csv')], index_file)
+    assert list(status.values())[:3] == ['indexed'] * 3
+    assert status[str(tmp_path / '00009.csv')].startswith('failed')
+
+    datasets = dict(
+            (Path(i).stem, dmgr.read_bdcn_file(i)) for i in archive)
+
+    for threshold in [0.02, 0.05, 0.1]:
+        missing = archive_index.missd_ratio_test(index_file, threshold)
+        assert missing == dict(
+                ((station, var), bool(qct.missd_ratio_test(
+                        dataset[var], threshold)))
+                for station, dataset in datasets.items()
+                for var in dataset.data_vars)
+
+    for threshold in [4, 10, 15]:
+        long_enough = archive_index.minimlength_test(
+                index_file, threshold, variable='prec')
+        assert long_enough == dict(
+                ((station, 'prec'), bool(qct.minimlength_test(
+                        dataset['prec'], threshold)))
+                for station, dataset in datasets.items())
+
+    assert archive_index.screen_series(index_file, 0.1, 10, 'prec') == [
+            (station, 'prec') for station, dataset in sorted(
+                    datasets.items())
+            if not qct.missd_ratio_test(dataset['prec'], 0.1) and
+            qct.minimlength_test(dataset['prec'], 10)]
+
+
+def test_monthly_counts(tmp_path, archive):
+    index_file = str(tmp_path / 'index.sqlite')
+    archive_index.build_index(archive, index_file)
+    counts = archive_index.monthly_counts(index_file, '00002', 'prec')
+    prec = dmgr.read_bdcn_file(archive[1])['prec']
+    available = prec.notnull().resample(time='MS').sum()
+    available = available[available > 0]
+    np.testing.assert_array_equal(
+            counts['available'], available.values)
+    np.testing.assert_array_equal(
+            counts['year'], available['time.year'].values)
+    np.testing.assert_array_equal(
+            counts['month'], available['time.month'].values)
+
+
+def test_update_index(tmp_path, archive):
+    index_file = str(tmp_path / 'index.sqlite')
+    archive_index.build_index(archive, index_file)
+    assert list(archive_index.build_index(
+            archive, index_file).values()) == ['skipped'] * 3
+
+    # A file that changed is indexed again.
+    write_bdcn(archive[0], synthetic_station(years=15), station=1)
+    status = archive_index.build_index(archive, index_file)
+    assert list(status.values()) == ['indexed', 'skipped', 'skipped']
+    assert archive_index.minimlength_test(index_file, 10, 'tmax')[(
+            '00001', 'tmax')]
+
+
+def test_bandas_index(tmp_path, bandas_file):
+    index_file = str(tmp_path / 'index.sqlite')
+    archive_index.build_index([bandas_file], index_file, reader='bandas')
+    main = dmgr.read_bandas_file(bandas_file)['main']
+    assert archive_index.missd_ratio_test(index_file, 0.01) == {
+            ('10001', 'main'): bool(qct.missd_ratio_test(main, 0.01))}
+    assert archive_index.monthly_counts(
+            index_file, '10001', 'main')['available'].sum() == int(
+                    main.notnull().sum())
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""Tests of the batch processing of stations."""
+import copy
+import csv
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from tsqc import batch
+from tsqc import data_manager as dmgr
+from tsqc import pipeline
+from conftest import synthetic_station
+from conftest import write_bdcn
+
+
+@pytest.fixture
+def settings(tmp_path):
+    (tmp_path / 'input').mkdir()
+
+    for i in range(3):
+        write_bdcn(
+                tmp_path / 'input' / '{:05d}.csv'.format(i + 1),
+                synthetic_station(years=3, seed=i), station=i + 1)
+
+    # A file that cannot be read.
+    (tmp_path / 'input' / '00009.csv').write_text('Not a station file.')
+    return({
+            'general': {
+                    'input_dir': str(tmp_path / 'input'),
+                    'output_dir': str(tmp_path / 'output')},
+            'level_1_tests': {
+                    'climatology_test': True,
+                    'change_rate_test': True,
+                    'flat_series_test': True},
+            'output': {'packed_flags': False},
+            'batch': {'workers': 2, 'report': 'qc_report.csv'}})
+
+
+def statuses(records):
+    """Status of every station, without the error messages."""
+    return(dict(
+            (i['station'], i['status'].split(':')[0]) for i in records))
+
+
+def test_run_batch(settings):
+    records = batch.run_batch(settings)
+    assert statuses(records) == {
+            '00001': 'done', '00002': 'done', '00003': 'done',
+            '00009': 'failed'}
+
+    input_file = os.path.join(settings['general']['input_dir'], '00002.csv')
+    expected = pipeline.run_level1(dmgr.read_bdcn_file(input_file), settings)
+
+    with xr.open_dataset(batch.output_path(
+            input_file, settings['general']['output_dir'])) as output:
+        assert output.attrs[pipeline.SETTINGS_ATTR] == (
+                pipeline.settings_hash(settings))
+
+        for var in expected.data_vars:
+            np.testing.assert_array_equal(
+                    output[var].values, expected[var].values)
+
+    with open(os.path.join(
+            settings['general']['output_dir'], 'qc_report.csv'),
+            newline='') as f:
+        assert sorted(i['station'] for i in csv.DictReader(f)) == [
+                '00001', '00002', '00003', '00009']
+
+
+def test_resume(settings):
+    batch.run_batch(settings)
+    assert statuses(batch.run_batch(settings)) == {
+            '00001': 'skipped', '00002': 'skipped', '00003': 'skipped',
+            '00009': 'failed'}
+
+    # A newer input file.
+    input_file = os.path.join(settings['general']['input_dir'], '00001.csv')
+    os.utime(input_file, (1e10, 1e10))
+    assert statuses(batch.run_batch(settings))['00001'] == 'done'
+
+    # Other settings.
+    changed = copy.deepcopy(settings)
+    changed['level_1_parameters'] = {'threshold': 3.0}
+    assert pipeline.settings_hash(changed) != pipeline.settings_hash(
+            settings)
+    assert set(statuses(batch.run_batch(changed)).values()) == set([
+            'done', 'failed'])
+
+    assert set(statuses(batch.run_batch(
+            changed, resume=False)).values()) == set(['done', 'failed'])
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Tests of the benchmark harness."""
+import json
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        'benchmarks'))
+
+import run_benchmarks  # noqa: E402
+import synthetic  # noqa: E402
+
+from tsqc import data_manager as dmgr  # noqa: E402
+
+
+def test_fixture_files(tmp_path):
+    fixtures = run_benchmarks.make_fixtures(2, str(tmp_path))
+    station = synthetic.synthetic_station(years=2)
+    dataset = dmgr.read_bdcn_file(fixtures['bdcn_file'])
+
+    for var in ['prec', 'evap', 'tmax', 'tmin']:
+        np.testing.assert_array_equal(dataset[var].values, station[var].values)
+
+    # The BANDAS table holds whole months.
+    main = dmgr.read_bandas_file(fixtures['bandas_file'])['main'].values
+    np.testing.assert_array_equal(
+            main[:len(station['time'])], station['disc'].values)
+    assert np.isnan(main[len(station['time']):]).all()
+
+
+def test_run_benchmarks(tmp_path, capsys):
+    output_file = str(tmp_path / 'results.json')
+    arguments = ['--years', '1', '--repeat', '1', '--output', output_file]
+    run_benchmarks.main(arguments)
+
+    with open(output_file) as f:
+        results = json.load(f)
+
+    assert [i['benchmark'] for i in results['results']] == list(
+            run_benchmarks.BENCHMARKS)
+    assert all(
+            i['best_seconds'] > 0 and i['peak_memory'] > 0
+            for i in results['results'])
+
+    # A comparison with the previous results.
+    run_benchmarks.main(arguments + [
+            '--compare', output_file, '--filter', 'flat_series_test'])
+    assert 'flat_series_test    1 years: time x' in capsys.readouterr().out
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Tests of the cached climatology of the z-score tests."""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from tsqc import climatology
+from tsqc import pipeline
+from conftest import synthetic_station
+from conftest import write_bdcn
+
+CONFIG = {'level_1_tests': {
+        'gross_range_test': True,
+        'climatology_test': True,
+        'spikes_data_test': True,
+        'change_rate_test': True}}
+
+
+def test_round_trip(tmp_path, station):
+    original = climatology.Climatology.from_series(station['prec'])
+    original.save(str(tmp_path / 'prec.npz'))
+    loaded = climatology.Climatology.load(str(tmp_path / 'prec.npz'))
+    assert loaded.key == original.key
+
+    for name in climatology.SCORED_SERIES:
+        for actual, expected in zip(
+                loaded.moments[name], original.moments[name]):
+            np.testing.assert_array_equal(actual, expected)
+
+
+def test_cached_moments(tmp_path, station, bdcn_file):
+    config = dict(CONFIG, climatology={'cache_dir': str(tmp_path / 'c')})
+    expected = pipeline.run_level1(station, config)
+
+    # Cold and warm cache.
+    for _ in range(2):
+        flags = pipeline.run_level1(
+                station, config, moments=climatology.cached_moments(
+                        station, config, bdcn_file, 'bdcn'))
+
+        for var in expected.data_vars:
+            np.testing.assert_array_equal(
+                    flags[var].values, expected[var].values)
+
+    # A new version of the file gets a new key.
+    key = climatology.source_key(bdcn_file, 'bdcn', 'prec')
+    write_bdcn(bdcn_file, synthetic_station(years=11))
+    assert climatology.source_key(bdcn_file, 'bdcn', 'prec') != key
+
+
+def test_file_evicted_while_loaded(tmp_path, station, monkeypatch):
+    cache = climatology.ClimatologyCache(str(tmp_path))
+    expected = cache.climatology(station['prec'])
+    load = climatology.Climatology.load
+
+    # Another process evicts the file right after it is loaded.
+    def load_and_evict(input_file):
+        loaded = load(input_file)
+        input_file.unlink()
+        return(loaded)
+
+    monkeypatch.setattr(
+            climatology.Climatology, 'load', staticmethod(load_and_evict))
+    assert cache.get(expected.key).key == expected.key
+
+
+class VanishingDirectory(object):
+    """Directory whose files are removed (by another process) as soon
+    as they are listed.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __truediv__(self, name):
+        return(self.directory / name)
+
+    def glob(self, pattern):
+        files = list(self.directory.glob(pattern))
+
+        for i in files:
+            i.unlink()
+
+        return(files)
+
+
+def test_evict_skips_removed_files(tmp_path):
+    cache = climatology.ClimatologyCache(str(tmp_path), max_size=0)
+
+    for seed in range(3):
+        cache.climatology(synthetic_station(years=2, seed=seed)['prec'])
+
+    cache.directory = VanishingDirectory(cache.directory)
+    cache.evict()
+
+
+def climatologies(args):
+    """Computes climatologies through a shared cache (in a worker)."""
+    directory, seeds = args
+    cache = climatology.ClimatologyCache(directory, max_size=3000)
+
+    for _ in range(5):
+        for seed in seeds:
+            cache.climatology(synthetic_station(years=2, seed=seed)['prec'])
+
+
+def test_shared_by_processes(tmp_path):
+    seeds = list(range(4))
+
+    with ProcessPoolExecutor(4) as executor:
+        list(executor.map(climatologies, [
+                (str(tmp_path), seeds[i:] + seeds[:i]) for i in range(8)]))
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Tests of the level 1 tests over lazy multi-station cubes."""
+import numpy as np
+import pytest
+import xarray as xr
+
+from tsqc import data_manager as dmgr
+from tsqc import quality_control_tests as qct
+from conftest import synthetic_station
+
+TESTS = [
+        (qct.range_test, {}),
+        (qct.range_test, {'climatology': False}),
+        (qct.range_test, {'transform': 'log1p'}),
+        (qct.spikes_data_test, {}),
+        (qct.spikes_data_test, {'window': 5}),
+        (qct.change_rate_test, {}),
+        (qct.flat_series_test, {}),
+        (qct.flat_series_test, {'value_tolerance': 0.5}),
+        (qct.tmp_outlier_test, {'chunk_elements': 10000}),
+        (qct.missd_ratio_test, {'threshold': 0.015})]
+
+
+@pytest.fixture(scope='module')
+def cube_file(tmp_path_factory):
+    cube = xr.concat(
+            [synthetic_station(years=4, seed=i) for i in range(3)],
+            dim='station')
+    cube['station'] = ['00001', '00002', '00003']
+    output_file = tmp_path_factory.mktemp('cube') / 'cube.nc'
+    cube.to_netcdf(str(output_file))
+    return(str(output_file))
+
+
+@pytest.mark.parametrize('test, parameters', TESTS)
+def test_cube_matches_stations(cube_file, test, parameters):
+    with dmgr.open_cube(cube_file, station_chunk=2) as cube:
+        lazy = test(cube['tmax'], **parameters)
+        assert lazy.chunks is not None
+        flags = lazy.compute()
+
+        for station in cube['station'].values:
+            np.testing.assert_array_equal(
+                    flags.sel(station=station).values,
+                    test(cube['tmax'].sel(station=station).load(),
+                         **parameters).values)
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""Tests of the readers of the station files."""
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from tsqc import data_manager as dmgr
+from conftest import bandas_rows
+from conftest import synthetic_station
+from conftest import write_bdcn
+
+
+def assert_same_dataset(actual, expected):
+    np.testing.assert_array_equal(
+            actual['time'].values, expected['time'].values)
+
+    for var in expected.data_vars:
+        np.testing.assert_array_equal(
+                actual[var].values, expected[var].values)
+
+
+def data_lines(input_file):
+    """Rule and data rows of a BDCN file."""
+    with io.open(input_file, 'rb') as f:
+        lines = f.read().splitlines()
+
+    separator = lines.index(b'---------- ------ ------ ------ ------')
+    return(lines[separator], lines[separator + 1:-1])
+
+
+def test_bdcn_table_matches_text_parser(bdcn_file):
+    rule, data = data_lines(bdcn_file)
+    expected = np.fromstring(
+            b' '.join(data).replace(b'Nulo', b'nan').replace(b'/', b' '),
+            sep=' ').reshape(-1, 7)
+    np.testing.assert_array_equal(dmgr.parse_bdcn_table(rule, data), expected)
+
+
+def test_parse_fixed_width():
+    rng = np.random.RandomState(0)
+    numbers = [
+            round(float(value), int(decimals)) for value, decimals
+            in zip(rng.normal(0, 200, 1000), rng.randint(0, 3, 1000))]
+    fields = ['{:>7}'.format(repr(i)) for i in numbers] + ['   Nulo']
+    chars = np.frombuffer(
+            ''.join(fields).encode(), dtype='uint8').reshape(-1, 7)
+    values = dmgr.parse_fixed_width(chars)
+    np.testing.assert_array_equal(values[:-1], [float(i) for i in fields[:-1]])
+    assert np.isnan(values[-1])
+
+    # Fields that are not numbers.
+    assert dmgr.parse_fixed_width(chars[:, ::-1]) is None
+
+
+def test_read_bdcn_irregular_columns(tmp_path, station):
+    expected = dmgr.read_bdcn_file(write_bdcn(tmp_path / '00003.csv', station))
+
+    # Rows that do not follow the rule under the header.
+    rule, data = data_lines(str(tmp_path / '00003.csv'))
+    data = [b' '.join(row.split()) for row in data]
+    assert dmgr.parse_bdcn_table(rule, data) is None
+
+    with io.open(str(tmp_path / '00003.csv'), 'rb') as f:
+        header = f.read().split(rule)[0]
+
+    with io.open(str(tmp_path / '00004.csv'), 'wb') as f:
+        f.write(header + b'\n'.join([rule] + data + [b'']) + b'\n')
+
+    assert_same_dataset(
+            dmgr.read_bdcn_file(str(tmp_path / '00004.csv')), expected)
+
+
+
+def test_read_bdcn_repeated_and_missing_dates(tmp_path):
+    station = synthetic_station(years=2)
+    expected = station.copy(deep=True)
+
+    # A repeated date (the first record is kept) and missing dates.
+    station = station.isel(time=np.r_[0:100, 99, 130:len(station['time'])])
+    station['tmax'][100] = -5.0
+    expected = expected.where(
+            (expected['time'] < expected['time'][100]) |
+            (expected['time'] >= expected['time'][130]))
+    assert_same_dataset(
+            dmgr.read_bdcn_file(write_bdcn(tmp_path / '00003.csv', station)),
+            expected)
+
+
+def naive_bandas_dataset(rows):
+    """Daily dataset of the rows of a BANDAS table, one value at a time
+    (as the original implementation of read_bandas_file).
+    """
+    time = []
+    values = []
+
+    for row in rows:
+        for day, value in enumerate(row[2:]):
+            try:
+                time.append(np.datetime64('{:04d}-{:02d}-{:02d}'.format(
+                        int(row[0]), int(row[1]), day + 1)))
+                values.append(
+                        np.nan if value in [None, ''] else float(value))
+
+            except ValueError:
+                pass
+
+    time = np.array(time)
+    values = np.array(values)
+
+    # The values of repeated dates are removed.
+    kept = np.array([(time == i).sum() == 1 for i in time])
+    dataset = xr.Dataset(
+            data_vars={'main': (['time'], values[kept])},
+            coords={'time': time[kept]})
+    return(dataset.reindex(time=np.arange(
+            time.min(), time.max() + np.timedelta64(1, 'D'))))
+
+
+@pytest.mark.parametrize('batch_size', [10000, 7])
+def test_read_bandas_file(bandas_file, batch_size):
+    dataset = dmgr.read_bandas_file(bandas_file, batch_size=batch_size)
+    expected = naive_bandas_dataset(bandas_rows())
+    assert_same_dataset(dataset, expected)
+
+    # The repeated month is removed and the missing one is filled.
+    assert dataset['main'].sel(time='2001-05').isnull().all()
+    assert dataset['main'].sel(time='2001-08').isnull().all()
+    assert dataset['main'].sel(time='2000-02-29').notnull()
+
+
+MDB_EXPORT = '''#!{executable}
+"""Stand-in of mdb-export that reads SQLite files."""
+import csv
+import sqlite3
+import sys
+
+cursor = sqlite3.connect(sys.argv[1]).cursor()
+
+try:
+    cursor.execute('SELECT * FROM ' + sys.argv[2])
+
+except sqlite3.Error:
+    sys.exit(1)
+
+writer = csv.writer(sys.stdout)
+writer.writerow([i[0] for i in cursor.description])
+writer.writerows(
+        ['' if i is None else i for i in row] for row in cursor.fetchall())
+'''
+
+
+@pytest.fixture
+def mdb_export(tmp_path, monkeypatch):
+    """Puts a stand-in of mdb-export in the PATH."""
+    directory = tmp_path / 'bin'
+    directory.mkdir()
+    script = directory / 'mdb-export'
+    script.write_text(MDB_EXPORT.format(executable=sys.executable))
+    script.chmod(0o755)
+    monkeypatch.setenv(
+            'PATH', os.pathsep.join([str(directory), os.environ['PATH']]))
+
+
+def test_bandas_backend():
+    assert dmgr.bandas_backend('10001.sqlite') == 'sqlite'
+    assert dmgr.bandas_backend('10001.DB') == 'sqlite'
+    assert dmgr.bandas_backend('10001.mdb') == (
+            'odbc' if sys.platform.startswith('win') else 'mdbtools')
+
+
+def test_export_bandas_sqlite(tmp_path, bandas_file):
+    (tmp_path / 'export').mkdir()
+    output_file = str(tmp_path / 'export' / '10001.sqlite')
+    dmgr.export_bandas_sqlite(bandas_file, output_file, batch_size=7)
+    assert_same_dataset(
+            dmgr.read_bandas_file(output_file),
+            dmgr.read_bandas_file(bandas_file))
+
+    # Exporting again replaces the table.
+    dmgr.export_bandas_sqlite(bandas_file, output_file)
+    assert_same_dataset(
+            dmgr.read_bandas_file(output_file),
+            dmgr.read_bandas_file(bandas_file))
+
+
+@pytest.mark.skipif(
+        sys.platform.startswith('win'),
+        reason="Runs a script through its shebang line.")
+def test_read_bandas_mdbtools(tmp_path, bandas_file, mdb_export):
+    mdb_file = str(tmp_path / '10001.mdb')
+    os.rename(bandas_file, mdb_file)
+    assert_same_dataset(
+            dmgr.read_bandas_file(mdb_file, batch_size=7),
+            naive_bandas_dataset(bandas_rows()))
+
+    # A table that does not exist.
+    os.rename(mdb_file, str(tmp_path / '10002.mdb'))
+
+    with pytest.raises(IOError):
+        dmgr.read_bandas_file(str(tmp_path / '10002.mdb'))
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Tests of the packed quality control flags."""
+import numpy as np
+import pytest
+import xarray as xr
+
+from tsqc import flags
+
+
+def station_dataset(tests):
+    """Dataset of a variable with the (random) results of some tests."""
+    rng = np.random.RandomState(0)
+    time = np.arange(
+            np.datetime64('2000-01-01'), np.datetime64('2000-04-10'))
+    dataset = xr.Dataset(
+            {'prec': ('time', rng.gamma(0.8, 5.0, len(time)))},
+            coords={'time': time})
+
+    for test in tests:
+        dataset['prec_' + test] = ('time', rng.rand(len(time)) < 0.1)
+
+    return(dataset)
+
+
+@pytest.mark.parametrize('tests', [
+        ['climatology_test'],
+        ['gross_range_test', 'flat_series_test'],
+        flags.LEVEL1_TESTS])
+def test_netcdf_round_trip(tmp_path, tests):
+    dataset = station_dataset(tests)
+    output_file = str(tmp_path / 'station.nc')
+    flags.pack_flags(dataset).to_netcdf(output_file)
+
+    with xr.open_dataset(output_file) as stored:
+        stored = stored.load()
+
+    unpacked = flags.unpack_flags(stored)
+
+    for test in tests:
+        np.testing.assert_array_equal(
+                unpacked['prec_' + test].values,
+                dataset['prec_' + test].values)
+
+    expected = np.any(
+            [dataset['prec_' + test].values for test in tests], axis=0)
+    np.testing.assert_array_equal(
+            flags.outlier_mask(stored['prec' + flags.FLAG_SUFFIX]).values,
+            expected)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Tests of the filling of short gaps."""
+import numpy as np
+import pytest
+import xarray as xr
+
+from tsqc import gap_filling
+from conftest import synthetic_station
+
+
+def naive_gaps(values):
+    """Start and length of every gap, one value at a time."""
+    gaps = []
+
+    for i, value in enumerate(values):
+        if np.isnan(value):
+            if gaps and gaps[-1][0] + gaps[-1][1] == i:
+                gaps[-1][1] += 1
+
+            else:
+                gaps.append([i, 1])
+
+    return(gaps)
+
+
+def naive_fill(input_ts, max_gap, method):
+    """Fills the short gaps of a time series one gap at a time."""
+    values = input_ts.values
+    filled = values.copy()
+    months = input_ts['time.month'].values
+
+    for start, length in naive_gaps(values):
+        end = start + length
+
+        if length > max_gap:
+            continue
+
+        if method == 'climatology':
+            for i in range(start, end):
+                filled[i] = np.nanmean(values[months == months[i]])
+
+        elif start > 0 and end < len(values):
+            for i in range(start, end):
+                before = i - start + 1
+                after = end - i
+
+                if method == 'linear':
+                    filled[i] = values[start - 1] + (
+                            values[end] - values[start - 1]) * before / (
+                                    length + 1)
+
+                else:
+                    filled[i] = values[start - 1 if before <= after else end]
+
+    return(filled)
+
+
+@pytest.fixture
+def series():
+    input_ts = synthetic_station(years=3)['tmax'].copy()
+    rng = np.random.RandomState(1)
+
+    for length in rng.randint(1, 7, 60):
+        start = rng.randint(len(input_ts) - length)
+        input_ts[start:start + length] = np.nan
+
+    input_ts[:2] = np.nan
+    input_ts[-1] = np.nan
+    return(input_ts)
+
+
+@pytest.mark.parametrize('method', gap_filling.FILL_METHODS)
+@pytest.mark.parametrize('max_gap', [1, 3, 6])
+def test_fill_gaps(series, max_gap, method):
+    filled = gap_filling.fill_gaps(series, max_gap, method)
+    np.testing.assert_allclose(
+            filled.values, naive_fill(series, max_gap, method))
+    assert series.isnull().sum() > filled.isnull().sum()
+
+
+def test_fill_gaps_cube(series):
+    cube = xr.concat(
+            [series, series.shift(time=3)], dim='station').chunk(
+                    {'station': 1})
+    filled = gap_filling.fill_gaps(cube).compute()
+
+    for station in range(2):
+        np.testing.assert_array_equal(
+                filled[station].values,
+                gap_filling.fill_gaps(cube[station].compute()).values)
+
+
+@pytest.mark.parametrize('method', gap_filling.FILL_METHODS)
+def test_gap_statistics(series, method):
+    statistics = gap_filling.gap_statistics(series, 3, method)
+    gaps = naive_gaps(series.values)
+    filled = gap_filling.fill_gaps(series, 3, method)
+    assert statistics['missing'] == int(series.isnull().sum())
+    assert statistics['gaps'] == len(gaps)
+    assert statistics['longest_gap'] == max(i[1] for i in gaps)
+    assert statistics['fillable'] == int(
+            series.isnull().sum() - filled.isnull().sum())
+    assert statistics['short_gaps'] == len([
+            start for start, length in gaps
+            if np.isfinite(filled.values[start])])
+
+    np.testing.assert_array_equal(
+            gap_filling.gap_lengths(series).values[series.isnull().values],
+            np.concatenate([[length] * length for _, length in gaps]))
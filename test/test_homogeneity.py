@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""Tests of the homogeneity and randomness tests of many series."""
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from tsqc import homogeneity
+from tsqc import statistical_tables as st
+from conftest import synthetic_station
+
+
+def naive_tests(values):
+    """Statistics and breaks (the number of values before them) of the
+    tests of a single series without missing values.
+    """
+    n = len(values)
+    ranks = np.array([
+            (values < i).sum() + ((values == i).sum() + 1) / 2.0
+            for i in values])
+    k = np.arange(1, n)
+    z = (values - values.mean()) / values.std()
+    pettitt = np.array([
+            abs(2 * ranks[:i].sum() - i * (n + 1)) for i in k])
+    snht = np.array([
+            i * z[:i].mean() ** 2 + (n - i) * z[i:].mean() ** 2 for i in k])
+    cumsum = np.array([z[:i].sum() for i in k])
+    return(OrderedDict([
+            ('von_neumann', (
+                    (np.diff(ranks) ** 2).sum() /
+                    ((ranks - (n + 1) / 2.0) ** 2).sum(), None)),
+            ('pettitt', (pettitt.max(), k[pettitt.argmax()])),
+            ('snht', (snht.max(), k[snht.argmax()])),
+            ('buishand', (
+                    (max(cumsum.max(), 0) - min(cumsum.min(), 0)) /
+                    np.sqrt(n),
+                    k[np.abs(cumsum).argmax()]))]))
+
+
+@pytest.fixture
+def series():
+    # Series with missing years, ties, breaks and too few years.
+    rng = np.random.RandomState(0)
+    values = np.round(rng.normal(20, 1, (40, 60)), 1)
+    values[::3, 30:] += 2.0
+    values[rng.rand(*values.shape) < 0.1] = np.nan
+    values[5, 12:] = np.nan
+    values[6, 9:] = np.nan
+    return(xr.DataArray(
+            values, dims=['station', 'year'],
+            coords={'station': np.arange(40), 'year': np.arange(1950, 2010)}))
+
+
+def test_homogeneity_matches_naive(series):
+    results = homogeneity.homogeneity_tests(series)
+    assert (results['class'] == 2).sum() > 5
+
+    for station, row in enumerate(series.values):
+        is_valid = ~np.isnan(row)
+        years = series['year'].values[is_valid]
+        n = is_valid.sum()
+        assert int(results['n'][station]) == n
+
+        if n < 10:
+            assert int(results['rejections'][station]) == 0
+            continue
+
+        for test, (statistic, split) in naive_tests(row[is_valid]).items():
+            np.testing.assert_allclose(
+                    float(results[test + '_statistic'][station]), statistic)
+            is_rejected = bool(results[test + '_rejected'][station])
+
+            if split is not None:
+                assert int(results[test + '_break'][station]) == (
+                        years[split - 1] if is_rejected else -1)
+
+        critical = OrderedDict([
+                ('von_neumann', st.von_neumann_ratio(n)),
+                ('pettitt', st.pettitt(n)),
+                ('snht', st.snht(n)),
+                ('buishand', st.buishand_range(n))])
+
+        for test, value in critical.items():
+            np.testing.assert_allclose(
+                    float(results[test + '_critical'][station]), value)
+
+
+def test_break_year():
+    rng = np.random.RandomState(1)
+    values = rng.normal(20, 0.5, (1, 60))
+    values[:, 30:] += 2.0
+    series = xr.DataArray(
+            values, dims=['station', 'year'],
+            coords={'year': np.arange(1950, 2010)})
+    results = homogeneity.homogeneity_tests(series)
+
+    for test in ['pettitt', 'snht', 'buishand']:
+        assert int(results[test + '_break'][0]) == 1979
+
+    assert int(results['class'][0]) == 2
+
+
+def test_unknown_test(series):
+    with pytest.raises(ValueError):
+        homogeneity.homogeneity_tests(series, tests=['mann_kendall'])
+
+
+@pytest.mark.parametrize('period', ['annual', 'monthly'])
+@pytest.mark.parametrize('how', ['mean', 'sum'])
+def test_aggregate(period, how):
+    station = synthetic_station(years=6, start='1990-03-01')
+    evap = xr.concat(
+            [station['evap'], station['evap'] + 1], dim='station')
+    evap[1, 100:200] = np.nan
+    aggregates = homogeneity.aggregate(evap, period, how)
+    series = station['evap'].to_series()
+    keys = (
+            [series.index.year] if period == 'annual' else
+            [series.index.month, series.index.year])
+
+    for offset, station_aggregates in zip([0, 1], aggregates):
+        values = evap[offset].to_series()
+        grouped = values.groupby(keys)
+        expected = (grouped.mean() if how == 'mean' else grouped.sum())
+        steps = grouped.size()
+
+        # The incomplete years (or months) are not aggregated.
+        expected[grouped.count() < 0.8 * steps] = np.nan
+
+        for key, value in expected.items():
+            actual = (
+                    station_aggregates.sel(year=key) if period == 'annual'
+                    else station_aggregates.sel(month=key[0], year=key[1]))
+            np.testing.assert_allclose(float(actual), value)
+
+    # The record starts in March 1990.
+    if period == 'monthly':
+        assert np.isnan(aggregates.sel(year=1990, month=[1, 2])).all()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Tests of the incremental level 1 tests of appended observations."""
+import numpy as np
+import xarray as xr
+
+from tsqc import incremental
+from tsqc import pipeline
+from tsqc.flags import pack_flags
+
+CONFIG = {'level_1_tests': {
+        'gross_range_test': True,
+        'climatology_test': True,
+        'spikes_data_test': True,
+        'change_rate_test': True,
+        'flat_series_test': True}}
+
+
+def full_run(dataset, config=CONFIG):
+    """Output of the level 1 tests of the whole record."""
+    return(pack_flags(dataset.merge(pipeline.run_level1(dataset, config))))
+
+
+def assert_same_dataset(actual, expected):
+    np.testing.assert_array_equal(
+            actual['time'].values, expected['time'].values)
+
+    for var in expected.data_vars:
+        np.testing.assert_array_equal(
+                actual[var].values, expected[var].values)
+
+
+def recorded_lengths(monkeypatch):
+    """Records the length of the records tested by run_level1."""
+    lengths = []
+    run_level1 = incremental.run_level1
+
+    def recorded_run_level1(dataset, config, moments=None):
+        lengths.append(dataset.sizes['time'])
+        return(run_level1(dataset, config, moments))
+
+    monkeypatch.setattr(incremental, 'run_level1', recorded_run_level1)
+    return(lengths)
+
+
+def test_appended_rows(tmp_path, station, monkeypatch):
+    output_file = str(tmp_path / '00003.nc')
+    ends = [len(station['time']) - i for i in [30, 20, 19, 5, 0]]
+    first = incremental.run_incremental(
+            station.isel(time=slice(0, ends[0])), output_file, CONFIG)
+    lengths = recorded_lengths(monkeypatch)
+
+    for previous_end, end in zip(ends[:-1], ends[1:]):
+        dataset = station.isel(time=slice(0, end))
+        output = incremental.run_incremental(dataset, output_file, CONFIG)
+
+        # Only the new rows (and the tail) are tested, and their flags
+        # are those of a test of the whole record.
+        assert lengths[-1] == end - previous_end + (
+                incremental.overlap_length(CONFIG))
+        new_rows = dict(time=slice(previous_end, None))
+        assert_same_dataset(
+                output.isel(**new_rows), full_run(dataset).isel(**new_rows))
+
+        with xr.open_dataset(incremental.statistics_path(
+                output_file)) as statistics:
+            expected = incremental.level1_statistics(dataset, CONFIG)
+            assert statistics.attrs[incremental.RECORD_HASH_ATTR] == (
+                    expected.attrs[incremental.RECORD_HASH_ATTR])
+
+            for var in expected.data_vars:
+                np.testing.assert_allclose(
+                        statistics[var].values, expected[var].values)
+
+    # The flags of the previous rows are kept (but that of the last
+    # one, whose spike needed the next value).
+    with xr.open_dataset(output_file) as output:
+        previous_rows = dict(time=slice(0, ends[0] - 1))
+        assert_same_dataset(
+                output.isel(**previous_rows), first.isel(**previous_rows))
+
+
+def test_revised_rows(tmp_path, station, monkeypatch):
+    output_file = str(tmp_path / '00003.nc')
+    end = len(station['time']) - 10
+    incremental.run_incremental(
+            station.isel(time=slice(0, end)), output_file, CONFIG)
+    lengths = recorded_lengths(monkeypatch)
+
+    # A revised row before the tail leads to a test of the whole record.
+    revised = station.copy(deep=True)
+    revised['tmax'][100] = 80.0
+    output = incremental.run_incremental(revised, output_file, CONFIG)
+    assert lengths == [len(station['time'])]
+    assert_same_dataset(output, full_run(revised))
+    assert output['tmax_qc'].values[100]
+
+    # And so do other settings.
+    config = dict(CONFIG, level_1_parameters={'threshold': 3.0})
+    output = incremental.run_incremental(revised, output_file, config)
+    assert lengths[-1] == len(station['time'])
+    assert_same_dataset(output, full_run(revised, config))
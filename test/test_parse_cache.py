@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Tests of the cache of the parsed station files."""
+from concurrent.futures import ProcessPoolExecutor
+import os
+import shutil
+
+import numpy as np
+
+from tsqc import data_manager as dmgr
+from tsqc import parse_cache
+from conftest import synthetic_station
+from conftest import write_bdcn
+
+
+def assert_same_dataset(actual, expected):
+    np.testing.assert_array_equal(
+            actual['time'].values, expected['time'].values)
+
+    for var in expected.data_vars:
+        np.testing.assert_array_equal(
+                actual[var].values, expected[var].values)
+
+
+def test_round_trip(tmp_path, bdcn_file, monkeypatch):
+    cache = parse_cache.ParseCache(str(tmp_path / 'cache'))
+    expected = cache.read(bdcn_file)
+    assert_same_dataset(expected, dmgr.read_bdcn_file(bdcn_file))
+
+    # The second read maps the bundle instead of parsing the file.
+    def unexpected_read(input_file):
+        raise AssertionError("The file was parsed again.")
+
+    monkeypatch.setitem(dmgr.READERS, 'bdcn', unexpected_read)
+    cached = cache.read(bdcn_file)
+    assert_same_dataset(cached, expected)
+    assert cached.attrs == expected.attrs
+
+
+def test_stale_bundle_is_replaced(tmp_path, bdcn_file):
+    cache = parse_cache.ParseCache(str(tmp_path / 'cache'))
+    cache.read(bdcn_file)
+    station = synthetic_station(years=11, seed=1)
+    write_bdcn(bdcn_file, station)
+    assert_same_dataset(cache.read(bdcn_file), station)
+    assert len(list((tmp_path / 'cache').iterdir())) == 1
+
+
+def test_bundle_evicted_while_loaded(tmp_path, bdcn_file, monkeypatch):
+    cache = parse_cache.ParseCache(str(tmp_path / 'cache'))
+    expected = cache.read(bdcn_file)
+    load_bundle = parse_cache.load_bundle
+
+    # Another process evicts the bundle right after it is loaded.
+    def load_and_evict(directory):
+        dataset = load_bundle(directory)
+        shutil.rmtree(str(directory))
+        return(dataset)
+
+    monkeypatch.setattr(parse_cache, 'load_bundle', load_and_evict)
+    assert_same_dataset(
+            cache.get(cache.path(bdcn_file, 'bdcn')), expected)
+
+
+def test_bundle_saved_by_another_process(tmp_path, bdcn_file, monkeypatch):
+    cache = parse_cache.ParseCache(str(tmp_path / 'cache'))
+    dataset = dmgr.read_bdcn_file(bdcn_file)
+    cached = cache.path(bdcn_file, 'bdcn')
+    save_bundle = parse_cache.save_bundle
+
+    # Another process saves the same bundle while this one writes it.
+    def save_twice(dataset, directory):
+        save_bundle(dataset, cached)
+        save_bundle(dataset, directory)
+
+    monkeypatch.setattr(parse_cache, 'save_bundle', save_twice)
+    cache.put(dataset, cached)
+    assert_same_dataset(cache.get(cached), dataset)
+    assert [i.name for i in (tmp_path / 'cache').iterdir()] == [cached.name]
+
+
+def test_evict_skips_removed_bundles(tmp_path, monkeypatch):
+    cache = parse_cache.ParseCache(str(tmp_path / 'cache'), max_size=0)
+    files = [
+            write_bdcn(tmp_path / '{:05d}.csv'.format(i),
+                       synthetic_station(years=2, seed=i), station=i)
+            for i in range(3)]
+
+    for input_file in files:
+        cache.put(dmgr.read_bdcn_file(input_file),
+                  cache.path(input_file, 'bdcn'))
+
+    bundle_size = parse_cache.bundle_size
+
+    # Another process removes every bundle before its size is taken.
+    def remove_and_size(directory):
+        shutil.rmtree(str(directory))
+        return(bundle_size(directory))
+
+    monkeypatch.setattr(parse_cache, 'bundle_size', remove_and_size)
+    cache.evict()
+
+
+def read_many(args):
+    """Reads station files through a shared cache (in a worker)."""
+    directory, files = args
+    cache = parse_cache.ParseCache(directory, max_size=200000)
+
+    for _ in range(5):
+        for input_file in files:
+            cache.read(input_file)
+
+    return(os.getpid())
+
+
+def test_shared_by_processes(tmp_path):
+    files = [
+            write_bdcn(tmp_path / '{:05d}.csv'.format(i),
+                       synthetic_station(years=3, seed=i), station=i)
+            for i in range(4)]
+    directory = str(tmp_path / 'cache')
+
+    with ProcessPoolExecutor(4) as executor:
+        list(executor.map(
+                read_many, [(directory, files[i:] + files[:i])
+                            for i in range(8)]))
+
+    cache = parse_cache.ParseCache(directory)
+
+    for input_file in files:
+        assert_same_dataset(
+                cache.read(input_file), dmgr.read_bdcn_file(input_file))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Tests of the level 1 tests of a station run in a single pass."""
+import numpy as np
+import pytest
+
+from tsqc import pipeline
+from tsqc import quality_control_tests as qct
+
+TESTS = [
+        'gross_range_test', 'climatology_test', 'spikes_data_test',
+        'change_rate_test', 'flat_series_test', 'tmp_outlier_test']
+
+
+def individual_flags(input_ts, parameters):
+    """Flags of every level 1 test of a variable, performed one at a
+    time.
+    """
+    threshold = parameters['threshold']
+    return({
+            'gross_range_test': qct.range_test(
+                    input_ts, threshold, climatology=False),
+            'climatology_test': qct.range_test(input_ts, threshold),
+            'spikes_data_test': qct.spikes_data_test(input_ts, threshold),
+            'change_rate_test': qct.change_rate_test(input_ts, threshold),
+            'flat_series_test': qct.flat_series_test(
+                    input_ts,
+                    value_tolerance=parameters['value_tolerance'],
+                    repetitions_tolerance=parameters[
+                            'repetitions_tolerance'],
+                    skipzero=parameters['skipzero']),
+            'tmp_outlier_test': qct.tmp_outlier_test(
+                    input_ts, c=parameters['c'], threshold=threshold)})
+
+
+@pytest.mark.parametrize('parameters', [{}, {
+        'threshold': 3.5,
+        'value_tolerance': 0.2,
+        'repetitions_tolerance': 3,
+        'skipzero': False,
+        'c': 6.0}])
+def test_run_level1_matches_tests(station, parameters):
+    config = {
+            'level_1_tests': dict((i, True) for i in TESTS),
+            'level_1_parameters': parameters}
+    flags = pipeline.run_level1(station, config)
+    assert len(flags.data_vars) == len(TESTS) * len(station.data_vars)
+
+    for var in station.data_vars:
+        expected = individual_flags(
+                station[var], pipeline.level1_parameters(config))
+
+        for test in TESTS:
+            np.testing.assert_array_equal(
+                    flags['_'.join([var, test])].values,
+                    expected[test].values)
+
+
+def test_run_level1_enabled_tests(station):
+    config = {'level_1_tests': {
+            'climatology_test': True, 'spikes_data_test': False}}
+    flags = pipeline.run_level1(station, config)
+    assert sorted(flags.data_vars) == sorted(
+            var + '_climatology_test' for var in station.data_vars)
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""Tests of the z-score tests over zero-inflated (precipitation-like)
+time series.
+"""
+import numpy as np
+import pytest
+import xarray as xr
+
+from tsqc import pipeline
+from tsqc import quality_control_tests as qct
+
+THRESHOLD = 4.89164
+
+
+def zero_inflated_series(dry_fraction=0.7, years=20, seed=0, outlier=1e5):
+    """Daily precipitation-like series with a fraction of dry (zero)
+    days and, optionally, a single outlier in the middle.
+    """
+    rng = np.random.RandomState(seed)
+    time = np.arange(
+            np.datetime64('2000-01-01'),
+            np.datetime64('2000-01-01') + np.timedelta64(365 * years, 'D'))
+    values = rng.gamma(0.8, 5.0, len(time))
+    values[rng.rand(len(time)) < dry_fraction] = 0.0
+
+    if outlier is not None:
+        values[len(time) // 2] = outlier
+
+    return(xr.DataArray(
+            values, coords={'time': time}, dims=['time'], name='prec'))
+
+
+def test_robust_zscores_zero_mad():
+    # A coarsely rounded series, in which most values equal the median.
+    rng = np.random.RandomState(0)
+    values = np.where(
+            rng.rand(3650) < 0.6, 10.0, np.round(rng.gamma(20, 0.5, 3650)))
+    values[1000] = 100.0
+    groups = np.zeros(len(values), dtype='int')
+    deviation = np.abs(values - qct.group_medians(values, groups)[groups])
+    assert qct.group_medians(deviation, groups)[0] == 0
+
+    scores = qct.robust_zscores(values, groups)
+    assert np.isfinite(scores).all()
+    assert (scores[values == 10.0] == 0).all()
+    assert np.abs(scores).argmax() == 1000
+
+
+@pytest.mark.parametrize('transform', ['log1p', 'boxcox'])
+@pytest.mark.parametrize('robust', [False, True])
+@pytest.mark.parametrize('climatology', [False, True])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_range_test_false_positive_rate(transform, robust, climatology,
+                                        seed):
+    prec = zero_inflated_series(
+            dry_fraction=0.77, years=30, seed=seed, outlier=None)
+    flags = qct.range_test(
+            prec, THRESHOLD, climatology, transform=transform,
+            robust=robust)
+    assert int(flags.sum()) <= 1e-3 * int((prec > 0).sum())
+
+
+@pytest.mark.parametrize('transform', ['log', 'log1p', 'boxcox'])
+@pytest.mark.parametrize('robust', [False, True])
+@pytest.mark.parametrize('climatology', [False, True])
+def test_range_test_zero_inflated(transform, robust, climatology):
+    prec = zero_inflated_series()
+    flags = qct.range_test(
+            prec, THRESHOLD, climatology, transform=transform,
+            robust=robust)
+    assert flags[len(prec) // 2]
+    assert not flags[prec == 0].any()
+
+
+def test_rank_threshold_cap():
+    prec = zero_inflated_series()
+    cap = qct.rank_score_cap(len(prec))
+    scores = qct.series_scores(prec, 'values', False, transform='rank')
+    assert float(abs(scores).max()) <= cap
+
+    with pytest.raises(ValueError):
+        qct.range_test(prec, THRESHOLD, transform='rank')
+
+    flags = qct.range_test(prec, 3.0, False, transform='rank')
+    assert flags[len(prec) // 2]
+
+
+@pytest.mark.parametrize('transform', ['log', 'log1p', 'boxcox', 'rank'])
+@pytest.mark.parametrize('robust', [False, True])
+def test_run_level1_scoring(transform, robust):
+    dataset = xr.Dataset({
+            'prec': zero_inflated_series(),
+            'evap': zero_inflated_series(dry_fraction=0.0, seed=1)})
+    config = {
+            'level_1_tests': {
+                    'gross_range_test': True,
+                    'climatology_test': True,
+                    'spikes_data_test': True,
+                    'change_rate_test': True},
+            'level_1_parameters': {
+                    'threshold': 3.0,
+                    'transform': transform,
+                    'robust': robust}}
+    flags = pipeline.run_level1(dataset, config)
+
+    for var in dataset.data_vars:
+        expected = {
+                'gross_range_test': qct.range_test(
+                        dataset[var], 3.0, False,
+                        transform=transform, robust=robust),
+                'climatology_test': qct.range_test(
+                        dataset[var], 3.0, True,
+                        transform=transform, robust=robust),
+                'spikes_data_test': qct.spikes_data_test(
+                        dataset[var], 3.0,
+                        transform=transform, robust=robust),
+                'change_rate_test': qct.change_rate_test(
+                        dataset[var], 3.0,
+                        transform=transform, robust=robust)}
+
+        for test, test_flags in expected.items():
+            np.testing.assert_array_equal(
+                    flags['_'.join([var, test])].values, test_flags.values)
+
+
+@pytest.mark.parametrize('weights', [
+        None, qct.spike_weights(5), [0.1, 0.4, 0.0, 0.4, 0.1]])
+def test_spikes_series_matches_rolling_window(station, weights):
+    weights = qct.spike_weights() if weights is None else np.array(weights)
+    evap = station['evap']
+    windows = evap.rolling(time=len(weights), center=True).construct('window')
+    expected = abs(evap - windows.dot(xr.DataArray(weights, dims='window')))
+
+    # Zero spikes are masked, so NaN and zero are the same.
+    np.testing.assert_allclose(
+            np.nan_to_num(qct.spikes_series(evap, weights).values),
+            np.nan_to_num(expected.values), atol=1e-12)
+
+
+def test_spikes_reference_window(station):
+    from tsqc.climatology import Climatology
+
+    reference = Climatology.from_series(station['evap'])
+    np.testing.assert_array_equal(
+            qct.spikes_data_test(station['evap'], reference=reference).values,
+            qct.spikes_data_test(station['evap']).values)
+
+    with pytest.raises(ValueError):
+        qct.spikes_data_test(station['evap'], reference=reference, window=5)
+
+    with pytest.raises(ValueError):
+        qct.spikes_data_test(
+                station['evap'], reference=reference,
+                weights=[0.25, 0.0, 0.75])
+
+
+@pytest.mark.parametrize('value_tolerance', [0.0, 0.5, 1.0])
+@pytest.mark.parametrize('repetitions_tolerance', [0, 1, 2, 5])
+@pytest.mark.parametrize('skipzero', [False, True])
+def test_flat_series_spread(value_tolerance, repetitions_tolerance,
+                            skipzero):
+    rng = np.random.RandomState(0)
+    values = np.round(rng.rand(2000) * 3) / 2
+    values[rng.rand(len(values)) < 0.05] = np.nan
+    width = max(repetitions_tolerance, 1) + 1
+    expected = np.zeros(len(values), dtype='bool')
+
+    # Every data point compared with the previous ones.
+    for i in range(width - 1, len(values)):
+        window = values[i - width + 1:i + 1]
+        expected[i] = (
+                np.ptp(window) <= value_tolerance and
+                not (skipzero and (window == 0).any()))
+
+    np.testing.assert_array_equal(
+            qct.flat_values(
+                    values, value_tolerance, repetitions_tolerance,
+                    skipzero),
+            expected)
+
+
+def test_flat_series_drift(station):
+    # A drift of 1.0 every ten days is not flat, although the difference
+    # between consecutive values is within the tolerance.
+    tmax = station['tmax'].copy()
+    tmax[1000:1100] = 20 + 0.1 * np.arange(100)
+    flags, runs = qct.flat_series_test(
+            tmax, value_tolerance=0.5, repetitions_tolerance=10,
+            return_runs=True)
+    assert not flags[1000:1100].any()
+
+    flags, runs = qct.flat_series_test(tmax, return_runs=True)
+    assert flags[502:506].all()
+    assert runs['start'].values[0] == tmax['time'].values[500]
+    assert runs['length'].values[0] == 6
+
+
+def naive_biweight_outliers(input_ts, c=7.5, threshold=4.89164):
+    """Biweight outliers of every date, one date at a time (as the
+    original implementation of tmp_outlier_test).
+    """
+    dates = input_ts.time.values.astype('datetime64[D]')
+    values = input_ts.values
+    month_days = [str(i)[5:] for i in dates]
+    is_outlier = np.zeros(len(values), dtype='bool')
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i, date in enumerate(dates):
+            window = set(
+                    str(day)[5:] for day in np.arange(date - 15, date + 16))
+            in_sample = np.array([day in window for day in month_days])
+            in_sample[i] = False
+            X_i = values[in_sample]
+            M = np.nanmedian(X_i)
+            MAD = np.nanmedian(np.abs(X_i - M))
+            u_i = (X_i - M) / (c * MAD)
+            u_i[np.abs(u_i) > 1] = 1
+            Xmean_bi = M + (
+                    np.nansum((X_i - M) * (1 - u_i ** 2) ** 2) /
+                    np.nansum((1 - u_i ** 2) ** 2))
+            s_bi = np.sqrt(X_i.size * np.nansum(
+                    (X_i - M) ** 2 * (1 - u_i ** 2) ** 4)) / np.abs(
+                            np.nansum((1 - u_i ** 2) * (1 - 5 * u_i ** 2)))
+            is_outlier[i] = abs((values[i] - Xmean_bi) / s_bi) >= threshold
+
+    return(is_outlier)
+
+
+@pytest.mark.parametrize('var', ['evap', 'tmax'])
+def test_tmp_outlier_matches_naive(var):
+    from conftest import synthetic_station
+
+    input_ts = synthetic_station(years=4, start='1983-06-01')[var]
+    expected = naive_biweight_outliers(input_ts)
+    assert expected.any()
+
+    for chunk_elements in [2 ** 22, 1000]:
+        np.testing.assert_array_equal(
+                qct.tmp_outlier_test(
+                        input_ts, chunk_elements=chunk_elements).values,
+                expected)
+
+
+SWEPT_TESTS = {
+        'values': qct.range_test,
+        'spikes': qct.spikes_data_test,
+        'change_rate': qct.change_rate_test}
+
+
+@pytest.mark.parametrize('name', sorted(SWEPT_TESTS))
+@pytest.mark.parametrize('climatology', [False, True])
+@pytest.mark.parametrize('transform, robust', [
+        ('log', False), ('log1p', True), ('boxcox', False), ('rank', False)])
+def test_threshold_sweep(station, name, climatology, transform, robust):
+    thresholds = [3.0, 1.5, 2.0, 2.5]
+    sweep = qct.threshold_sweep(
+            station['evap'], thresholds, name, climatology,
+            transform=transform, robust=robust)
+    np.testing.assert_array_equal(sweep['threshold'], sorted(thresholds))
+    assert int(sweep['count'][0]) > 0
+
+    for threshold in thresholds:
+        expected = SWEPT_TESTS[name](
+                station['evap'], threshold, climatology,
+                transform=transform, robust=robust)
+        np.testing.assert_array_equal(
+                qct.sweep_flags(sweep, threshold), expected)
+        assert int(sweep['count'].sel(threshold=threshold)) == int(
+                expected.sum())
+
+
+@pytest.mark.parametrize('test', [
+        qct.range_test, qct.spikes_data_test, qct.change_rate_test])
+@pytest.mark.parametrize('climatology', [False, True])
+@pytest.mark.parametrize('transform', ['log', 'boxcox'])
+def test_dataset_matches_variables(station, test, climatology, transform):
+    flags = test(
+            station, 3.0, climatology=climatology, transform=transform)
+    stacked = test(
+            station.to_array(dim='variable'), 3.0, climatology=climatology,
+            transform=transform)
+
+    assert stacked.any()
+
+    for var in station.data_vars:
+        expected = test(
+                station[var], 3.0, climatology=climatology,
+                transform=transform)
+        np.testing.assert_array_equal(flags[var].values, expected.values)
+        np.testing.assert_array_equal(
+                stacked.sel(variable=var).values, expected.values)
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Tests of the spatial consistency of a station network."""
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+import xarray as xr
+
+from tsqc import spatial
+from conftest import synthetic_station
+from conftest import write_bdcn
+
+
+def haversine(latitude, longitude):
+    """(station x station) great-circle distances, in km."""
+    latitude = np.radians(latitude)
+    longitude = np.radians(longitude)
+    a = (np.sin((latitude[:, None] - latitude) / 2) ** 2 +
+         np.cos(latitude[:, None]) * np.cos(latitude) *
+         np.sin((longitude[:, None] - longitude) / 2) ** 2)
+    return(2 * spatial.EARTH_RADIUS * np.arcsin(np.sqrt(a)))
+
+
+@pytest.fixture
+def coordinates():
+    rng = np.random.RandomState(0)
+    return(OrderedDict([
+            ('latitude', rng.uniform(14, 32, 60)),
+            ('longitude', rng.uniform(-117, -86, 60)),
+            ('elevation', rng.uniform(0, 3000, 60))]))
+
+
+@pytest.mark.parametrize('kd_tree', [True, False])
+def test_nearest_neighbours(coordinates, kd_tree):
+    index = spatial.StationIndex(**coordinates)
+
+    if not kd_tree:
+        index.tree = None
+
+    distance, neighbours = index.query(k=4)
+    expected = haversine(coordinates['latitude'], coordinates['longitude'])
+    np.fill_diagonal(expected, np.inf)
+    np.testing.assert_array_equal(
+            neighbours, np.argsort(expected, axis=1)[:, :4])
+    np.testing.assert_allclose(
+            distance, np.sort(expected, axis=1)[:, :4], rtol=1e-6)
+
+    # Neighbours beyond the limits are missing.
+    distance, neighbours = index.query(
+            k=4, max_distance=300, max_elevation_difference=1000)
+    elevation = coordinates['elevation']
+    is_missing = (
+            (np.sort(expected, axis=1)[:, :4] > 300) |
+            (np.abs(elevation[np.argsort(expected, axis=1)[:, :4]] -
+                    elevation[:, None]) > 1000))
+    np.testing.assert_array_equal(neighbours == -1, is_missing)
+    assert np.isnan(distance[is_missing]).all()
+
+
+def test_small_network():
+    # Fewer stations than neighbours, two of them at the same place.
+    index = spatial.StationIndex([19.0, 19.0, 20.0], [-99.0, -99.0, -99.0])
+    distance, neighbours = index.query(k=4)
+    np.testing.assert_array_equal(neighbours[:, 2:], -1)
+    np.testing.assert_array_equal(
+            np.sort(neighbours[:, :2], axis=1), [[1, 2], [0, 2], [0, 1]])
+    assert distance[0, 0] == 0
+    assert np.isnan(distance[:, 2:]).all()
+
+
+def synthetic_network(coordinates, years=6, seed=0):
+    """(station x day) temperatures with a regional signal, which
+    weakens with the distance.
+    """
+    rng = np.random.RandomState(seed)
+    time = np.arange(
+            np.datetime64('1990-01-01'),
+            np.datetime64('1990-01-01') + np.timedelta64(365 * years, 'D'))
+    season = 5 * np.sin(np.arange(len(time)) / 365.25 * 2 * np.pi)
+    regions = rng.normal(0, 2, (3, len(time)))
+    weights = np.exp(-((coordinates['longitude'][:, None] - np.array(
+            [-110, -100, -90])) / 5) ** 2)
+    values = (
+            25 + season + weights.dot(regions) +
+            rng.normal(0, 0.5, (len(coordinates['latitude']), len(time))))
+    values[rng.rand(*values.shape) < 0.02] = np.nan
+    return(xr.DataArray(
+            values,
+            dims=['station', 'time'],
+            coords=OrderedDict(
+                    [('station', ['{:05d}'.format(i)
+                                  for i in range(len(values))]),
+                     ('time', time)] +
+                    [(i, ('station', j)) for i, j in coordinates.items()]),
+            name='tmax'))
+
+
+def test_buddy_check(coordinates):
+    network = synthetic_network(coordinates)
+    network[7, 500] += 8.0
+    network[30, 1200] -= 8.0
+    flags = spatial.buddy_check(network, k=5, max_distance=600)
+    assert flags[7, 500] and flags[30, 1200]
+    assert int(flags.sum()) <= 1e-4 * flags.size + 2
+
+    # Processed in blocks of stations, and with a given index.
+    np.testing.assert_array_equal(
+            spatial.buddy_check(
+                    network, spatial.StationIndex.from_network(network),
+                    k=5, max_distance=600, chunk_elements=50000).values,
+            flags.values)
+
+
+def test_read_network(tmp_path):
+    input_files = []
+
+    for i, start in enumerate(['1980-01-01', '1981-06-01']):
+        input_files.append(write_bdcn(
+                tmp_path / '{:05d}.csv'.format(i + 1),
+                synthetic_station(years=2, seed=i, start=start),
+                station=i + 1))
+
+    network = spatial.read_network(input_files, 'tmax')
+    assert list(network['station'].values) == ['00001', '00002']
+    assert network['time'].values[0] == np.datetime64('1980-01-01T08:00')
+    np.testing.assert_array_equal(
+            network.sel(station='00002', time='1981-06').values,
+            synthetic_station(years=2, seed=1, start='1981-06-01')[
+                    'tmax'].sel(time='1981-06').values)
+    assert network.sel(station='00002', time='1981-05').isnull().all()
+    assert float(network['latitude'][0]) == 19.33
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Tests of the lookup of the critical values of the tests."""
+import numpy as np
+import pytest
+
+from tsqc import statistical_tables as st
+
+TABLES = [
+        (st.von_neumann_ratio, st.VON_NEUMANN_N, st.VON_NEUMANN_ALPHA,
+         st.VON_NEUMANN_VALUES),
+        (st.snht, st.SNHT_N, st.SNHT_ALPHA, st.SNHT_VALUES),
+        (st.buishand_range, st.BUISHAND_N, st.BUISHAND_ALPHA,
+         st.BUISHAND_VALUES)]
+
+
+@pytest.mark.parametrize('function, table_n, table_alpha, table_values',
+                         TABLES)
+def test_tabulated_values(function, table_n, table_alpha, table_values):
+    for i, a in enumerate(table_alpha):
+        np.testing.assert_allclose(function(table_n, a), table_values[i])
+
+        # Linear between the sample sizes of the table.
+        middle = (table_n[:-1] + table_n[1:]) / 2.0
+        np.testing.assert_allclose(
+                function(middle, a),
+                (table_values[i, :-1] + table_values[i, 1:]) / 2.0)
+
+    # Linear in the logarithm of the significance level.
+    a = np.sqrt(table_alpha[0] * table_alpha[1])
+    np.testing.assert_allclose(
+            function(table_n, a), table_values[:2].mean(axis=0))
+
+    with pytest.raises(ValueError):
+        function(table_n, table_alpha[-1] * 1.5)
+
+
+@pytest.mark.parametrize('function, table_n, table_alpha, table_values',
+                         TABLES)
+def test_vectorized_lookup(function, table_n, table_alpha, table_values):
+    n = np.arange(1, 160)
+    a = np.geomspace(table_alpha[0], table_alpha[-1], 7)[:, np.newaxis]
+    values = function(n, a)
+    assert values.shape == (7, len(n))
+    assert np.isnan(values[:, n < table_n[0]]).all()
+    assert np.isfinite(values[:, (n >= table_n[0]) & (n <= 100)]).all()
+
+    for i, row in enumerate(values):
+        for j, size in enumerate(n):
+            np.testing.assert_allclose(
+                    function(size, a[i, 0]), row[j], equal_nan=True)
+
+
+def test_large_samples():
+    n = np.array([100, 101, 500, 5000])
+    a = 0.05
+    values = st.von_neumann_ratio(n, a)
+    variance = (
+            4 * (n - 2) * (5 * n ** 2 - 2 * n - 9) /
+            (5 * n * (n + 1) * (n - 1) ** 2))
+    np.testing.assert_allclose(
+            values[1:], 2 - 1.6448536 * np.sqrt(variance[1:]), rtol=1e-6)
+    assert abs(values[1] - values[0]) < 0.02
+
+    # Towards the limit of the Buishand range, without a jump at 100.
+    values = st.buishand_range(n, a)
+    assert np.all(np.diff(values) > 0) and values[-1] < 1.75
+    assert abs(values[1] - values[0]) < 0.01
+
+    # The SNHT is not tabulated for large samples.
+    assert np.isnan(st.snht(n[1:], a)).all()
+
+
+def test_pettitt():
+    n = np.array([10, 30, 100])
+
+    for a in [0.01, 0.05, 0.1]:
+        critical = st.pettitt(n, a)
+        np.testing.assert_allclose(
+                2 * np.exp(-6 * critical ** 2 / (n ** 3 + n ** 2)), a)
+
+    with pytest.raises(ValueError):
+        st.pettitt(n, 1.0)
+
+
+def test_normal_ppf():
+    p = np.array([0.0, 1e-10, 0.01, 0.025, 0.05, 0.5, 0.95, 0.975, 1.0])
+    np.testing.assert_allclose(
+            st.normal_ppf(p),
+            [-np.inf, -6.3613409, -2.3263479, -1.9599640, -1.6448536, 0.0,
+             1.6448536, 1.9599640, np.inf], atol=1e-6)
+    np.testing.assert_allclose(
+            st.normal_ppf(p[1:-1]), -st.normal_ppf(1 - p[1:-1]), atol=1e-8)
+    assert np.isnan(st.normal_ppf([-0.1, 1.1, np.nan])).all()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Tests of the level 1 tests of streaming observations."""
+import numpy as np
+import pytest
+import xarray as xr
+
+from tsqc import pipeline
+from tsqc import quality_control_tests as qct
+from tsqc.streaming import STREAMING_TESTS
+from tsqc.streaming import StreamingQC
+
+
+def streamed_flags(input_ts, config, history=2000):
+    """Flags of the observations that follow the history of a time
+    series, received one at a time.
+    """
+    streaming = StreamingQC.from_history(input_ts[:history], config)
+    emitted = streaming.push_many(
+            input_ts['time'].values[history:],
+            input_ts.values[history:])
+    emitted.extend(streaming.flush())
+    return(emitted)
+
+
+@pytest.mark.parametrize('value_tolerance', [0.0, 0.5])
+@pytest.mark.parametrize('repetitions_tolerance', [0, 2, 4])
+def test_flat_series_matches_batch(station, value_tolerance,
+                                   repetitions_tolerance):
+    tmax = station['tmax'].copy()
+    # A slow drift and a flat run.
+    tmax[3000:3030] = 20 + 0.1 * np.arange(30)
+    tmax[3100:3110] = 25.0
+    parameters = dict(
+            value_tolerance=value_tolerance,
+            repetitions_tolerance=repetitions_tolerance)
+    config = {
+            'level_1_tests': {'flat_series_test': True},
+            'level_1_parameters': parameters}
+    expected = qct.flat_series_test(tmax, **parameters).values[2000:]
+    emitted = streamed_flags(tmax, config)
+    np.testing.assert_array_equal(
+            [flags['flat_series_test'] for _, _, flags in emitted],
+            expected)
+    assert expected[3109 - 2000]
+
+
+@pytest.mark.parametrize('transform', ['log', 'log1p'])
+def test_streaming_matches_run_level1(station, transform):
+    config = {
+            'level_1_tests': dict((i, True) for i in STREAMING_TESTS),
+            'level_1_parameters': {'threshold': 3.0, 'transform': transform}}
+    moments = pipeline.series_moments(
+            station.isel(time=slice(0, 2000)), transform=transform)
+
+    # A gap breaks the windows of the observations, as the end of a
+    # record (e.g., that of the flat series test across the gap).
+    segments = [slice(0, 1500), slice(1510, None)]
+    station['tmax'][1498:1512] = 25.0
+    observations = xr.concat(
+            [station.isel(time=i) for i in segments], dim='time')
+
+    for var in station.data_vars:
+        streaming = StreamingQC(moments=moments[var], config=config)
+        emitted = streaming.push_many(
+                observations['time'].values, observations[var].values)
+        emitted.extend(streaming.flush())
+        np.testing.assert_array_equal(
+                [i[0] for i in emitted], observations['time'].values)
+        expected = xr.concat([
+                pipeline.run_level1(
+                        station[[var]].isel(time=i), config, moments=moments)
+                for i in segments], dim='time')
+
+        for test in STREAMING_TESTS:
+            np.testing.assert_array_equal(
+                    [flags[test] for _, _, flags in emitted],
+                    expected['_'.join([var, test])].values)
+
+
+@pytest.mark.parametrize('parameters', [
+        {'transform': 'boxcox'}, {'transform': 'rank'}, {'robust': True}])
+def test_streaming_needs_moments(station, parameters):
+    config = {
+            'level_1_tests': {'climatology_test': True},
+            'level_1_parameters': parameters}
+
+    with pytest.raises(ValueError):
+        StreamingQC.from_history(station['tmax'], config)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Tests of the telemetry of the tests and readers."""
+import csv
+
+import pytest
+
+from tsqc import pipeline
+from tsqc import telemetry
+
+CONFIG = {'level_1_tests': {
+        'gross_range_test': True,
+        'flat_series_test': True,
+        'tmp_outlier_test': True}}
+
+
+@pytest.fixture
+def records(station, monkeypatch):
+    monkeypatch.setitem(telemetry._state, 'enabled', True)
+    monkeypatch.setitem(telemetry._state, 'records', [])
+    telemetry.set_station('00003')
+
+    for _ in range(2):
+        pipeline.run_level1(station, CONFIG)
+
+    return(telemetry.collect())
+
+
+def test_nested_calls(records):
+    top_level = [i for i in records if i['depth'] == 0]
+    assert [i['function'] for i in top_level] == ['pipeline.run_level1'] * 2
+    assert 'quality_control_tests.flat_series_test' in [
+            i['function'] for i in records if i['depth'] == 1]
+
+    # The nested calls are not counted twice per station.
+    station, = telemetry.summary(records, 'station')
+    assert station['calls'] == 2
+    assert station['wall_seconds'] == pytest.approx(
+            sum(i['wall_seconds'] for i in top_level))
+    assert station['cpu_seconds'] == pytest.approx(
+            sum(i['cpu_seconds'] for i in top_level))
+    assert len(telemetry.summary(records, 'function')) > 1
+
+
+def test_csv_report(records, tmp_path):
+    telemetry.write_report(records, tmp_path / 'telemetry.csv')
+
+    with open(str(tmp_path / 'telemetry.csv'), newline='') as f:
+        rows = list(csv.DictReader(f))
+
+    assert len(rows) == len(records)
+    assert [i['function'] for i in rows] == [
+            i['function'] for i in records]
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Tests of the regular time axis of the station records."""
+import numpy as np
+import pytest
+
+from tsqc import quality_control_tests as qct
+from tsqc.time_axis import RegularTimeAxis
+from tsqc.time_axis import pad_time
+from tsqc.time_axis import unique_records
+
+DAY = np.timedelta64(1, 'D')
+
+
+def test_from_dates():
+    dates = np.datetime64('2000-01-01T08:00') + DAY * np.array([5, 2, 9, 2])
+    axis = RegularTimeAxis.from_dates(dates)
+    assert axis == RegularTimeAxis(dates[1], DAY, 8)
+    assert axis.end == dates[2]
+    np.testing.assert_array_equal(axis.values, dates[1] + DAY * np.arange(8))
+    np.testing.assert_array_equal(axis.positions(dates), [3, 0, 7, 0])
+    assert RegularTimeAxis.from_index(axis.values) == axis
+
+    with pytest.raises(ValueError):
+        RegularTimeAxis.from_dates([])
+
+    with pytest.raises(ValueError):
+        RegularTimeAxis.from_index(dates)
+
+
+@pytest.mark.parametrize('duplicates', ['first', 'drop'])
+def test_place(duplicates):
+    start = np.datetime64('2000-01-01')
+    dates = start + DAY * np.array([4, 0, 2, 4, 1])
+    values = np.array([[1.0, 10.0], [2.0, 20.0], [3.0, 30.0],
+                       [4.0, 40.0], [5.0, 50.0]])
+    axis = RegularTimeAxis.from_dates(dates)
+    placed = axis.place(dates, values, duplicates)
+
+    # The records of every date, one at a time.
+    expected = np.full((5, 2), np.nan)
+
+    for position in range(5):
+        is_date = dates == start + DAY * position
+
+        if is_date.sum() == 1 or (is_date.any() and duplicates == 'first'):
+            expected[position] = values[is_date][0]
+
+    np.testing.assert_array_equal(placed, expected)
+    np.testing.assert_array_equal(
+            dates[unique_records(dates, duplicates)],
+            np.unique(dates) if duplicates == 'first'
+            else start + DAY * np.array([0, 1, 2]))
+
+    dataset = axis.to_dataset({'a': placed[:, 0], 'b': placed[:, 1]})
+    np.testing.assert_array_equal(dataset['time'].values, axis.values)
+
+    with pytest.raises(ValueError):
+        unique_records(dates, 'last')
+
+
+def test_pad_time(station):
+    values = np.arange(6.0).reshape(2, 3)
+    padded = pad_time(values, before=1, after=2)
+    assert padded.shape == (2, 6)
+    np.testing.assert_array_equal(padded[:, 1:4], values)
+    assert np.isnan(padded[:, [0, 4, 5]]).all()
+
+    # The change rates are padded by position, not by label (zero
+    # changes are masked).
+    change_rate = qct.change_rate_series(station['tmax'])
+    expected = np.abs(np.diff(station['tmax'].values))
+    expected[expected == 0] = np.nan
+    np.testing.assert_array_equal(
+            change_rate['time'].values, station['time'].values)
+    assert np.isnan(change_rate.values[0])
+    np.testing.assert_array_equal(change_rate.values[1:], expected)
@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""Quality control routines. Metadata index of an archive of stations.
+
+Every station file of the archive (BDCN or BANDAS) is read once, and
+the period, number of available values per month, missing data ratio
+and effective record length of each of its variables are stored in a
+SQLite file. The screening tests (missing data ratio and minimum
+record length) then run as queries against the index, without loading
+the records again. Files that did not change since they were indexed
+are skipped when the index is updated.
+
+Usage
+-----
+    python -m tsqc.archive_index config.toml
+
+Author
+------
+    Roberto A. Real-Rangel (Institute of Engineering UNAM; Mexico)
+
+License
+-------
+    GNU General Public License
+"""
+from collections import OrderedDict
+import argparse
+import sqlite3
+
+from pathlib2 import Path
+import numpy as np
+import toml
+
+from . import data_manager as dmgr
+from . import quality_control_tests as qct
+from .batch import READERS
+from .batch import batch_parameters
+
+INDEX_SCHEMA = [
+        '''CREATE TABLE IF NOT EXISTS files (
+                file TEXT PRIMARY KEY,
+                station TEXT,
+                mtime REAL,
+                size INTEGER)''',
+        '''CREATE TABLE IF NOT EXISTS series (
+                station TEXT,
+                variable TEXT,
+                start TEXT,
+                end TEXT,
+                length INTEGER,
+                available INTEGER,
+                missing_ratio REAL,
+                record_years REAL,
+                PRIMARY KEY (station, variable))''',
+        '''CREATE TABLE IF NOT EXISTS monthly_counts (
+                station TEXT,
+                variable TEXT,
+                year INTEGER,
+                month INTEGER,
+                available INTEGER,
+                PRIMARY KEY (station, variable, year, month))''',
+        '''CREATE INDEX IF NOT EXISTS series_variable
+                ON series (variable)''']
+
+
+def index_path(settings):
+    """Path of the index file, taken from the [index] section of the
+    configuration (file) or, by default, archive_index.sqlite in the
+    output directory.
+    """
+    index_file = settings.get('index', {}).get('file')
+
+    if index_file:
+        return(Path(index_file))
+
+    return(Path(settings['general']['output_dir']) / 'archive_index.sqlite')
+
+
+def connect(index_file):
+    """Opens (and creates, if needed) an index file."""
+    connection = sqlite3.connect(str(index_file))
+
+    for statement in INDEX_SCHEMA:
+        connection.execute(statement)
+
+    return(connection)
+
+
+def series_summary(input_ts):
+    """ Metadata of a time series stored in the index.
+
+    Parameters
+    ----------
+        input_ts: xarray.DataArray
+            Time series of streamflow (or other variable).
+
+    Returns
+    -------
+        summary: collections.OrderedDict
+            Period ('start' and 'end'), number of time steps ('length')
+            and available values ('available'), missing data ratio (as
+            in quality_control_tests.missd_ratio_test) and effective
+            record length, in years (see
+            quality_control_tests.record_length).
+        monthly_counts: list
+            Year, month and number of available values of every month
+            with records.
+    """
+    times = input_ts['time'].values
+    is_available = ~np.isnan(input_ts.values.astype('float'))
+    available = int(is_available.sum())
+    months = times[is_available].astype('datetime64[M]').astype('int')
+    counts = np.bincount(months - months.min()) if available else []
+    summary = OrderedDict([
+            ('start', str(times[0])),
+            ('end', str(times[-1])),
+            ('length', len(times)),
+            ('available', available),
+            ('missing_ratio', 1 - float(available) / len(times)),
+            ('record_years', float(
+                    available * qct.time_step_years(times)))])
+    monthly_counts = [
+            (int(1970 + (months.min() + i) // 12),
+             int((months.min() + i) % 12 + 1), int(count))
+            for i, count in enumerate(counts) if count]
+    return(summary, monthly_counts)
+
+
+def index_dataset(connection, dataset, station):
+    """Stores the metadata of every variable of a station dataset,
+    replacing its previous records.
+    """
+    connection.execute('DELETE FROM series WHERE station = ?', (station, ))
+    connection.execute(
+            'DELETE FROM monthly_counts WHERE station = ?', (station, ))
+
+    for var in dataset.data_vars:
+        summary, monthly_counts = series_summary(dataset[var])
+        connection.execute(
+                'INSERT INTO series VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [station, var] + list(summary.values()))
+        connection.executemany(
+                'INSERT INTO monthly_counts VALUES (?, ?, ?, ?, ?)',
+                [(station, var) + i for i in monthly_counts])
+
+
+def build_index(input_files, index_file, reader='bdcn'):
+    """ Scans the station files of an archive and stores the metadata of
+    their variables in the index. The files already indexed with the
+    same modification time and size are skipped.
+
+    Parameters
+    ----------
+        input_files: list
+            The full paths of the station files.
+        index_file: string
+            The full path of the index (SQLite) file.
+        reader: string (default is 'bdcn')
+            Reader of the files (see batch.READERS).
+
+    Returns
+    -------
+        collections.OrderedDict
+            Status of every file: 'indexed', 'skipped' or the error
+            raised when reading it.
+    """
+    connection = connect(index_file)
+    status = OrderedDict()
+
+    try:
+        for input_file in input_files:
+            input_file = Path(input_file)
+            stat = input_file.stat()
+            indexed = connection.execute(
+                    'SELECT mtime, size FROM files WHERE file = ?',
+                    (str(input_file), )).fetchone()
+
+            if indexed == (stat.st_mtime, stat.st_size):
+                status[str(input_file)] = 'skipped'
+                continue
+
+            try:
+                dataset = READERS[reader](input_file)
+
+            except Exception as error:
+                status[str(input_file)] = 'failed: {}'.format(error)
+                continue
+
+            index_dataset(connection, dataset, input_file.stem)
+            connection.execute(
+                    'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                    (str(input_file), input_file.stem, stat.st_mtime,
+                     stat.st_size))
+            connection.commit()
+            status[str(input_file)] = 'indexed'
+
+    finally:
+        connection.close()
+
+    return(status)
+
+
+def query_series(index_file, condition='1', parameters=(), variable=None):
+    """Runs a test (an SQL expression over the columns of the series
+    table) for every series of the index.
+
+    Returns
+    -------
+        collections.OrderedDict
+            Result of the test for every (station, variable).
+    """
+    query = 'SELECT station, variable, {} FROM series'.format(condition)
+
+    if variable is not None:
+        query += ' WHERE variable = ?'
+        parameters = tuple(parameters) + (variable, )
+
+    connection = connect(index_file)
+
+    try:
+        rows = connection.execute(
+                query + ' ORDER BY station, variable', parameters).fetchall()
+
+    finally:
+        connection.close()
+
+    return(OrderedDict([((i[0], i[1]), bool(i[2])) for i in rows]))
+
+
+def missd_ratio_test(index_file, threshold=0.1, variable=None):
+    """ quality_control_tests.missd_ratio_test over every series of the
+    index (or of a variable): True if the missing data ratio is above
+    the threshold.
+    """
+    return(query_series(
+            index_file, 'missing_ratio > ?', (threshold, ), variable))
+
+
+def minimlength_test(index_file, threshold=10, variable=None):
+    """ quality_control_tests.minimlength_test over every series of the
+    index (or of a variable): True if the effective record length is
+    above the threshold (in years).
+    """
+    return(query_series(
+            index_file, 'record_years > ?', (threshold, ), variable))
+
+
+def screen_series(index_file, missing_threshold=0.1, length_threshold=10,
+                  variable=None):
+    """ Series worth a full quality control: those that pass the missing
+    data ratio test and the minimum record length test.
+
+    Returns
+    -------
+        list
+            (station, variable) of the series that pass both tests.
+    """
+    selected = query_series(
+            index_file,
+            'missing_ratio <= ? AND record_years > ?',
+            (missing_threshold, length_threshold),
+            variable)
+    return([i for i, passed in selected.items() if passed])
+
+
+def monthly_counts(index_file, station, variable):
+    """ Number of available values of every month of a series.
+
+    Returns
+    -------
+        numpy.ndarray
+            Structured array with the year, month and number of
+            available values of every month with records.
+    """
+    connection = connect(index_file)
+
+    try:
+        rows = connection.execute(
+                'SELECT year, month, available FROM monthly_counts '
+                'WHERE station = ? AND variable = ? ORDER BY year, month',
+                (station, variable)).fetchall()
+
+    finally:
+        connection.close()
+
+    return(np.array(rows, dtype=[
+            ('year', 'int'), ('month', 'int'), ('available', 'int')]))
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(
+            description='Builds (or updates) the metadata index of all '
+                        'the stations of a directory.')
+    parser.add_argument('config', help='Configuration file (config.toml).')
+    args = parser.parse_args(argv)
+    settings = toml.load(args.config)
+    parameters = batch_parameters(settings)
+    status = build_index(
+            input_files=dmgr.list_files(
+                    parent_dir=settings['general']['input_dir'],
+                    ext=parameters['extension']),
+            index_file=index_path(settings),
+            reader=parameters['reader'])
+    results = [i.split(':')[0] for i in status.values()]
+    print("{} files indexed, {} skipped, {} failed.".format(
+            results.count('indexed'), results.count('skipped'),
+            results.count('failed')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""Quality control routines. Batch processing of stations.
+
+Usage
+-----
+    python -m tsqc.batch config.toml [--workers N] [--chunksize N]
+                                     [--no-resume] [--profile FILE]
+
+Author
+------
+    Roberto A. Real-Rangel (Institute of Engineering UNAM; Mexico)
+
+License
+-------
+    GNU General Public License
+"""
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import argparse
+import cProfile
+import csv
+import time
+import traceback
+
+from pathlib2 import Path
+import toml
+import xarray as xr
+
+from . import data_manager as dmgr
+from . import telemetry
+from .climatology import cached_moments
+from .flags import output_encoding
+from .flags import output_parameters
+from .flags import pack_flags
+from .incremental import run_incremental
+from .incremental import write_dataset
+from .parse_cache import read_station
+from .pipeline import SETTINGS_ATTR
+from .pipeline import run_level1
+from .pipeline import settings_hash
+
+READERS = dmgr.READERS
+
+DEFAULT_BATCH = OrderedDict([
+        ('reader', 'bdcn'),
+        ('extension', '.csv'),
+        ('workers', 0),
+        ('chunksize', 1),
+        ('resume', True),
+        ('incremental', False),
+        ('report', '')])
+
+REPORT_FIELDS = [
+        'station', 'status', 'read_seconds', 'qc_seconds', 'write_seconds',
+        'seconds']
+
+
+def batch_parameters(settings):
+    """Parameters of the batch run, taken from the [batch] section of
+    the configuration (if any) and completed with DEFAULT_BATCH.
+    """
+    parameters = DEFAULT_BATCH.copy()
+    parameters.update(settings.get('batch', {}))
+    return(parameters)
+
+
+def output_path(input_file, output_dir):
+    """Path of the output NetCDF file of a station."""
+    return(Path(output_dir) / (Path(input_file).stem + '.nc'))
+
+
+def is_up_to_date(input_file, output_file, settings):
+    """Test if the output file of a station exists, is newer than its
+    input file and was written with the same settings (see
+    pipeline.settings_hash).
+    """
+    output_file = Path(output_file)
+
+    if not (output_file.exists() and (
+            output_file.stat().st_mtime >=
+            Path(input_file).stat().st_mtime)):
+        return(False)
+
+    try:
+        with xr.open_dataset(str(output_file)) as output:
+            return(output.attrs.get(SETTINGS_ATTR) == settings_hash(
+                    settings))
+
+    except (IOError, OSError, ValueError):
+        return(False)
+
+
+def process_station(input_file, settings):
+    """Reads the records of a station, performs the level 1 tests and
+    writes the results to its output NetCDF file. The output is first
+    written to a temporary file, so an interrupted run never leaves an
+    output that looks up to date. The records are taken from the parse
+    cache, if it is configured (see parse_cache.read_station). In
+    incremental mode, only the rows appended since the previous run are
+    tested (see incremental.run_incremental). Otherwise, the monthly
+    statistics are taken from the climatology cache, if it is configured
+    (see climatology.cached_moments).
+
+    Parameters
+    ----------
+        input_file: string
+            The full path of the input file of the station.
+        settings: dict
+            Settings loaded from the configuration file (config.toml).
+
+    Returns
+    -------
+        collections.OrderedDict
+            Station, status and timing (in seconds) of every stage, and
+            the telemetry records of the calls ('calls'; empty unless
+            the telemetry is enabled).
+    """
+    parameters = batch_parameters(settings)
+    output_file = output_path(input_file, settings['general']['output_dir'])
+    record = OrderedDict([(i, float('nan')) for i in REPORT_FIELDS])
+    record['station'] = Path(input_file).stem
+    record['status'] = 'done'
+    telemetry.configure(settings)
+    telemetry.set_station(record['station'])
+    start = time.time()
+
+    try:
+        X = read_station(input_file, parameters['reader'], settings)
+        record['read_seconds'] = time.time() - start
+        partial = time.time()
+
+        if parameters['incremental']:
+            # Tests only the new rows and writes the output itself.
+            run_incremental(
+                    dataset=X, output_file=output_file, config=settings)
+            record['qc_seconds'] = time.time() - partial
+
+        else:
+            X = X.merge(run_level1(
+                    dataset=X,
+                    config=settings,
+                    moments=cached_moments(
+                            X, settings, input_file, parameters['reader'])))
+
+            if output_parameters(settings)['packed_flags']:
+                X = pack_flags(X)
+
+            X.attrs[SETTINGS_ATTR] = settings_hash(settings)
+            record['qc_seconds'] = time.time() - partial
+            partial = time.time()
+            write_dataset(X, output_file, output_encoding(X, settings))
+            record['write_seconds'] = time.time() - partial
+
+    except Exception:
+        record['status'] = (
+                'failed: ' + traceback.format_exc().splitlines()[-1])
+
+    record['seconds'] = time.time() - start
+    record['calls'] = telemetry.collect()
+    return(record)
+
+
+def run_batch(settings, workers=None, chunksize=None, resume=None):
+    """Performs the quality control of all the stations in the input
+    directory, distributing them across a pool of processes. Every
+    worker writes the output of its stations.
+
+    Parameters
+    ----------
+        settings: dict
+            Settings loaded from the configuration file (config.toml).
+            It uses the [general] section (input_dir and output_dir),
+            the [level_1_tests] and [level_1_parameters] sections (see
+            pipeline.run_level1) and the [batch] section.
+        workers: integer (optional)
+            Number of processes. Zero uses all the CPUs. It overrides
+            the value of the configuration.
+        chunksize: integer (optional)
+            Number of stations sent to a process at once. It overrides
+            the value of the configuration.
+        resume: boolean (optional)
+            Skip the stations whose output is up to date (see
+            is_up_to_date). It overrides the value of the
+            configuration.
+
+    Returns
+    -------
+        list
+            Records of every station (see process_station).
+    """
+    parameters = batch_parameters(settings)
+    workers = parameters['workers'] if workers is None else workers
+    chunksize = parameters['chunksize'] if chunksize is None else chunksize
+    resume = parameters['resume'] if resume is None else resume
+    output_dir = Path(settings['general']['output_dir'])
+    output_dir.mkdir(parents=True, exist_ok=True)
+    input_list = dmgr.list_files(
+            parent_dir=settings['general']['input_dir'],
+            ext=parameters['extension'])
+    records = []
+    calls = []
+    pending = []
+
+    for input_file in input_list:
+        if resume and is_up_to_date(
+                input_file, output_path(input_file, output_dir), settings):
+            records.append(OrderedDict([
+                    ('station', input_file.stem),
+                    ('status', 'skipped')]))
+
+        else:
+            pending.append(input_file)
+
+    with ProcessPoolExecutor(max_workers=workers or None) as executor:
+        for record in executor.map(
+                process_station, pending, repeat(settings),
+                chunksize=chunksize):
+            print("{station}: {status} ({seconds:.2f} s)".format(**record))
+            calls.extend(record.pop('calls'))
+            records.append(record)
+
+    if parameters['report']:
+        write_report(records, output_dir / parameters['report'])
+
+    telemetry_settings = telemetry.telemetry_parameters(settings)
+
+    if telemetry_settings['enabled'] and telemetry_settings['report']:
+        telemetry.write_report(
+                calls, output_dir / telemetry_settings['report'])
+
+    return(records)
+
+
+def profile_station(input_file, settings):
+    """Processes a single station in this process under cProfile (see
+    process_station), so it can also be sampled with an external
+    profiler (e.g., py-spy). The statistics are saved to a .prof file
+    in the output directory, named as the station.
+
+    Returns
+    -------
+        pathlib2.Path
+            The path of the statistics file (see pstats).
+    """
+    output_dir = Path(settings['general']['output_dir'])
+    output_dir.mkdir(parents=True, exist_ok=True)
+    profile_file = output_dir / (Path(input_file).stem + '.prof')
+    profiler = cProfile.Profile()
+    record = profiler.runcall(process_station, input_file, settings)
+    profiler.dump_stats(str(profile_file))
+    print("{station}: {status} ({seconds:.2f} s)".format(**record))
+    return(profile_file)
+
+
+def write_report(records, output_file):
+    """Writes the records of a batch run to a CSV file."""
+    with open(str(output_file), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, restval='')
+        writer.writeheader()
+        writer.writerows(records)
+
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(
+            description='Quality control of all the stations of a '
+                        'directory.')
+    parser.add_argument('config', help='Configuration file (config.toml).')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of processes (0 uses all the CPUs).')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='Number of stations sent to a process at '
+                             'once.')
+    parser.add_argument('--no-resume', dest='resume', action='store_false',
+                        default=None,
+                        help='Process again the stations whose output is '
+                             'up to date.')
+    parser.add_argument('--profile', default=None, metavar='STATION_FILE',
+                        help='Process only this station, under cProfile.')
+    args = parser.parse_args(argv)
+    settings = toml.load(args.config)
+
+    if args.profile:
+        print("Profile saved to {}".format(profile_station(
+                args.profile, settings)))
+        return
+
+    records = run_batch(
+            settings=settings,
+            workers=args.workers,
+            chunksize=args.chunksize,
+            resume=args.resume)
+    status = [i['status'].split(':')[0] for i in records]
+    print("{} stations processed, {} skipped, {} failed.".format(
+            status.count('done'), status.count('skipped'),
+            status.count('failed')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""Quality control routines. Cached climatology of the z-score tests.
+
+The monthly statistics of the scored series of a time series (see
+pipeline.scored_series) are computed once and saved to a compact .npz
+sidecar, named after a key of the time series. A later run over the
+same records loads them from an on-disk cache (with
+least-recently-used eviction once the cache exceeds its size), so only
+the comparison with the threshold is redone. The key of a variable read
+from a station file is taken from the path, modification time and size
+of the file (see source_key), so it costs nothing to compute; other
+time series are keyed by a hash of their contents (see content_hash).
+
+Author
+------
+    Roberto A. Real-Rangel (Institute of Engineering UNAM; Mexico)
+
+License
+-------
+    GNU General Public License
+"""
+from collections import OrderedDict
+import hashlib
+import os
+
+from pathlib2 import Path
+import numpy as np
+import xarray as xr
+
+from . import quality_control_tests as qct
+from .parse_cache import file_key
+from .pipeline import level1_parameters
+from .pipeline import moment_scoring
+from .pipeline import scored_series
+
+# Changing how the statistics are computed invalidates the cache.
+CLIMATOLOGY_VERSION = '3'
+SCORED_SERIES = ['values', 'spikes', 'change_rate']
+MOMENTS = ['count', 'sum', 'sumsq']
+DEFAULT_CACHE_SIZE = 2 ** 28
+
+
+def content_hash(input_ts, transform='log'):
+    """Hash (SHA-1) of the times and values of a time series, and of
+    the transform of its scored series.
+
+    Parameters
+    ----------
+        input_ts: xarray.DataArray
+            Time series of streamflow (or other variable).
+        transform: string (default is 'log')
+            Transform of the scored series (see
+            pipeline.scored_series).
+    """
+    digest = hashlib.sha1(
+            '|'.join([CLIMATOLOGY_VERSION, transform]).encode())
+    digest.update(input_ts['time'].values.astype('datetime64[m]').tobytes())
+    digest.update(np.ascontiguousarray(
+            input_ts.values, dtype='float').tobytes())
+    return(digest.hexdigest())
+
+
+def source_key(input_file, reader, var, transform='log'):
+    """Hash (SHA-1) of the path and key of a station file (see
+    parse_cache.file_key), the name of one of its variables and the
+    transform of its scored series.
+
+    Parameters
+    ----------
+        input_file: string
+            The full path of the station file.
+        reader: string
+            Reader of the file (see data_manager.READERS).
+        var: string
+            Name of the variable.
+        transform: string (default is 'log')
+            Transform of the scored series (see
+            pipeline.scored_series).
+    """
+    return(hashlib.sha1('|'.join([
+            CLIMATOLOGY_VERSION, str(Path(input_file).resolve()),
+            file_key(input_file, reader), var,
+            transform]).encode()).hexdigest())
+
+
+class Climatology(object):
+    """ Monthly count, sum and sum of squares of the scored series
+    ('values', 'spikes' and 'change_rate') of a time series. The
+    z-score tests of quality_control_tests accept it as their
+    reference, instead of computing the statistics from their input.
+
+    Parameters
+    ----------
+        moments: dict
+            For every scored series, its monthly moments (see
+            quality_control_tests.group_moments). It can be passed as
+            the moments of a variable to pipeline.run_level1.
+        key: string (optional)
+            Key of the time series (see source_key and content_hash).
+    """
+    def __init__(self, moments, key=None):
+        self.moments = moments
+        self.key = key
+
+    @classmethod
+    def from_series(cls, input_ts, key=None, transform='log'):
+        """Computes the climatology of a time series (xarray.DataArray),
+        with its series scored by transform ('log' or 'log1p'), keyed by
+        key or, by default, by its content hash.
+        """
+        months = qct.month_index(input_ts)
+        moments = OrderedDict([
+                (name, qct.group_moments(series, months))
+                for name, series in scored_series(
+                        input_ts.values.astype('float'), transform).items()])
+        return(cls(
+                moments=moments,
+                key=content_hash(input_ts, transform) if key is None
+                else key))
+
+    @classmethod
+    def load(cls, input_file):
+        """Loads a climatology saved with save."""
+        with np.load(str(input_file)) as stored:
+            moments = OrderedDict([
+                    (name, tuple(
+                            stored['_'.join([name, i])] for i in MOMENTS))
+                    for name in SCORED_SERIES])
+            return(cls(moments=moments, key=str(stored['key'])))
+
+    def save(self, output_file):
+        """Saves the climatology to a .npz file."""
+        arrays = OrderedDict([('key', np.array(self.key or ''))])
+
+        for name in SCORED_SERIES:
+            for moment, value in zip(MOMENTS, self.moments[name]):
+                arrays['_'.join([name, moment])] = value
+
+        np.savez(str(output_file), **arrays)
+
+    def stats(self, name, climatology=True):
+        """Mean and standard deviation of a scored series, of every
+        month (climatology) or of the whole record.
+        """
+        moments = self.moments[name]
+
+        if not climatology:
+            moments = [i.sum() for i in moments]
+
+        return(qct.moments_stats(*moments))
+
+    def zscores(self, input_ts, name, climatology=True):
+        """Standardizes a (log-transformed) scored series with the
+        statistics of the climatology.
+
+        Parameters
+        ----------
+            input_ts: xarray.DataArray
+                Scored series (e.g., normal(input_ts) for 'values'),
+                with the transform of the climatology.
+            name: string
+                'values', 'spikes' or 'change_rate'.
+            climatology: boolean
+                Flag to specify wether to use the statistics of every
+                month or of the whole record.
+        """
+        mean, std = self.stats(name, climatology)
+
+        if climatology:
+            months = qct.month_index(input_ts)
+            mean = xr.DataArray(mean[months], dims=['time'])
+            std = xr.DataArray(std[months], dims=['time'])
+
+        return((input_ts - mean) / std)
+
+
+class ClimatologyCache(object):
+    """ Directory of climatologies (.npz files named after their key),
+    with least-recently-used eviction once the size of the files
+    exceeds max_size. The cache can be shared by several processes
+    (e.g., the workers of batch.run_batch): a file removed by another
+    process while it is used is treated as not cached.
+
+    Parameters
+    ----------
+        directory: string
+            The full path of the cache directory. It is created if it
+            does not exist.
+        max_size: integer (default is 256 MiB)
+            Maximum size of the cache, in bytes.
+    """
+    def __init__(self, directory, max_size=DEFAULT_CACHE_SIZE):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+
+    def path(self, key):
+        """Path of the file of a climatology."""
+        return(self.directory / (key + '.npz'))
+
+    def get(self, key):
+        """Loads a climatology, or returns None if it is not cached."""
+        cached = self.path(key)
+
+        try:
+            climatology = Climatology.load(cached)
+
+        except (IOError, OSError, ValueError, KeyError):
+            return(None)
+
+        # The modification time records the last use.
+        try:
+            os.utime(str(cached), None)
+
+        except OSError:
+            pass
+
+        return(climatology)
+
+    def put(self, climatology):
+        """Saves a climatology and evicts the least recently used ones
+        if the cache exceeds its size.
+        """
+        cached = self.path(climatology.key)
+
+        # Every process writes to its own temporary file.
+        temporary_file = '{}.{}.part.npz'.format(
+                self.directory / climatology.key, os.getpid())
+        climatology.save(temporary_file)
+        os.replace(temporary_file, str(cached))
+        self.evict(keep=cached)
+
+    def evict(self, keep=None):
+        """Removes the least recently used climatologies until the size
+        of the cache is below max_size.
+        """
+        files = []
+
+        for i in self.directory.glob('*.npz'):
+            if i.name.endswith('.part.npz'):
+                continue
+
+            # Files removed by another process.
+            try:
+                stat = i.stat()
+
+            except OSError:
+                continue
+
+            files.append((stat.st_mtime, stat.st_size, i))
+
+        files.sort(key=lambda x: x[0])
+        size = sum(i[1] for i in files)
+
+        for _, file_size, cached in files:
+            if size <= self.max_size:
+                break
+
+            if cached != keep:
+                try:
+                    cached.unlink()
+
+                except OSError:
+                    pass
+
+                size -= file_size
+
+    def climatology(self, input_ts, key=None, transform='log'):
+        """Climatology of a time series, loaded from the cache or
+        computed (and cached) if it is not there. The key of the time
+        series (see source_key) defaults to its content hash.
+        """
+        if key is None:
+            key = content_hash(input_ts, transform)
+
+        climatology = self.get(key)
+
+        if climatology is None:
+            climatology = Climatology.from_series(
+                    input_ts, key=key, transform=transform)
+            self.put(climatology)
+
+        return(climatology)
+
+
+def cached_moments(dataset, config, input_file=None, reader=None):
+    """Moments of every variable of a station dataset, as expected by
+    pipeline.run_level1, taken from the cache set in the [climatology]
+    section of the configuration (cache_dir and, optionally,
+    cache_size). Returns None if the cache is not configured or the
+    z-score tests do not standardize with moments (see
+    pipeline.moment_scoring).
+
+    Parameters
+    ----------
+        dataset: xarray.Dataset
+            Dataset of the station.
+        config: dict
+            Settings loaded from the configuration file (config.toml).
+        input_file: string (optional)
+            The full path of the file the dataset was read from, with
+            reader. If given, the climatologies are keyed by the file
+            (see source_key) instead of by the contents of the dataset.
+        reader: string (optional)
+            Reader of input_file (see data_manager.READERS).
+    """
+    parameters = config.get('climatology', {})
+    scoring = level1_parameters(config)
+    transform = scoring['transform']
+
+    if not parameters.get('cache_dir') or not moment_scoring(scoring):
+        return(None)
+
+    cache = ClimatologyCache(
+            directory=parameters['cache_dir'],
+            max_size=parameters.get('cache_size', DEFAULT_CACHE_SIZE))
+    return(OrderedDict([
+            (var, cache.climatology(
+                    dataset[var],
+                    key=None if input_file is None
+                    else source_key(input_file, reader, var, transform),
+                    transform=transform).moments)
+            for var in dataset.data_vars]))
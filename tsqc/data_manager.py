@@ -9,15 +9,21 @@ License
     GNU General Public License
 """
 from collections import OrderedDict
-from pyodbc import connect
+import csv
 import datetime as dt
 import io
 import numpy as np
+import sqlite3
+import subprocess
 import sys
 
 from pathlib2 import Path
 import xarray as xr
 
+from .telemetry import instrument
+from .time_axis import RegularTimeAxis
+from .time_axis import unique_records
+
 
 def load_dir(directory):
     """
@@ -53,6 +59,32 @@ def list_files(parent_dir, ext):
     return(sorted(list(Path(parent_dir).glob(pattern='**/*' + ext))))
 
 
+def open_cube(input_file, station_dim='station', station_chunk=1):
+    """Opens lazily a multi-station cube (NetCDF or Zarr), chunked
+    along the station dimension only. The tests of
+    quality_control_tests build a dask graph over it, which is computed
+    chunk by chunk when the results are written (e.g., with
+    xarray.Dataset.to_netcdf or xarray.Dataset.to_zarr).
+
+    Parameters
+    ----------
+        input_file: string
+            The full path of the cube. Zarr stores are recognized by
+            their '.zarr' suffix.
+        station_dim: string (default is 'station')
+            Name of the station dimension.
+        station_chunk: integer (default is 1)
+            Number of stations of every chunk. The 'time' dimension is
+            never chunked, since the tests need whole time series.
+    """
+    chunks = {station_dim: station_chunk, 'time': -1}
+
+    if Path(input_file).suffix == '.zarr':
+        return(xr.open_zarr(str(input_file), chunks=chunks))
+
+    return(xr.open_dataset(str(input_file), chunks=chunks))
+
+
 def slice_time_series(data, month):
     """Performs a slice from a dataset for a given month in the 'time'
         dimension.
@@ -74,6 +106,160 @@ def slice_time_series(data, month):
     return(data.isel(time=np.where(data.time.dt.month == month)[0]))
 
 
+def build_dates(year, month, day, add_time=np.timedelta64(0, 'm')):
+    """Build an array of numpy.datetime64 values (with a resolution of
+    minutes) from arrays of years, months and days, without parsing the
+    dates one by one.
+
+    Parameters
+    ----------
+        year, month, day: numpy.ndarray
+            Components of the dates.
+        add_time: numpy.timedelta64 (default is 0 minutes)
+            Time of the day added to every date.
+    """
+    year, month, day = [
+            np.asarray(i).astype('int') for i in (year, month, day)]
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    dates = months.astype('datetime64[D]') + (day - 1)
+
+    if ((dates.astype('datetime64[M]') != months) | (day < 1) |
+            (month < 1) | (month > 12)).any():
+        raise ValueError("Invalid dates in the records.")
+
+    return(dates.astype('datetime64[m]') + add_time)
+
+
+def field_bounds(rule):
+    """Start and end columns of the fields of a fixed-width table, from
+    the rule under its header (e.g., b'---------- ------ ------').
+    """
+    is_dash = np.frombuffer(rule, dtype='uint8') == ord('-')
+    edges = np.flatnonzero(np.diff(np.r_[0, is_dash.astype('int8'), 0]))
+    return(edges.reshape(-1, 2))
+
+
+def parse_fixed_width(chars, null=b'Nulo'):
+    """ Parses fixed-width decimal numbers (e.g., b'  -1.5') from their
+    characters, without converting them to strings one by one.
+
+    Parameters
+    ----------
+        chars: numpy.ndarray
+            Array of uint8 with the characters of the fields along its
+            last dimension.
+        null: bytes (default is b'Nulo')
+            Text of the missing values, which are converted to NaN.
+
+    Returns
+    -------
+        numpy.ndarray or None
+            The numbers (with the shape of chars without its last
+            dimension), or None if any field is not a decimal number
+            nor a missing value.
+    """
+    chars = np.ascontiguousarray(np.moveaxis(chars, -1, 0))
+    width = chars.shape[0]
+    is_null = np.zeros(chars.shape[1:], dtype='bool')
+
+    if len(null) <= width:
+        is_null = np.all([
+                chars[column] == character for column, character
+                in enumerate(bytearray(null.rjust(width)))], axis=0)
+
+    digits = chars - np.uint8(ord('0'))
+    is_digit = digits <= 9
+    is_point = chars == ord('.')
+    is_minus = chars == ord('-')
+
+    is_number = (
+            (is_digit | is_point | is_minus | (chars == ord(' '))).all(
+                    axis=0) &
+            is_digit.any(axis=0) & (is_point.sum(axis=0) <= 1) &
+            (is_minus.sum(axis=0) <= 1))
+
+    if not (is_number | is_null).all():
+        return(None)
+
+    # The digits make an integer that is divided by the power of ten of
+    # its decimals, so the result is rounded as in float('-1.5').
+    mantissa = np.zeros(
+            chars.shape[1:], dtype='int32' if width < 10 else 'int64')
+    decimals = np.zeros(chars.shape[1:], dtype='int8')
+    is_decimal = np.zeros(chars.shape[1:], dtype='bool')
+
+    for column in range(width):
+        is_column_digit = is_digit[column]
+        np.multiply(mantissa, 10, out=mantissa, where=is_column_digit)
+        np.add(mantissa, digits[column], out=mantissa, where=is_column_digit)
+        decimals += is_column_digit & is_decimal
+        is_decimal |= is_point[column]
+
+    values = mantissa / (10.0 ** np.arange(width + 1))[decimals]
+    values[is_minus.any(axis=0)] *= -1
+    values[is_null] = np.nan
+    return(values)
+
+
+def parse_bdcn_table(rule, data):
+    """ Parses the data rows of a BDCN file as a fixed-width table,
+    whose columns are given by the rule under the header. Every row
+    results in seven numbers (day, month and year of the date, prec,
+    evap, tmax and tmin).
+
+    Returns None if the rows do not follow the rule (then, they can be
+    parsed with numpy.fromstring, as in read_bdcn_file).
+    """
+    bounds = field_bounds(rule)
+    width = bounds[-1, 1]
+
+    # Every row is followed by a line break, so all the rows have the
+    # width of the rule if the line breaks are in its last column.
+    block = b'\n'.join(data) + b'\n'
+
+    if (len(bounds) != 5 or bounds[0, 1] - bounds[0, 0] != 10 or
+            len(block) != len(data) * (width + 1)):
+        return(None)
+
+    chars = np.frombuffer(block, dtype='uint8').reshape(-1, width + 1)
+    date = chars[:, bounds[0, 0]:bounds[0, 1]]
+    date_digits = date[:, [0, 1, 3, 4, 6, 7, 8, 9]] - np.uint8(ord('0'))
+
+    if not ((chars[:, width] == ord('\n')).all() and
+            (date[:, [2, 5]] == ord('/')).all() and
+            (date_digits <= 9).all()):
+        return(None)
+
+    # Dates in DD/MM/YYYY format.
+    table = np.empty((len(data), 7))
+    table[:, 0] = date_digits[:, 0:2].dot([10, 1])
+    table[:, 1] = date_digits[:, 2:4].dot([10, 1])
+    table[:, 2] = date_digits[:, 4:8].dot([1000, 100, 10, 1])
+
+    # The variables are parsed together if their fields have the same
+    # width (as in the BDCN files).
+    widths = bounds[1:, 1] - bounds[1:, 0]
+
+    if (widths == widths[0]).all():
+        values = parse_fixed_width(
+                chars[:, bounds[1:, 0, np.newaxis] + np.arange(widths[0])])
+
+    else:
+        fields = [
+                parse_fixed_width(chars[:, start:end])
+                for start, end in bounds[1:]]
+        values = (
+                None if any(i is None for i in fields)
+                else np.column_stack(fields))
+
+    if values is None:
+        return(None)
+
+    table[:, 3:] = values
+    return(table)
+
+
+@instrument
 def read_bdcn_file(input_file):
     """ Extracts data from files from the National Climatologic Data
     Base (BDCN) of Mexico.
@@ -93,20 +279,15 @@ def read_bdcn_file(input_file):
 #                str(row['DAY']).zfill(2)]) + ' 08:00'))
 
     # Import CSV file.
-    with io.open(input_file, 'r', encoding='latin1') as f:
-        raw_text = f.read().splitlines()
+    with io.open(input_file, 'rb') as f:
+        raw_bytes = f.read()
 
     # Separate header lines from data lines.
-    separator = raw_text.index("---------- ------ ------ ------ ------")
-    header = raw_text[:separator]
-    data = raw_text[separator + 1:-1]
-
-    # Process data rows.
-    def flitem2array(input_list, item):
-        return(np.array([
-                np.nan if i == 'Nulo'
-                else float(i)
-                for i in [row[item] for row in input_list]]))
+    separator = raw_bytes.index(b"---------- ------ ------ ------ ------")
+    header = raw_bytes[:separator].decode('latin1').splitlines()
+    lines = raw_bytes[separator:].splitlines()
+    rule = lines[0]
+    data = lines[1:-1]
 
     def parse_date(date_string, add_time=' 00:00'):
         """Convert date strings from DD/MM/YYYY format to YYYY-MM-DD
@@ -116,31 +297,37 @@ def read_bdcn_file(input_file):
         datasets values are measured at 8:00 h."""
         return('-'.join(list(reversed(date_string.split('/')))) + add_time)
 
-    data_stripped = [[i for i in row.split(' ') if i != ''] for row in data]
-    dates = [np.datetime64(parse_date(date_string=row[0], add_time=' 08:00'))
-             for row in data_stripped]
-    prec = flitem2array(data_stripped, 1)
-    evap = flitem2array(data_stripped, 2)
-    tmax = flitem2array(data_stripped, 3)
-    tmin = flitem2array(data_stripped, 4)
-    dataset = xr.Dataset(
-            data_vars={'prec': (['time'], prec),
-                       'evap': (['time'], evap),
-                       'tmax': (['time'], tmax),
-                       'tmin': (['time'], tmin)},
-            coords={'time': dates})
-
-    # Remove repeated dates.
+    # Process data rows. The columns of the rows are fixed by the rule
+    # under the header, so the whole data block is parsed at once as
+    # an array of characters. Otherwise, it is handed to the NumPy text
+    # parser; missing values are written as NaN and the separators of
+    # the dates are turned into spaces, so every row results in seven
+    # numbers (day, month and year of the date, prec, evap, tmax and
+    # tmin).
+    table = parse_bdcn_table(rule, data)
+
+    if table is None:
+        table = np.fromstring(
+                b' '.join(data).replace(b'Nulo', b'nan').replace(b'/', b' '),
+                sep=' ').reshape(-1, 7)
+
+    dates = build_dates(
+            year=table[:, 2],
+            month=table[:, 1],
+            day=table[:, 0],
+            add_time=np.timedelta64(8 * 60, 'm'))
+
+    # Remove repeated dates and fill missing dates with nan, placing
+    # every record in its position of a daily time axis.
     # !!! If a date appears more than one time in the record, only the
     # !!! first one is retained.
-    _, index = np.unique(dataset['time'], return_index=True)
-    dataset = dataset.isel(time=index)
-
-    # Reindex to fill missing dates with nan.
-    new_index = np.arange(
-            min(dates), max(dates) + np.timedelta64(1, 'D'),
-            np.timedelta64(1, 'D'))
-    dataset = dataset.reindex(time=new_index)
+    axis = RegularTimeAxis.from_dates(dates)
+    prec, evap, tmax, tmin = axis.place(dates, table[:, 3:]).T
+    dataset = axis.to_dataset(OrderedDict([
+            ('prec', prec),
+            ('evap', evap),
+            ('tmax', tmax),
+            ('tmin', tmin)]))
 
     # Process header rows.
     metadata = OrderedDict()
@@ -161,7 +348,7 @@ def read_bdcn_file(input_file):
     metadata['Elevation'] = str(float(
             header[13].split(":")[-1].replace('msnm', '').replace(',', '').
             strip()))
-    metadata['TemporalRange'] = str(min(dates)) + " -> " + str(max(dates))
+    metadata['TemporalRange'] = str(dates.min()) + " -> " + str(dates.max())
     metadata['TemporalResolution'] = 'Daily (08:00 of the past day - 08:00 of the current day; local time)'
     metadata['ProductionDateTime'] = "Original file generated on " + str(
             np.datetime64(parse_date(header[15].split(":")[-1].strip())))
@@ -192,59 +379,245 @@ def read_bdcn_file(input_file):
     return(dataset)
 
 
-def read_bandas_file(input_file):
-    """ Reads the daily discharnge (DD) records from the National Database
-    of Surface Water (BANDAS) of Mexico. Only works in Windows OS.
+def fetch_batches(cursor, query, batch_size=10000):
+    """Executes a query and yields its rows in batches.
+
+    Parameters
+    ----------
+        cursor: DB-API cursor
+            Cursor of an open database connection.
+        query: string
+            Query to execute.
+        batch_size: integer (default is 10000)
+            Number of rows fetched from the database at once.
     """
-    # TODO: Read all tables from input_file.
+    cursor.execute(query)
+
+    while True:
+        rows = cursor.fetchmany(batch_size)
+
+        if not rows:
+            break
+
+        yield rows
+
+
+def bandas_odbc_batches(input_file, table_name, batch_size=10000):
+    """Reads a table of a BANDAS Microsoft Access file through ODBC.
+    It requires pyodbc and the Microsoft Access driver, so it only
+    works in Windows OS.
+    """
+    from pyodbc import connect
+
     connection = connect('DRIVER={DRIVER};DBQ={DBQ};PWD={PWD}'.format(
             DRIVER='{Microsoft Access Driver (*.mdb, *.accdb)}',
             DBQ=Path(input_file),
             PWD='pw'))
     cursor = connection.cursor()
-    table_name = 'DD' + Path(input_file).resolve().stem
-    query = 'SELECT * FROM ' + table_name
-    rows = cursor.execute(query).fetchall()
-    cursor.close()
-    connection.close()
-    values = np.array([], dtype=np.float)
-    time = np.array([], dtype=np.datetime64)
 
-    for row in rows:
-        yyyy = str(row[0]).zfill(4)
-        mm = str(row[1]).zfill(2)
+    try:
+        for rows in fetch_batches(
+                cursor, 'SELECT * FROM ' + table_name, batch_size):
+            yield rows
+
+    finally:
+        cursor.close()
+        connection.close()
+
+
+def bandas_mdbtools_batches(input_file, table_name, batch_size=10000):
+    """Reads a table of a BANDAS Microsoft Access file with the
+    mdb-export tool of mdbtools (https://github.com/mdbtools/mdbtools),
+    which is available for Linux and macOS.
+    """
+    process = subprocess.Popen(
+            ['mdb-export', str(input_file), table_name],
+            stdout=subprocess.PIPE)
+
+    try:
+        reader = csv.reader(io.TextIOWrapper(
+                process.stdout, encoding='latin1', newline=''))
+        next(reader)   # Column names.
+        rows = []
+
+        for row in reader:
+            rows.append(row)
+
+            if len(rows) == batch_size:
+                yield rows
+                rows = []
+
+        if rows:
+            yield rows
+
+    finally:
+        process.stdout.close()
+
+        if process.wait() != 0:
+            raise IOError(
+                    "mdb-export could not read the table {} of {}.".format(
+                            table_name, input_file))
+
+
+def bandas_sqlite_batches(input_file, table_name, batch_size=10000):
+    """Reads a table of a BANDAS file converted to SQLite (see
+    export_bandas_sqlite).
+    """
+    connection = sqlite3.connect(str(input_file))
+    cursor = connection.cursor()
+
+    try:
+        for rows in fetch_batches(
+                cursor, 'SELECT * FROM ' + table_name, batch_size):
+            yield rows
+
+    finally:
+        cursor.close()
+        connection.close()
 
-        for counter, value in enumerate(row[2:]):
-            stdtime = yyyy + '-' + mm + '-' + str(counter + 1).zfill(2)
 
-            try:
-                time = np.append(time, np.datetime64(stdtime))
-                values = np.append(values, value)
+BANDAS_BACKENDS = OrderedDict([
+        ('odbc', bandas_odbc_batches),
+        ('mdbtools', bandas_mdbtools_batches),
+        ('sqlite', bandas_sqlite_batches)])
 
-            except ValueError:
-                pass
 
-    values[values == ''] = np.nan
-    values = values.astype(np.float)
+def bandas_backend(input_file):
+    """Default backend to read a BANDAS file, according to its extension
+    and the operating system.
+    """
+    if Path(input_file).suffix.lower() in ['.sqlite', '.sqlite3', '.db']:
+        return('sqlite')
+
+    elif sys.platform.startswith('win'):
+        return('odbc')
+
+    else:
+        return('mdbtools')
+
+
+@instrument
+def read_bandas_file(input_file, backend=None, batch_size=10000):
+    """ Reads the daily discharnge (DD) records from the National Database
+    of Surface Water (BANDAS) of Mexico.
+
+    Parameters
+    ----------
+        input_file: string
+            The full path of the input file (Microsoft Access or
+            SQLite).
+        backend: string (optional)
+            Backend used to read the file (one of BANDAS_BACKENDS):
+            'odbc' (Windows OS only), 'mdbtools' or 'sqlite'. By
+            default, it is chosen with bandas_backend.
+        batch_size: integer (default is 10000)
+            Number of rows fetched from the file at once.
+    """
+    # TODO: Read all tables from input_file.
+    if backend is None:
+        backend = bandas_backend(input_file)
 
-    # Remove the value of repeated dates.
-    repeated = np.unique([i for i in time if (time == i).sum() > 1])
+    table_name = 'DD' + Path(input_file).resolve().stem
+    batches = BANDAS_BACKENDS[backend](
+            input_file=input_file,
+            table_name=table_name,
+            batch_size=batch_size)
+    return(bandas_to_dataset(np.concatenate(
+            [rows_to_array(rows) for rows in batches])))
+
+
+def export_bandas_sqlite(input_file, output_file, backend=None,
+                         batch_size=10000):
+    """ Copies the daily discharge (DD) table of a BANDAS file into a
+    SQLite file, that can be read in any OS with the 'sqlite' backend
+    of read_bandas_file.
 
-    if len(repeated) > 0:
-        indices = []
+    Parameters
+    ----------
+        input_file: string
+            The full path of the input file (Microsoft Access).
+        output_file: string
+            The full path of the output file. Its name needs to keep
+            the station ID of the input file (e.g., 10001.sqlite).
+        backend: string (optional)
+            Backend used to read the input file (see read_bandas_file).
+        batch_size: integer (default is 10000)
+            Number of rows copied at once.
+    """
+    if backend is None:
+        backend = bandas_backend(input_file)
 
-        for i in repeated:
-            indices = indices + list(np.where(time == i)[0])
+    table_name = 'DD' + Path(input_file).resolve().stem
+    connection = sqlite3.connect(str(output_file))
+
+    try:
+        connection.execute('DROP TABLE IF EXISTS ' + table_name)
+
+        for rows in BANDAS_BACKENDS[backend](
+                input_file=input_file,
+                table_name=table_name,
+                batch_size=batch_size):
+            table = rows_to_array(rows)
+            columns = ['ANO', 'MES'] + [
+                    'D' + str(i + 1) for i in range(table.shape[1] - 2)]
+            connection.execute('CREATE TABLE IF NOT EXISTS {} ({})'.format(
+                    table_name, ', '.join(i + ' REAL' for i in columns)))
+            connection.executemany(
+                    'INSERT INTO {} VALUES ({})'.format(
+                            table_name, ', '.join('?' * len(columns))),
+                    [[None if np.isnan(i) else i for i in row]
+                     for row in table.tolist()])
+
+        connection.commit()
+
+    finally:
+        connection.close()
+
+
+def rows_to_array(rows):
+    """ Converts rows of a BANDAS table into a 2D array of floats.
+    Missing values (None or empty strings) are converted to NaN.
+    """
+    table = np.array([tuple(row) for row in rows], dtype=object)
+    table[table == ''] = np.nan
+    return(table.astype(float))
 
-        time = np.delete(time, indices)
-        values = np.delete(values, indices)
 
-    dataset = xr.Dataset(
-            data_vars={'main': (['time'], values)},
-            coords={'time': time})
+def bandas_to_dataset(table):
+    """ Arranges the rows of a daily table of BANDAS into a daily
+    dataset.
 
-    # Reindex to fill missing dates with nan.
-    new_index = np.arange(
-            min(time), max(time) + np.timedelta64(1, 'D'),
-            np.timedelta64(1, 'D'))
-    return(dataset.reindex(time=new_index))
+    Parameters
+    ----------
+        table: numpy.ndarray
+            2D array with the rows of the table (see rows_to_array).
+            Each row has the year, the month and the values of the
+            days 1 to 31 of the month.
+    """
+    # Build the dates of a (rows x days) grid and mask the days that do
+    # not exist in the month of the row (e.g., February 30).
+    months = ((table[:, 0].astype(int) - 1970) * 12 +
+              table[:, 1].astype(int) - 1).astype('datetime64[M]')
+    time = (months.astype('datetime64[D]')[:, np.newaxis] +
+            np.arange(table.shape[1] - 2))
+    is_valid = time.astype('datetime64[M]') == months[:, np.newaxis]
+    time = time[is_valid]
+    values = table[:, 2:][is_valid]
+
+    # Remove the value of repeated dates and fill missing dates with
+    # nan, placing every value in its position of a daily time axis
+    # that spans the remaining dates.
+    kept = unique_records(time, duplicates='drop')
+    axis = RegularTimeAxis.from_dates(time[kept])
+    return(axis.to_dataset({'main': axis.place(time[kept], values[kept])}))
+
+
+# Readers of the station files, by name, and their versions. Changing
+# what a reader returns must increase its version, which invalidates
+# the files parsed before (see parse_cache).
+READERS = OrderedDict([
+        ('bdcn', read_bdcn_file),
+        ('bandas', read_bandas_file)])
+READER_VERSIONS = OrderedDict([
+        ('bdcn', '1'),
+        ('bandas', '2')])
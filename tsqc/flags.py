@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""Quality control routines. Packed quality control flags.
+
+The results of the level 1 tests of a variable are stored in a single
+integer variable (named as the variable plus '_qc'), with one bit per
+test, described by the CF attributes flag_masks and flag_meanings. The
+bit of every test is fixed (see LEVEL1_TESTS), so flags written with
+different sets of enabled tests can be decoded alike.
+
+Author
+------
+    Roberto A. Real-Rangel (Institute of Engineering UNAM; Mexico)
+
+License
+-------
+    GNU General Public License
+"""
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+
+# The position of a test in this list is its bit in the packed flags.
+LEVEL1_TESTS = [
+        'gross_range_test', 'climatology_test', 'spikes_data_test',
+        'change_rate_test', 'flat_series_test', 'tmp_outlier_test']
+FLAG_DTYPE = 'uint8' if len(LEVEL1_TESTS) <= 8 else 'uint16'
+FLAG_SUFFIX = '_qc'
+
+DEFAULT_OUTPUT = OrderedDict([
+        ('packed_flags', True),
+        ('zlib', True),
+        ('shuffle', True),
+        ('complevel', 4)])
+
+
+def output_parameters(config):
+    """Parameters of the output files, taken from the [output] section
+    of the configuration (if any) and completed with DEFAULT_OUTPUT.
+    """
+    parameters = DEFAULT_OUTPUT.copy()
+    parameters.update(config.get('output', {}))
+    return(parameters)
+
+
+def test_mask(tests):
+    """Bit mask of a list of tests (see LEVEL1_TESTS)."""
+    mask = 0
+
+    for test in tests:
+        mask |= 1 << LEVEL1_TESTS.index(test)
+
+    return(np.array(mask, dtype=FLAG_DTYPE))
+
+
+def encode_flags(dataset, var):
+    """Packs the boolean results of the level 1 tests of a variable
+    (named as the variable plus the name of the test, e.g.,
+    'prec_climatology_test') into a single flag variable.
+
+    Parameters
+    ----------
+        dataset: xarray.Dataset
+            Dataset with the results of the tests.
+        var: string
+            Name of the tested variable.
+
+    Returns
+    -------
+        xarray.DataArray
+            Packed flags, or None if the variable has no test results.
+    """
+    tests = [i for i in LEVEL1_TESTS if '_'.join([var, i]) in dataset]
+
+    if not tests:
+        return(None)
+
+    packed = xr.zeros_like(dataset['_'.join([var, tests[0]])],
+                           dtype=FLAG_DTYPE)
+
+    for test in tests:
+        packed = packed | (dataset['_'.join([var, test])].astype(FLAG_DTYPE)
+                           * test_mask([test]))
+
+    packed.name = var + FLAG_SUFFIX
+    packed.attrs = OrderedDict([
+            ('long_name', 'Quality control flags of ' + var),
+            ('standard_name', 'status_flag'),
+            ('flag_masks', np.array(
+                    [test_mask([i]) for i in tests], dtype=FLAG_DTYPE)),
+            ('flag_meanings', ' '.join(tests))])
+    return(packed)
+
+
+def decode_flags(packed):
+    """Unpacks the flags of a variable (see encode_flags). The masks of
+    a single test are read back from NetCDF files as a scalar.
+
+    Returns
+    -------
+        collections.OrderedDict
+            Boolean results of every test in the packed flags.
+    """
+    return(OrderedDict([
+            (test, (packed & np.array(mask, dtype=packed.dtype)) != 0)
+            for test, mask in zip(
+                    packed.attrs['flag_meanings'].split(),
+                    np.atleast_1d(packed.attrs['flag_masks']))]))
+
+
+def outlier_mask(packed, tests=None):
+    """Data points flagged by any of the tests in the packed flags (or
+    by any of a list of tests), with a single bitwise operation.
+    """
+    if tests is None:
+        tests = packed.attrs['flag_meanings'].split()
+
+    return((packed & test_mask(tests).astype(packed.dtype)) != 0)
+
+
+def pack_flags(dataset):
+    """Replaces the boolean results of the level 1 tests of every
+    variable of a dataset by its packed flags (see encode_flags).
+    """
+    packed = dataset.copy()
+
+    for var in list(dataset.data_vars):
+        var_flags = encode_flags(dataset, var)
+
+        if var_flags is not None:
+            packed = packed.drop_vars([
+                    '_'.join([var, i]) for i in var_flags.attrs[
+                            'flag_meanings'].split()])
+            packed[var_flags.name] = var_flags
+
+    return(packed)
+
+
+def unpack_flags(dataset):
+    """Replaces the packed flags of a dataset by the boolean results of
+    every test (the inverse of pack_flags).
+    """
+    unpacked = dataset.copy()
+
+    for name in list(dataset.data_vars):
+        if 'flag_masks' in dataset[name].attrs:
+            var = name[:-len(FLAG_SUFFIX)]
+
+            for test, flags in decode_flags(dataset[name]).items():
+                unpacked['_'.join([var, test])] = flags
+
+            unpacked = unpacked.drop_vars(name)
+
+    return(unpacked)
+
+
+def output_encoding(dataset, config):
+    """Encoding (zlib compression and shuffle filter) of every data
+    variable of a dataset, as the encoding argument of
+    xarray.Dataset.to_netcdf, set in the [output] section of the
+    configuration.
+    """
+    parameters = output_parameters(config)
+
+    if not parameters['zlib']:
+        return(None)
+
+    return(OrderedDict([
+            (var, {'zlib': True,
+                   'shuffle': parameters['shuffle'],
+                   'complevel': parameters['complevel']})
+            for var in dataset.data_vars]))
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""Quality control routines. Filling of short gaps.
+
+The runs of missing values (gaps) of a time series are found in a
+single vectorized pass; only gaps up to max_gap time steps are filled.
+
+Author
+------
+    Roberto A. Real-Rangel (Institute of Engineering UNAM; Mexico)
+
+License
+-------
+    GNU General Public License
+"""
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+
+from . import quality_control_tests as qct
+
+FILL_METHODS = ['linear', 'nearest', 'climatology']
+
+
+def nan_runs(values):
+    """ Runs of consecutive missing values of a time series.
+
+    Parameters
+    ----------
+        values: numpy.ndarray
+            Values of the time series.
+
+    Returns
+    -------
+        starts: numpy.ndarray
+            Position of the first missing value of every gap.
+        lengths: numpy.ndarray
+            Number of missing values of every gap.
+    """
+    missing = np.concatenate([[False], np.isnan(values), [False]])
+    edges = np.diff(missing.astype('int8'))
+    starts = np.flatnonzero(edges == 1)
+    return(starts, np.flatnonzero(edges == -1) - starts)
+
+
+def gap_lengths(input_ts):
+    """ Length of the gap of every missing value of a time series (zero
+    for the available values).
+
+    Parameters
+    ----------
+        input_ts: xarray.DataArray
+            Time series of streamflow (or other variable), or cube of
+            time series (e.g., station x time), possibly dask-backed.
+    """
+    return(qct.along_time(gap_length_values, input_ts, 'int'))
+
+
+def gap_length_values(values):
+    """ Numpy implementation of gap_lengths over a 1D array. """
+    _, lengths = nan_runs(values)
+    gap_length = np.zeros(values.shape, dtype='int')
+
+    # The missing values are sorted by gap, as the gaps are.
+    gap_length[np.isnan(values)] = np.repeat(lengths, lengths)
+    return(gap_length)
+
+
+def fillable_values(values, months, max_gap=3, method='linear'):
+    """ Missing values of a time series that fill_gaps fills: those of
+    the gaps of up to max_gap values (not at the beginning or end of
+    the time series, for the linear and nearest methods; and of a month
+    with available values, for the climatology method).
+
+    Returns
+    -------
+        lengths: numpy.ndarray
+            Number of missing values of every gap (see nan_runs).
+        is_fillable: numpy.ndarray
+            Boolean array, True for every missing value (in order) that
+            is filled.
+    """
+    if method not in FILL_METHODS:
+        raise ValueError(
+                "Unknown method '{}'. Available methods are: {}.".format(
+                        method, ', '.join(FILL_METHODS)))
+
+    starts, lengths = nan_runs(values)
+    is_short = lengths <= max_gap
+
+    if method != 'climatology':
+        is_short &= (starts > 0) & (starts + lengths < len(values))
+
+    is_fillable = np.repeat(is_short, lengths)
+
+    if method == 'climatology':
+        missing = np.isnan(values)
+        has_values = np.bincount(months[~missing], minlength=12) > 0
+        is_fillable &= has_values[months[missing]]
+
+    return(lengths, is_fillable)
+
+
+def fill_gaps(input_ts, max_gap=3, method='linear'):
+    """ Fills the gaps of up to max_gap missing values of a time series.
+
+    Parameters
+    ----------
+        input_ts: xarray.DataArray
+            Time series of streamflow (or other variable), or cube of
+            time series (e.g., station x time), possibly dask-backed.
+            It is not modified.
+        max_gap: integer (default is 3)
+            Maximum number of consecutive missing values to fill.
+        method: string (default is 'linear')
+            'linear' (interpolation in time between the available
+            values around the gap), 'nearest' (available value closest
+            in time) or 'climatology' (mean of the available values of
+            the same month). The linear and nearest methods do not fill
+            the gaps at the beginning or end of the time series.
+
+    Returns
+    -------
+        xarray.DataArray
+            Filled time series.
+    """
+    if method not in FILL_METHODS:
+        raise ValueError(
+                "Unknown method '{}'. Available methods are: {}.".format(
+                        method, ', '.join(FILL_METHODS)))
+
+    return(qct.along_time(
+            fill_values, input_ts, 'float',
+            times=input_ts['time'].values.astype('datetime64[s]').astype(
+                    'float'),
+            months=qct.month_index(input_ts),
+            max_gap=max_gap,
+            method=method))
+
+
+def fill_values(values, times, months, max_gap=3, method='linear'):
+    """ Numpy implementation of fill_gaps over a 1D array, with the time
+    (as a number) and month (see quality_control_tests.month_index) of
+    every value.
+    """
+    filled = values.copy()
+    available = ~np.isnan(values)
+
+    if not available.any():
+        return(filled)
+
+    _, is_fillable = fillable_values(values, months, max_gap, method)
+    target = np.flatnonzero(~available)[is_fillable]
+    known_times = times[available]
+    known_values = values[available]
+
+    if method == 'linear':
+        filled[target] = np.interp(times[target], known_times, known_values)
+
+    elif method == 'nearest':
+        # Only gaps within the time series are filled, so there is
+        # always an available value before and after them.
+        following = np.searchsorted(known_times, times[target])
+        previous = following - 1
+        is_closer = ((known_times[following] - times[target]) <
+                     (times[target] - known_times[previous]))
+        filled[target] = known_values[np.where(
+                is_closer, following, previous)]
+
+    elif method == 'climatology':
+        mean, _ = qct.moments_stats(*qct.group_moments(values, months))
+        filled[target] = mean[months[target]]
+
+    return(filled)
+
+
+def gap_statistics(input_ts, max_gap=3, method='linear'):
+    """ Summary of the gaps of a time series.
+
+    Parameters
+    ----------
+        input_ts: xarray.DataArray or xarray.Dataset
+            Time series (or dataset of time series) of streamflow (or
+            other variable).
+        max_gap: integer (default is 3)
+            Maximum length of the gaps to fill (see fill_gaps).
+        method: string (default is 'linear')
+            Method of fill_gaps, which determines if the gaps at the
+            beginning or end of the time series are filled.
+
+    Returns
+    -------
+        collections.OrderedDict
+            Number of missing values ('missing') and its ratio to the
+            length of the time series ('missing_ratio'), number of gaps
+            ('gaps'), number of gaps that fill_gaps fills (with method)
+            ('short_gaps') and the missing values it fills
+            ('fillable'), and
+            length of the longest gap ('longest_gap'). For a dataset,
+            the summary of every variable.
+    """
+    if isinstance(input_ts, xr.Dataset):
+        return(OrderedDict([
+                (var, gap_statistics(input_ts[var], max_gap, method))
+                for var in input_ts.data_vars]))
+
+    values = input_ts.values.astype('float')
+    lengths, is_fillable = fillable_values(
+            values, qct.month_index(input_ts), max_gap, method)
+
+    # Gap of every missing value.
+    gap = np.repeat(np.arange(len(lengths)), lengths)
+    return(OrderedDict([
+            ('missing', int(lengths.sum())),
+            ('missing_ratio', float(lengths.sum()) / max(len(values), 1)),
+            ('gaps', len(lengths)),
+            ('short_gaps', len(np.unique(gap[is_fillable]))),
+            ('fillable', int(is_fillable.sum())),
+            ('longest_gap', int(lengths.max()) if len(lengths) else 0)]))
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""Quality control routines. Homogeneity and randomness tests.
+
+The rank von Neumann ratio, Pettitt, standard normal homogeneity (SNHT)
+and Buishand range tests are applied to annual (or monthly) aggregates
+of many stations at once, arranged in a (station x year) array. The
+ranks and the cumulative sums of the standardized series are computed
+once and shared by the tests (see shared_statistics), and the critical
+values are looked up in statistical_tables.
+
+Author
+------
+    Roberto A. Real-Rangel (Institute of Engineering UNAM; Mexico)
+
+License
+-------
+    GNU General Public License
+"""
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+
+from . import quality_control_tests as qct
+from . import statistical_tables as st
+
+HOMOGENEITY_TESTS = ['von_neumann', 'pettitt', 'snht', 'buishand']
+AGGREGATIONS = ['mean', 'sum']
+
+# Classes of the series by the number of tests that reject their
+# homogeneity: 0 or 1, 2, and 3 or 4 (Wijngaard et al., 2003).
+SERIES_CLASSES = OrderedDict([
+        ('useful', 0),
+        ('doubtful', 1),
+        ('suspect', 2)])
+
+
+def aggregate(input_ts, period='annual', how='mean', min_fraction=0.8):
+    """ Annual or monthly aggregates of daily time series, computed
+    for all the stations at once with a single numpy.bincount (see
+    quality_control_tests.group_index).
+
+    Parameters
+    ----------
+        input_ts: xarray.DataArray
+            Time series, or cube of time series (e.g., station x time).
+        period: string (default is 'annual')
+            'annual' or 'monthly'. Monthly aggregates are arranged as
+            one series of years for every month.
+        how: string (default is 'mean')
+            'mean' or 'sum' (e.g., for precipitation).
+        min_fraction: float (default is 0.8)
+            Minimum fraction of time steps with values in a year (or
+            month) to aggregate it. Otherwise, its aggregate is NaN.
+
+    Returns
+    -------
+        xarray.DataArray
+            Aggregates with the dimensions of input_ts other than
+            'time', plus 'year' (or 'month' and 'year').
+    """
+    if how not in AGGREGATIONS:
+        raise ValueError(
+                "Unknown aggregation '{}'. Available aggregations are: {}."
+                .format(how, ', '.join(AGGREGATIONS)))
+
+    input_ts = input_ts.transpose(..., 'time')
+    values = input_ts.values.astype('float')
+    dates = input_ts['time'].values
+    years = dates.astype('datetime64[Y]').astype('int') + 1970
+    year_list = np.arange(years.min(), years.max() + 1)
+    groups = years - years.min()
+
+    if period == 'monthly':
+        groups = groups * 12 + qct.month_index(input_ts)
+
+    elif period != 'annual':
+        raise ValueError("Unknown period '{}'.".format(period))
+
+    n_groups = len(year_list) * (12 if period == 'monthly' else 1)
+    valid = ~np.isnan(values)
+    index = qct.group_index(values.shape, groups, n_groups)[valid]
+    shape = values.shape[:-1] + (n_groups, )
+    count = np.bincount(index, minlength=np.prod(shape)).reshape(shape)
+    total = np.bincount(
+            index, weights=values[valid], minlength=np.prod(shape)).reshape(
+                    shape)
+    steps = np.bincount(groups, minlength=n_groups)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        aggregates = total / count if how == 'mean' else total
+
+    # Periods without time steps (e.g., months before the record
+    # starts) have no aggregate either.
+    aggregates[(count < min_fraction * steps) | (count == 0)] = np.nan
+    dims = [i for i in input_ts.dims if i != 'time']
+    coords = OrderedDict([
+            (i, input_ts[i]) for i in dims if i in input_ts.coords])
+    coords['year'] = year_list
+
+    if period == 'monthly':
+        aggregates = np.moveaxis(
+                aggregates.reshape(shape[:-1] + (len(year_list), 12)),
+                -1, -2)
+        coords['month'] = np.arange(1, 13)
+        dims = dims + ['month']
+
+    return(xr.DataArray(
+            aggregates, dims=dims + ['year'], coords=coords,
+            name=input_ts.name))
+
+
+def compact(values):
+    """ Moves the non-missing values of every row of an array to its
+    start, keeping their order, so a row with missing years becomes a
+    shorter complete series.
+
+    Returns
+    -------
+        compacted: numpy.ndarray
+            Array with the values of every row first and NaN after them.
+        position: numpy.ndarray
+            Original position of every compacted value.
+        n: numpy.ndarray
+            Number of values of every row.
+    """
+    position = np.argsort(np.isnan(values), axis=-1, kind='stable')
+    compacted = np.take_along_axis(values, position, axis=-1)
+    return(compacted, position, (~np.isnan(values)).sum(axis=-1))
+
+
+def row_ranks(values):
+    """ Ranks (from 1) of the non-missing values of every row of an
+    array. Ties share their mean rank; missing values have no rank.
+    """
+    order = np.argsort(values, axis=-1)
+    sorted_values = np.take_along_axis(values, order, axis=-1)
+    positions = np.broadcast_to(np.arange(values.shape[-1]), values.shape)
+
+    # First and last position of every run of ties.
+    is_first = np.ones(values.shape, dtype='bool')
+    is_first[..., 1:] = sorted_values[..., 1:] != sorted_values[..., :-1]
+    is_last = np.ones(values.shape, dtype='bool')
+    is_last[..., :-1] = is_first[..., 1:]
+    first = np.maximum.accumulate(
+            np.where(is_first, positions, 0), axis=-1)
+    last = np.flip(np.minimum.accumulate(np.flip(
+            np.where(is_last, positions, values.shape[-1]), axis=-1),
+            axis=-1), axis=-1)
+    ranks = np.empty(values.shape)
+    np.put_along_axis(ranks, order, (first + last) / 2.0 + 1, axis=-1)
+    ranks[np.isnan(values)] = np.nan
+    return(ranks)
+
+
+def shared_statistics(values):
+    """ Quantities shared by the homogeneity tests of a (station x
+    year) array: the compacted series (see compact), their ranks and
+    the cumulative sums of the standardized series, S_k for k = 1 to
+    n - 1 (S_n is zero).
+
+    Parameters
+    ----------
+        values: numpy.ndarray
+            Annual (or monthly) series, with the years along the last
+            dimension.
+    """
+    compacted, position, n = compact(np.asarray(values, dtype='float'))
+    valid = ~np.isnan(compacted)
+    k = np.arange(1, compacted.shape[-1] + 1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(valid, compacted, 0).sum(axis=-1) / n
+        anomalies = np.where(valid, compacted - mean[..., np.newaxis], 0)
+        std = np.sqrt((anomalies ** 2).sum(axis=-1) / n)
+        cumsum = np.cumsum(anomalies, axis=-1) / std[..., np.newaxis]
+
+    return(OrderedDict([
+            ('values', compacted),
+            ('position', position),
+            ('n', n),
+            ('k', k),
+            ('is_split', k < n[..., np.newaxis]),
+            ('ranks', row_ranks(compacted)),
+            ('cumsum', cumsum)]))
+
+
+def break_position(statistic, shared):
+    """ Maximum of a statistic of every split of the series, and the
+    original position of the last value before the split that attains
+    it.
+    """
+    statistic = np.where(shared['is_split'], statistic, -np.inf)
+    k = np.argmax(statistic, axis=-1)
+    maximum = np.take_along_axis(statistic, k[..., np.newaxis], axis=-1)
+    position = np.take_along_axis(
+            shared['position'], k[..., np.newaxis], axis=-1)
+    return(maximum[..., 0], position[..., 0])
+
+
+def von_neumann_test(shared, alpha=0.05):
+    """ Rank von Neumann ratio test of randomness. The ratio of the
+    sum of squared differences of consecutive ranks to their sum of
+    squared deviations is small when the series is not random.
+
+    References
+    ----------
+        Bartels, R. (1982). The Rank Version of von Neumann’s Ratio
+            Test for Randomness. Journal of the American Statistical
+            Association, 77(377), 40–46.
+            https://doi.org/10.1080/01621459.1982.10477764
+    """
+    ranks = shared['ranks']
+    n = shared['n']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = (
+                np.nansum(np.diff(ranks, axis=-1) ** 2, axis=-1) /
+                np.nansum((ranks - (n[..., np.newaxis] + 1) / 2.0) ** 2,
+                          axis=-1))
+
+    critical = st.von_neumann_ratio(n, alpha)
+    return(OrderedDict([
+            ('statistic', ratio),
+            ('critical', critical),
+            ('rejected', ratio < critical),
+            ('break', None)]))
+
+
+def pettitt_test(shared, alpha=0.05):
+    """ Pettitt test of a change of location, on the ranks:
+    K = max |2 sum(r_i, i <= k) - k (n + 1)|.
+
+    References
+    ----------
+        Pettitt, A. N. (1979). A non-parametric approach to the
+            change-point problem. Applied Statistics, 28(2), 126–135.
+            https://doi.org/10.2307/2346729
+    """
+    n = shared['n'][..., np.newaxis]
+    u = np.abs(2 * np.nancumsum(shared['ranks'], axis=-1) -
+               shared['k'] * (n + 1))
+    statistic, position = break_position(u, shared)
+    critical = st.pettitt(shared['n'], alpha)
+    return(OrderedDict([
+            ('statistic', statistic),
+            ('critical', critical),
+            ('rejected', statistic > critical),
+            ('break', position)]))
+
+
+def snht_test(shared, alpha=0.05):
+    """ Standard normal homogeneity test (SNHT) for a single break:
+    T = max(k z1^2 + (n - k) z2^2), which, since the standardized
+    series sums zero, is max(S_k^2 n / (k (n - k))).
+
+    References
+    ----------
+        Alexandersson, H. (1986). A homogeneity test applied to
+            precipitation data. Journal of Climatology, 6(6), 661–675.
+            https://doi.org/10.1002/joc.3370060607
+    """
+    n = shared['n'][..., np.newaxis]
+    k = shared['k']
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = shared['cumsum'] ** 2 * n / (k * (n - k))
+
+    statistic, position = break_position(t, shared)
+    critical = st.snht(shared['n'], alpha)
+    return(OrderedDict([
+            ('statistic', statistic),
+            ('critical', critical),
+            ('rejected', statistic > critical),
+            ('break', position)]))
+
+
+def buishand_test(shared, alpha=0.05):
+    """ Buishand range test: the range of the cumulative deviations of
+    the standardized series, max(S_k) - min(S_k) for k = 0 to n,
+    divided by sqrt(n). The break is at the largest |S_k|.
+
+    References
+    ----------
+        Buishand, T. A. (1982). Some methods for testing the
+            homogeneity of rainfall records. Journal of Hydrology,
+            58(1–2), 11–27. https://doi.org/10.1016/0022-1694(82)90066-X
+    """
+    cumsum = np.where(shared['is_split'], shared['cumsum'], 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        statistic = (
+                (cumsum.max(axis=-1) - cumsum.min(axis=-1)) /
+                np.sqrt(shared['n']))
+
+    _, position = break_position(np.abs(cumsum), shared)
+    critical = st.buishand_range(shared['n'], alpha)
+    return(OrderedDict([
+            ('statistic', statistic),
+            ('critical', critical),
+            ('rejected', statistic > critical),
+            ('break', position)]))
+
+
+TEST_FUNCTIONS = OrderedDict([
+        ('von_neumann', von_neumann_test),
+        ('pettitt', pettitt_test),
+        ('snht', snht_test),
+        ('buishand', buishand_test)])
+
+
+def homogeneity_tests(series, alpha=0.05, tests=HOMOGENEITY_TESTS,
+                      min_length=10):
+    """ Performs the homogeneity and randomness tests on many annual
+    (or monthly) series at once.
+
+    Parameters
+    ----------
+        series: xarray.DataArray
+            Aggregates with a 'year' dimension (see aggregate), e.g.,
+            (station x year) or (station x month x year).
+        alpha: float (default is 0.05)
+            Significance level of the tests.
+        tests: list (default is HOMOGENEITY_TESTS)
+            Tests to perform: 'von_neumann', 'pettitt', 'snht' and
+            'buishand'.
+        min_length: integer (default is 10)
+            Minimum number of years with values to test a series. A
+            test is also skipped where its critical values are not
+            defined for the number of years (NaN critical value).
+
+    Returns
+    -------
+        xarray.Dataset
+            For every test, its statistic, critical value, whether the
+            homogeneity (or randomness) is rejected and, except for the
+            von Neumann ratio, the year of the break (the last one
+            before it). 'n' is the number of years with values,
+            'rejections' the number of tests that reject the series and
+            'class' its class (see SERIES_CLASSES).
+
+    Reference
+    ---------
+        Wijngaard, J. B., Klein Tank, A. M. G., & Können, G. P. (2003).
+            Homogeneity of 20th century European daily temperature and
+            precipitation series. International Journal of Climatology,
+            23(6), 679–692. https://doi.org/10.1002/joc.906
+    """
+    for test in tests:
+        if test not in TEST_FUNCTIONS:
+            raise ValueError(
+                    "Unknown test '{}'. Available tests are: {}.".format(
+                            test, ', '.join(TEST_FUNCTIONS)))
+
+    series = series.transpose(..., 'year')
+    dims = list(series.dims[:-1])
+    years = series['year'].values
+    shared = shared_statistics(series.values)
+    is_tested = shared['n'] >= min_length
+    results = xr.Dataset(coords=OrderedDict([
+            (i, series[i]) for i in dims if i in series.coords]))
+    results['n'] = (dims, shared['n'])
+    rejections = np.zeros(shared['n'].shape, dtype='int')
+
+    for test in tests:
+        result = TEST_FUNCTIONS[test](shared, alpha)
+        is_defined = is_tested & np.isfinite(result['critical'])
+        rejected = result['rejected'] & is_defined
+        rejections += rejected
+        results[test + '_statistic'] = (
+                dims, np.where(is_defined, result['statistic'], np.nan))
+        results[test + '_critical'] = (dims, result['critical'])
+        results[test + '_rejected'] = (dims, rejected)
+
+        if result['break'] is not None:
+            results[test + '_break'] = (dims, np.where(
+                    rejected, years[result['break']], -1))
+
+    results['rejections'] = (dims, rejections)
+    results['class'] = (dims, np.digitize(
+            rejections, [2, 3]).astype('uint8'))
+    results['class'].attrs = OrderedDict([
+            ('flag_values', np.array(list(SERIES_CLASSES.values()),
+                                     dtype='uint8')),
+            ('flag_meanings', ' '.join(SERIES_CLASSES))])
+    return(results)
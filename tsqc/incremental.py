@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""Quality control routines. Incremental level 1 tests.
+
+The monthly count, sum and sum of squares of the scored series of every
+variable (see pipeline.scored_series) are saved in a sidecar file next
+to the output NetCDF file of the station, together with the last values
+of the record (the tail). When new records are appended to the input
+file, only the new rows (plus the tail, which is the overlap needed by
+the spikes, change rate and flat series tests) are tested, with
+statistics updated with the new values. The flags of the previous rows
+are kept as they were. A hash of the rows before the tail is saved
+too, so a record with revised rows is tested again as a whole.
+
+Author
+------
+    Roberto A. Real-Rangel (Institute of Engineering UNAM; Mexico)
+
+License
+-------
+    GNU General Public License
+"""
+from collections import OrderedDict
+import hashlib
+import os
+
+from pathlib2 import Path
+import numpy as np
+import xarray as xr
+
+from . import quality_control_tests as qct
+from .flags import output_encoding
+from .flags import output_parameters
+from .flags import pack_flags
+from .pipeline import SETTINGS_ATTR
+from .pipeline import level1_parameters
+from .pipeline import moment_scoring
+from .pipeline import run_level1
+from .pipeline import scored_series
+from .pipeline import settings_hash
+
+MOMENTS = ['count', 'sum', 'sumsq']
+RECORD_HASH_ATTR = 'record_hash'
+
+
+def statistics_path(output_file):
+    """Path of the sidecar file with the statistics of a station."""
+    output_file = Path(output_file)
+    return(output_file.with_name(output_file.stem + '.stats.nc'))
+
+
+def overlap_length(config):
+    """Number of values of the tail: the window needed to test the first
+    new value with the flat series test, and at least two values (for
+    the spikes and change rate tests).
+    """
+    parameters = level1_parameters(config)
+    return(max(2, int(parameters['repetitions_tolerance']) + 1))
+
+
+def record_hash(dataset, end_time):
+    """Hash (SHA-1) of the times and values of the rows of a dataset
+    before end_time.
+    """
+    rows = dataset.isel(time=dataset['time'].values < end_time)
+    digest = hashlib.sha1(
+            rows['time'].values.astype('datetime64[ns]').tobytes())
+
+    for var in sorted(rows.data_vars):
+        digest.update(var.encode())
+        digest.update(np.ascontiguousarray(
+                rows[var].values, dtype='float').tobytes())
+
+    return(digest.hexdigest())
+
+
+def level1_statistics(dataset, config):
+    """Computes the statistics and tail of a station dataset.
+
+    The statistics include every time step but the last one, whose
+    spike can only be computed once the next value is available.
+
+    Parameters
+    ----------
+        dataset: xarray.Dataset
+            Dataset of the station.
+        config: dict
+            Settings loaded from the configuration file (config.toml).
+    """
+    overlap = overlap_length(config)
+    transform = level1_parameters(config)['transform']
+    months = qct.month_index(dataset)
+    statistics = xr.Dataset(coords={
+            'month': np.arange(1, 13),
+            'tail_time': dataset['time'].values[-overlap:]})
+
+    for var in dataset.data_vars:
+        values = dataset[var].values.astype('float')
+
+        for name, series in scored_series(values, transform).items():
+            for moment, value in zip(MOMENTS, qct.group_moments(
+                    series[:-1], months[:-1])):
+                statistics['_'.join([var, name, moment])] = ('month', value)
+
+        statistics[var + '_tail'] = ('tail_time', values[-overlap:])
+
+    statistics.attrs[RECORD_HASH_ATTR] = record_hash(
+            dataset, statistics['tail_time'].values[0])
+    return(statistics)
+
+
+def stored_moments(statistics, var, name):
+    """Moments of a scored series of a variable stored in statistics."""
+    return([statistics['_'.join([var, name, i])].values for i in MOMENTS])
+
+
+def is_continuation(dataset, statistics):
+    """Test if a dataset continues the record summarized in statistics,
+    i.e., it has the same variables, its values at the times of the
+    tail have not been modified and the rows before the tail have not
+    been revised (see record_hash).
+    """
+    tail_time = statistics['tail_time'].values
+    tail_vars = [i[:-len('_tail')] for i in statistics.data_vars
+                 if i.endswith('_tail')]
+
+    if sorted(tail_vars) != sorted(dataset.data_vars):
+        return(False)
+
+    tail = dataset.sel(time=slice(tail_time[0], None)).isel(
+            time=slice(0, len(tail_time)))
+
+    if not np.array_equal(tail['time'].values, tail_time):
+        return(False)
+
+    if not all(np.array_equal(
+            tail[var].values.astype('float'),
+            statistics[var + '_tail'].values,
+            equal_nan=True) for var in dataset.data_vars):
+        return(False)
+
+    return(statistics.attrs.get(RECORD_HASH_ATTR) == record_hash(
+            dataset, tail_time[0]))
+
+
+def update_level1(dataset, statistics, config):
+    """Performs the level 1 tests only over the rows of a dataset that
+    are newer than the tail of statistics.
+
+    Parameters
+    ----------
+        dataset: xarray.Dataset
+            Dataset of the station, that continues the record
+            summarized in statistics (see is_continuation).
+        statistics: xarray.Dataset
+            Statistics of the previous record (see level1_statistics).
+        config: dict
+            Settings loaded from the configuration file (config.toml).
+
+    Returns
+    -------
+        new_rows: xarray.Dataset
+            Values and flags of the time steps whose flags changed:
+            the last one of the previous record and the new ones.
+        statistics: xarray.Dataset
+            Updated statistics.
+    """
+    overlap = len(statistics['tail_time'])
+    transform = level1_parameters(config)['transform']
+    block = dataset.sel(time=slice(statistics['tail_time'].values[0], None))
+    months = qct.month_index(block)
+    moments = OrderedDict()
+    new_statistics = xr.Dataset(coords={
+            'month': statistics['month'].values,
+            'tail_time': block['time'].values[-overlap:]})
+
+    for var in block.data_vars:
+        values = block[var].values.astype('float')
+        moments[var] = OrderedDict()
+
+        for name, series in scored_series(values, transform).items():
+            # The first new position to add to the statistics is the
+            # last one of the previous record.
+            added = qct.group_moments(
+                    series[overlap - 1:-1], months[overlap - 1:-1])
+            last = qct.group_moments(series[-1:], months[-1:])
+            persisted = [i + j for i, j in zip(
+                    stored_moments(statistics, var, name), added)]
+            moments[var][name] = [i + j for i, j in zip(persisted, last)]
+
+            for moment, value in zip(MOMENTS, persisted):
+                new_statistics['_'.join([var, name, moment])] = (
+                        'month', value)
+
+        new_statistics[var + '_tail'] = ('tail_time', values[-overlap:])
+
+    new_statistics.attrs[RECORD_HASH_ATTR] = record_hash(
+            dataset, new_statistics['tail_time'].values[0])
+    flags = run_level1(dataset=block, config=config, moments=moments)
+    new_rows = block.merge(flags).isel(time=slice(overlap - 1, None))
+    return(new_rows, new_statistics)
+
+
+def write_dataset(dataset, output_file, encoding=None):
+    """Writes a dataset to a NetCDF file through a temporary file."""
+    temporary_file = str(output_file) + '.part'
+    dataset.to_netcdf(temporary_file, encoding=encoding)
+    os.replace(temporary_file, str(output_file))
+
+
+def run_incremental(dataset, output_file, config):
+    """Performs the level 1 tests of a station dataset, reusing its
+    previous output. If the output and its statistics exist and the
+    dataset continues the previous record, only the new rows are
+    tested and appended to the output; otherwise (or if the output was
+    written with other settings; see pipeline.settings_hash), the whole
+    record is tested (as in pipeline.run_level1). The temporal outlier
+    test and the z-score tests standardized without moments (see
+    pipeline.moment_scoring) are not incremental, so they always lead
+    to a test of the whole record.
+
+    Parameters
+    ----------
+        dataset: xarray.Dataset
+            Dataset of the station (the whole record).
+        output_file: string
+            The full path of the output NetCDF file of the station.
+        config: dict
+            Settings loaded from the configuration file (config.toml).
+
+    Returns
+    -------
+        xarray.Dataset
+            The output dataset (values and flags, packed as set in the
+            [output] section; see flags.pack_flags), as written to
+            output_file.
+    """
+    output_file = Path(output_file)
+    statistics_file = statistics_path(output_file)
+    packed = output_parameters(config)['packed_flags']
+    with_moments = moment_scoring(level1_parameters(config))
+    output = None
+
+    if (output_file.exists() and statistics_file.exists() and
+            with_moments and
+            not config['level_1_tests'].get('tmp_outlier_test')):
+        with xr.open_dataset(str(statistics_file)) as stored:
+            statistics = stored.load()
+
+        if (len(statistics['tail_time']) == overlap_length(config) and
+                is_continuation(dataset, statistics)):
+            new_rows, statistics = update_level1(dataset, statistics, config)
+
+            if packed:
+                new_rows = pack_flags(new_rows)
+
+            first_time = new_rows['time'].values[0]
+
+            with xr.open_dataset(str(output_file)) as previous:
+                previous = previous.isel(
+                        time=previous['time'].values < first_time).load()
+
+            # If the settings changed, the whole record is tested.
+            if previous.attrs.get(SETTINGS_ATTR) == settings_hash(config):
+                output = xr.concat([previous, new_rows], dim='time')
+                output.attrs = dataset.attrs
+
+    if output is None:
+        output = dataset.merge(run_level1(dataset=dataset, config=config))
+        statistics = (
+                level1_statistics(dataset, config) if with_moments
+                else None)
+
+        if packed:
+            output = pack_flags(output)
+
+    output.attrs[SETTINGS_ATTR] = settings_hash(config)
+    write_dataset(output, output_file, output_encoding(output, config))
+
+    if statistics is not None:
+        write_dataset(statistics, statistics_file)
+
+    return(output)
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""Quality control routines. Cache of the parsed station files.
+
+The dataset returned by a reader of data_manager (see READERS) is saved
+as a bundle of .npy files, one per variable plus the time index, and a
+JSON file with the attributes. A later run over the same file maps the
+arrays into memory (numpy.load with mmap_mode) instead of parsing the
+text again. An entry is named after the path of the file and a key of
+its modification time, size and reader version; an entry of the same
+path with another key is stale and is removed. The least recently used
+entries are evicted once the cache exceeds its size.
+
+Author
+------
+    Roberto A. Real-Rangel (Institute of Engineering UNAM; Mexico)
+
+License
+-------
+    GNU General Public License
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import shutil
+
+from pathlib2 import Path
+import numpy as np
+import xarray as xr
+
+from . import data_manager as dmgr
+
+# Changing the layout of the entries invalidates the cache.
+CACHE_FORMAT = '1'
+METADATA_FILE = 'dataset.json'
+DEFAULT_CACHE = OrderedDict([
+        ('dir', ''),
+        ('max_size', 2 ** 30)])
+
+
+def cache_parameters(config):
+    """Parameters of the parse cache, taken from the [cache] section of
+    the configuration (if any) and completed with DEFAULT_CACHE.
+    """
+    parameters = DEFAULT_CACHE.copy()
+    parameters.update(config.get('cache', {}))
+    return(parameters)
+
+
+def _digest(text):
+    return(hashlib.sha1(text.encode()).hexdigest()[:16])
+
+
+def _json_value(value):
+    """Converts the numpy scalars of the attributes to Python values."""
+    return(value.item() if hasattr(value, 'item') else str(value))
+
+
+def file_key(input_file, reader):
+    """Key of the contents of a station file, from its modification
+    time, size and reader version (see data_manager.READER_VERSIONS),
+    which is computed without reading the file.
+    """
+    stat = Path(input_file).stat()
+    return('|'.join([
+            str(stat.st_mtime_ns), str(stat.st_size), reader,
+            dmgr.READER_VERSIONS[reader]]))
+
+
+def save_bundle(dataset, directory):
+    """Saves a station dataset (with a single 'time' dimension) as a
+    bundle of .npy files and its attributes to a JSON file.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True)
+    np.save(str(directory / 'time.npy'), dataset['time'].values)
+
+    for position, var in enumerate(dataset.data_vars):
+        np.save(
+                str(directory / '{}.npy'.format(position)),
+                np.ascontiguousarray(dataset[var].values))
+
+    metadata = OrderedDict([
+            ('format', CACHE_FORMAT),
+            ('attrs', dataset.attrs),
+            ('variables', [
+                    OrderedDict([('name', var), ('attrs', dataset[var].attrs)])
+                    for var in dataset.data_vars])])
+
+    with open(str(directory / METADATA_FILE), 'w') as f:
+        json.dump(metadata, f, default=_json_value)
+
+
+def load_bundle(directory):
+    """Loads a bundle saved with save_bundle. The arrays of the
+    variables are memory-mapped (read-only).
+    """
+    directory = Path(directory)
+
+    with open(str(directory / METADATA_FILE)) as f:
+        metadata = json.load(f, object_pairs_hook=OrderedDict)
+
+    if metadata['format'] != CACHE_FORMAT:
+        raise ValueError("Unsupported cache format.")
+
+    dataset = xr.Dataset(
+            data_vars=OrderedDict([
+                    (var['name'], xr.Variable(
+                            ['time'],
+                            np.load(
+                                    str(directory / '{}.npy'.format(position)),
+                                    mmap_mode='r'),
+                            attrs=var['attrs']))
+                    for position, var in enumerate(metadata['variables'])]),
+            coords={'time': np.load(str(directory / 'time.npy'))})
+    dataset.attrs = metadata['attrs']
+    return(dataset)
+
+
+def bundle_size(directory):
+    """Size of the files of a bundle, in bytes."""
+    return(sum(i.stat().st_size for i in Path(directory).iterdir()))
+
+
+class ParseCache(object):
+    """ Directory of parsed station files (bundles of .npy files), with
+    least-recently-used eviction once the size of the bundles exceeds
+    max_size. The cache can be shared by several processes (e.g., the
+    workers of batch.run_batch): a bundle removed by another process
+    while it is used is treated as not cached.
+
+    Parameters
+    ----------
+        directory: string
+            The full path of the cache directory. It is created if it
+            does not exist.
+        max_size: integer (default is 1 GiB)
+            Maximum size of the cache, in bytes.
+    """
+    def __init__(self, directory, max_size=DEFAULT_CACHE['max_size']):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+
+    def path(self, input_file, reader):
+        """Path of the bundle of a station file. It is named after the
+        full path of the file, and its modification time, size and
+        reader version.
+        """
+        input_file = Path(input_file).resolve()
+        key = '|'.join([file_key(input_file, reader), CACHE_FORMAT])
+        return(self.directory / '-'.join([
+                _digest(str(input_file)), _digest(key)]))
+
+    def get(self, cached):
+        """Loads a bundle, or returns None if it is not cached (or it
+        cannot be read).
+        """
+        if not cached.exists():
+            return(None)
+
+        try:
+            dataset = load_bundle(cached)
+
+        except (IOError, OSError, ValueError, KeyError):
+            shutil.rmtree(str(cached), ignore_errors=True)
+            return(None)
+
+        # The modification time of the metadata records the last use.
+        # The arrays stay mapped if the bundle is evicted meanwhile.
+        try:
+            os.utime(str(cached / METADATA_FILE), None)
+
+        except OSError:
+            pass
+
+        return(dataset)
+
+    def put(self, dataset, cached):
+        """Saves a bundle, replacing the stale bundles of the same file,
+        and evicts the least recently used ones if the cache exceeds
+        its size.
+        """
+        prefix = cached.name.split('-')[0] + '-'
+
+        for stale in self.directory.glob(prefix + '*'):
+            if stale != cached and not stale.name.endswith('.part'):
+                shutil.rmtree(str(stale), ignore_errors=True)
+
+        # Every process writes to its own temporary directory.
+        temporary_dir = self.directory / '{}.{}.part'.format(
+                cached.name, os.getpid())
+        shutil.rmtree(str(temporary_dir), ignore_errors=True)
+        save_bundle(dataset, temporary_dir)
+
+        try:
+            os.rename(str(temporary_dir), str(cached))
+
+        # Another process has just saved the same bundle.
+        except OSError:
+            shutil.rmtree(str(temporary_dir), ignore_errors=True)
+
+        self.evict(keep=cached)
+
+    def evict(self, keep=None):
+        """Removes the least recently used bundles until the size of
+        the cache is below max_size.
+        """
+        bundles = []
+
+        for i in self.directory.iterdir():
+            if not i.is_dir() or i.name.endswith('.part'):
+                continue
+
+            # Bundles being written or removed by another process.
+            try:
+                bundles.append((
+                        (i / METADATA_FILE).stat().st_mtime,
+                        bundle_size(i), i))
+
+            except OSError:
+                continue
+
+        bundles.sort(key=lambda x: x[0])
+        size = sum(i[1] for i in bundles)
+
+        for _, size_of_bundle, cached in bundles:
+            if size <= self.max_size:
+                break
+
+            if cached != keep:
+                shutil.rmtree(str(cached), ignore_errors=True)
+                size -= size_of_bundle
+
+    def read(self, input_file, reader='bdcn'):
+        """Dataset of a station file, loaded from the cache or read
+        (and cached) if it is not there or it is stale.
+
+        Parameters
+        ----------
+            input_file: string
+                The full path of the station file.
+            reader: string (default is 'bdcn')
+                Reader of the file (see data_manager.READERS).
+        """
+        cached = self.path(input_file, reader)
+        dataset = self.get(cached)
+
+        if dataset is None:
+            dataset = dmgr.READERS[reader](input_file)
+            self.put(dataset, cached)
+
+        return(dataset)
+
+
+def read_station(input_file, reader, config):
+    """Reads a station file through the cache set in the [cache]
+    section of the configuration (dir and, optionally, max_size) or,
+    if it is not configured, with the reader itself.
+    """
+    parameters = cache_parameters(config)
+
+    if not parameters['dir']:
+        return(dmgr.READERS[reader](input_file))
+
+    cache = ParseCache(
+            directory=parameters['dir'], max_size=parameters['max_size'])
+    return(cache.read(input_file, reader))
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""Quality control routines. Level 1 pipeline.
+
+Author
+------
+    Roberto A. Real-Rangel (Institute of Engineering UNAM; Mexico)
+
+License
+-------
+    GNU General Public License
+"""
+from collections import OrderedDict
+import hashlib
+import json
+
+import numpy as np
+import xarray as xr
+
+from . import quality_control_tests as qct
+from .flags import output_parameters
+from .telemetry import instrument
+
+DEFAULT_PARAMETERS = OrderedDict([
+        ('threshold', 4.89164),
+        ('value_tolerance', 0.0),
+        ('repetitions_tolerance', 2),
+        ('skipzero', True),
+        ('c', 7.5),
+        ('transform', 'log'),
+        ('robust', False)])
+
+# Attribute of the output files with the hash of the settings that
+# produced their flags (see settings_hash).
+SETTINGS_ATTR = 'qc_settings_hash'
+
+
+def level1_parameters(config):
+    """Parameters of the level 1 tests, taken from the
+    [level_1_parameters] section of the configuration (if any) and
+    completed with DEFAULT_PARAMETERS.
+
+    Parameters
+    ----------
+        config: dict
+            Settings loaded from the configuration file (config.toml).
+    """
+    parameters = DEFAULT_PARAMETERS.copy()
+    parameters.update(config.get('level_1_parameters', {}))
+    return(parameters)
+
+
+def settings_hash(config):
+    """Hash (SHA-1) of the settings that determine the flags of the
+    output files: the enabled level 1 tests, their parameters and
+    whether the flags are packed. Saved in the SETTINGS_ATTR attribute
+    of the outputs, it tells if an output is stale after a change of
+    the configuration.
+
+    Parameters
+    ----------
+        config: dict
+            Settings loaded from the configuration file (config.toml).
+    """
+    settings = OrderedDict([
+            ('level_1_tests', sorted(
+                    test for test, enabled
+                    in config.get('level_1_tests', {}).items() if enabled)),
+            ('level_1_parameters', level1_parameters(config)),
+            ('packed_flags', output_parameters(config)['packed_flags'])])
+    return(hashlib.sha1(
+            json.dumps(settings, sort_keys=True).encode()).hexdigest())
+
+
+def moment_scoring(parameters):
+    """Test if the z-score tests standardize the scored series with
+    their monthly moments (see series_moments), i.e., if they are
+    transformed value by value ('log' or 'log1p') and not robustly.
+    Otherwise, the moments of a previous run (e.g., a cached
+    climatology or the statistics of the incremental tests) cannot be
+    reused.
+
+    Parameters
+    ----------
+        parameters: dict
+            Parameters of the level 1 tests (see level1_parameters).
+    """
+    return(parameters['transform'] in qct.ELEMENTWISE_TRANSFORMS and
+           not parameters['robust'])
+
+
+def spikes_magnitude(values):
+    """Absolute difference between every value and the mean of its two
+    adjacent values (see quality_control_tests.spikes_data_test). Zero
+    spikes are set to NaN.
+    """
+    return(qct.spike_values(values, qct.spike_weights()))
+
+
+def change_rate_magnitude(values):
+    """Absolute difference between every value and the previous one
+    (see quality_control_tests.change_rate_test). Zero changes are set
+    to NaN.
+    """
+    return(qct.change_rate_values(values))
+
+
+def magnitude_series(values):
+    """Series tested by the z-score tests, before their scoring
+    transform: the values ('values'), magnitude of spikes ('spikes')
+    and magnitude of changes ('change_rate').
+
+    Parameters
+    ----------
+        values: numpy.ndarray
+            Values of the time series, or of several time series with
+            the time along the last dimension (e.g., variable x time).
+    """
+    return(OrderedDict([
+            ('values', values),
+            ('spikes', spikes_magnitude(values)),
+            ('change_rate', change_rate_magnitude(values))]))
+
+
+def scored_series(values, transform='log'):
+    """Series standardized by the z-score tests (see magnitude_series),
+    transformed by the natural logarithm ('log') or the logarithm of
+    the values plus one ('log1p'). Zeros and negative values are set to
+    NaN (see quality_control_tests.log_values).
+
+    Parameters
+    ----------
+        values: numpy.ndarray
+            Values of the time series, or of several time series with
+            the time along the last dimension (e.g., variable x time).
+        transform: string (default is 'log')
+            'log' or 'log1p'.
+    """
+    return(OrderedDict([
+            (name, qct.log_values(series, transform))
+            for name, series in magnitude_series(values).items()]))
+
+
+def stack_variables(dataset):
+    """Values of the variables of a station dataset, stacked in a
+    (variable x time) array of floats.
+    """
+    return(np.stack([
+            dataset[var].values.astype('float')
+            for var in dataset.data_vars]))
+
+
+def stacked_moments(series, months):
+    """Monthly moments of the scored series of several variables (see
+    scored_series), reduced at once. Every moment is a (variable x
+    month) array.
+    """
+    return(OrderedDict([
+            (name, qct.group_moments(values, months))
+            for name, values in series.items()]))
+
+
+def stack_moments(moments, variables):
+    """Stacks the moments of every variable (see series_moments) as
+    returned by stacked_moments.
+    """
+    return(OrderedDict([
+            (name, tuple(
+                    np.stack([moments[var][name][i] for var in variables])
+                    for i in range(3)))
+            for name in moments[variables[0]]]))
+
+
+def series_moments(dataset, months=None, transform='log'):
+    """Monthly count, sum and sum of squares of the scored series (see
+    scored_series, with the given transform) of every variable of a
+    dataset.
+
+    Returns
+    -------
+        dict
+            For every variable, a dict with the moments of each scored
+            series (see quality_control_tests.group_moments).
+    """
+    if months is None:
+        months = qct.month_index(dataset)
+
+    moments = stacked_moments(
+            scored_series(stack_variables(dataset), transform), months)
+    return(OrderedDict([
+            (var, OrderedDict([
+                    (name, tuple(i[row] for i in moments[name]))
+                    for name in moments]))
+            for row, var in enumerate(dataset.data_vars)]))
+
+
+@instrument
+def run_level1(dataset, config, moments=None):
+    """Performs all the enabled level 1 tests over every variable of a
+    station dataset in a single pass.
+
+    The variables are stacked in a (variable x time) array, so the
+    month of every time step and the monthly statistics of the scored
+    series of all the variables are computed once; the statistics of
+    the log-transformed values are shared by the gross range and
+    climatology tests. The scoring transform and the robust
+    standardization are set by the transform and robust parameters (see
+    quality_control_tests.zscore_check). The results are the same as
+    those of the individual functions of quality_control_tests.
+
+    Parameters
+    ----------
+        dataset: xarray.Dataset
+            Dataset of the station. Every data variable is tested.
+        config: dict
+            Settings loaded from the configuration file (config.toml).
+            The tests to perform are enabled in the [level_1_tests]
+            section and their parameters are optionally set in the
+            [level_1_parameters] section.
+        moments: dict (optional)
+            Monthly moments used to standardize the scored series (see
+            series_moments and moment_scoring). By default, they are
+            computed from the dataset.
+
+    Returns
+    -------
+        xarray.Dataset
+            Boolean flags of every test, named as the variable plus
+            the name of the test (e.g., 'prec_climatology_test').
+    """
+    tests = config['level_1_tests']
+    parameters = level1_parameters(config)
+    threshold = parameters['threshold']
+    qct.check_threshold(
+            threshold, parameters['transform'], dataset.sizes['time'])
+    variables = list(dataset.data_vars)
+    months = qct.month_index(dataset)
+    flags = xr.Dataset(coords={'time': dataset['time']})
+
+    if moment_scoring(parameters):
+        series = scored_series(
+                stack_variables(dataset), parameters['transform'])
+
+        if moments is None:
+            moments = stacked_moments(series, months)
+
+        else:
+            moments = stack_moments(moments, variables)
+
+        def zscores(name, climatology=True):
+            if climatology:
+                mean, std = qct.moments_stats(*moments[name])
+                return((series[name] - mean[:, months]) / std[:, months])
+
+            mean, std = qct.moments_stats(*[
+                    i.sum(axis=-1, keepdims=True) for i in moments[name]])
+            return((series[name] - mean) / std)
+
+    elif moments is not None:
+        raise ValueError(
+                "The moments of a previous run can only standardize series "
+                "scored by the logarithm ('log' or 'log1p') and not "
+                "robustly.")
+
+    else:
+        series = magnitude_series(stack_variables(dataset))
+
+        def zscores(name, climatology=True):
+            return(np.stack([
+                    qct.transformed_zscores(
+                            values, months,
+                            transform=parameters['transform'],
+                            robust=parameters['robust'],
+                            climatology=climatology)
+                    for values in series[name]]))
+
+    # Flags of every z-score test, as (variable x time) arrays.
+    zscore_flags = OrderedDict()
+
+    with np.errstate(invalid='ignore'):
+        if tests.get('gross_range_test'):
+            zscore_flags['gross_range_test'] = qct.exceedance(
+                    scores=zscores('values', climatology=False),
+                    threshold=threshold)
+
+        if tests.get('climatology_test'):
+            zscore_flags['climatology_test'] = qct.exceedance(
+                    scores=zscores('values'),
+                    threshold=threshold)
+
+        if tests.get('spikes_data_test'):
+            zscore_flags['spikes_data_test'] = qct.exceedance(
+                    scores=zscores('spikes'),
+                    threshold=threshold,
+                    left_tail=False)
+
+        if tests.get('change_rate_test'):
+            zscore_flags['change_rate_test'] = qct.exceedance(
+                    scores=zscores('change_rate'),
+                    threshold=threshold,
+                    left_tail=False)
+
+    for row, var in enumerate(variables):
+        for test, test_flags in zscore_flags.items():
+            flags['_'.join([var, test])] = ('time', test_flags[row])
+
+        if tests.get('flat_series_test'):
+            flags[var + '_flat_series_test'] = qct.flat_series_test(
+                    input_ts=dataset[var],
+                    value_tolerance=parameters['value_tolerance'],
+                    repetitions_tolerance=parameters[
+                            'repetitions_tolerance'],
+                    skipzero=parameters['skipzero'])
+
+        if tests.get('tmp_outlier_test'):
+            flags[var + '_tmp_outlier_test'] = qct.tmp_outlier_test(
+                    input_ts=dataset[var],
+                    c=parameters['c'],
+                    threshold=threshold)
+
+    return(flags)
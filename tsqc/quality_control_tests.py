@@ -4,25 +4,161 @@ Created on Mon Feb 11 18:54:16 2019
 
 @author: r.realrangel
 """
+from collections import OrderedDict
+
 import numpy as np
 import xarray as xr
 
+from .statistical_tables import normal_ppf
+from .telemetry import instrument
+from .time_axis import pad_time
+
+# Day of the year in which each month starts in a leap year.
+LEAP_YEAR_MONTH_START = np.array(
+        [0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335])
+
+# Scoring transforms of the z-score tests (those applied value by value
+# first), the lambdas among which the Box-Cox one is fitted (not
+# negative, since a negative lambda bounds the transform at -1 / lambda
+# and so caps the scores of the outliers), and the factors that make
+# the median absolute deviation (MAD), the interquartile range and the
+# mean absolute deviation consistent estimators of the standard
+# deviation.
+TRANSFORMS = ['log', 'log1p', 'boxcox', 'rank']
+ELEMENTWISE_TRANSFORMS = ['log', 'log1p']
+BOXCOX_LAMBDAS = np.round(np.linspace(0, 2, 21), 1)
+MAD_SCALE = 1.4826
+IQR_SCALE = 1.349
+MEAN_DEVIATION_SCALE = np.sqrt(np.pi / 2)
+
+
+def normal(input_ts, transform='log'):
+    """ Logarithm of the positive values of a time series ('log') or of
+    those values plus one ('log1p'; see log_values). Zeros and negative
+    values are set to NaN, so they do not contaminate the statistics of
+    the z-score tests.
+    """
+    return(xr.apply_ufunc(
+            log_values, input_ts,
+            dask='parallelized',
+            output_dtypes=['float'],
+            kwargs={'transform': transform}))
+
+
+def log_values(values, transform='log'):
+    """ Numpy implementation of normal: the natural logarithm of the
+    positive values ('log') or the logarithm of the positive values
+    plus one ('log1p'). Zeros are left out with both transforms, so the
+    location and scale of a zero-inflated series (e.g., precipitation)
+    are those of its positive values, however many zeros it has.
+    Non-finite results are set to NaN.
+    """
+    values = np.asarray(values, dtype='float')
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if transform == 'log':
+            transformed = np.log(np.where(values > 0, values, np.nan))
+
+        elif transform == 'log1p':
+            transformed = np.log1p(np.where(values > 0, values, np.nan))
+
+        else:
+            raise ValueError(
+                    "Unknown transform '{}'. Available transforms are: {}."
+                    .format(transform, ', '.join(ELEMENTWISE_TRANSFORMS)))
 
-def normal(input_ts):
-    return(xr.ufuncs.log(input_ts))
+    transformed[~np.isfinite(transformed)] = np.nan
+    return(transformed)
+
+
+def check_transform(transform):
+    """ Raises a ValueError if transform is not one of TRANSFORMS. """
+    if transform not in TRANSFORMS:
+        raise ValueError(
+                "Unknown transform '{}'. Available transforms are: {}."
+                .format(transform, ', '.join(TRANSFORMS)))
 
 
 def standard(input_ts):
-    return((input_ts - input_ts.mean()) / input_ts.std())
+    return((input_ts - input_ts.mean(dim='time')) / input_ts.std(dim='time'))
+
+
+def monthly_standard(input_ts):
+    """ Standardizes every value of a time series with the mean and
+    (population) standard deviation of its month. Every station of a
+    cube is standardized independently and dask-backed inputs stay
+    lazy (see along_time).
+
+    Parameters
+    ----------
+        input_ts: xarray.DataArray
+            Time series (or cube with a 'time' dimension) of the
+            interest variable.
+    """
+    return(along_time(
+            monthly_zscores, input_ts, 'float', vectorize=False,
+            months=month_index(input_ts)))
+
+
+def monthly_zscores(values, months):
+    """ Numpy implementation of monthly_standard over an array with the
+    time along its last dimension (e.g., variable x time), with the
+    month of every time step given by month_index. The statistics of
+    all the rows are reduced at once (see group_index).
+    """
+    valid = ~np.isnan(values)
+    shape = values.shape[:-1] + (12, )
+    index = group_index(values.shape, months)[valid]
+
+    def monthly_sum(weights=None):
+        return(np.bincount(
+                index, weights=weights, minlength=np.prod(shape)).reshape(
+                        shape))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        count = monthly_sum()
+        mean = monthly_sum(values[valid]) / count
+        anomalies = values - mean[..., months]
+        std = np.sqrt(monthly_sum(anomalies[valid] ** 2) / count)
+        return(anomalies / std[..., months])
+
+
+def standardize(input_ts, name='values', climatology=True, reference=None):
+    """ Standardized scores of a scored series (e.g., normal(input_ts)).
+
+    Parameters
+    ----------
+        input_ts: xarray.DataArray
+            Scored series (e.g., variable x time).
+        name: string (default is 'values')
+            Name of the scored series in reference ('values', 'spikes'
+            or 'change_rate').
+        climatology: boolean (default is True)
+            Flag to specify wether to standardize with the statistics
+            of the whole time series or month by month.
+        reference: climatology.Climatology (optional)
+            Statistics used to standardize the series. By default, they
+            are computed from input_ts.
+    """
+    if reference is not None:
+        return(reference.zscores(input_ts, name, climatology))
+
+    elif climatology:
+        return(monthly_standard(input_ts))
+
+    else:
+        return(standard(input_ts))
 
 
-def zscore_check(input_ts, threshold, left_tail=True, right_tail=True):
+def zscore_check(input_ts, threshold, left_tail=True, right_tail=True,
+                 transform='log', robust=False, climatology=False):
     """ Test that data point exceeds min/max.
 
     Parameters
     ----------
         input_ts: xarray.DataArray
-            Time series of the interest variable.
+            Time series of the interest variable, or cube of time
+            series (e.g., station x time), possibly dask-backed.
         threshold: float
             A threshold value to identifie outliers. It represents the
             deviation of the data point expressed as the number of
@@ -44,6 +180,25 @@ def zscore_check(input_ts, threshold, left_tail=True, right_tail=True):
               100000       0.000010        4.26489        4.41717
              1000000       0.000001        4.75342        4.89164
             -----------------------------------------------------
+        left_tail, right_tail: boolean (default is True)
+            Tails of the distribution in which outliers are sought.
+        transform: string (default is 'log')
+            Scoring transform (see transform_values): 'log', 'log1p',
+            'boxcox' (with a lambda fitted for every month, or for the
+            whole time series if climatology is False) or 'rank'
+            (normal scores of the ranks, which are not standardized
+            again). The 'rank' scores are capped, e.g., at 3.29 for
+            1000 values or 3.89 for 10000 (see rank_score_cap), so the
+            threshold must be below the cap.
+        robust: boolean (default is False)
+            Flag to specify wether to standardize with the median and
+            the MAD instead of the mean and the standard deviation (see
+            robust_zscores for months whose MAD is zero). For flashy
+            series (e.g., streamflow), it gives robust scores without
+            the cost of tmp_outlier_test.
+        climatology: boolean (default is False)
+            Flag to specify wether to standardize with the statistics
+            of the whole time series or month by month.
 
     Reference
     ---------
@@ -57,26 +212,347 @@ def zscore_check(input_ts, threshold, left_tail=True, right_tail=True):
             Assurance for Stream Flow Observations in Rivers and
             Streams.
     """
-    lt = standard(normal(input_ts)) < -threshold
-    rt = standard(normal(input_ts)) > threshold
+    check_transform(transform)
+    check_threshold(threshold, transform, input_ts.sizes['time'])
+    return(exceedance(
+            scores=along_time(
+                    transformed_zscores, input_ts, 'float',
+                    months=month_index(input_ts),
+                    transform=transform,
+                    robust=robust,
+                    climatology=climatology),
+            threshold=threshold,
+            left_tail=left_tail,
+            right_tail=right_tail))
+
+
+def transformed_zscores(values, months, transform='log', robust=False,
+                        climatology=False):
+    """ Numpy implementation of the scores of zscore_check over a 1D
+    array. Zeros, negative values and infinities that the transform
+    cannot score are treated as missing values, so they do not
+    contaminate the statistics (see log_values); the ranks are those of
+    all the finite values.
+    """
+    groups = months if climatology else np.zeros_like(months)
+
+    if transform == 'rank':
+        return(rank_zscores(values, groups))
+
+    transformed = transform_values(values, groups, transform)
+
+    if robust:
+        return(robust_zscores(transformed, groups))
+
+    return(monthly_zscores(transformed, groups))
+
+
+def transform_values(values, groups, transform='log'):
+    """ Applies a scoring transform to the positive values of a 1D
+    array: the natural logarithm ('log'), the logarithm of the values
+    plus one ('log1p'), or the Box-Cox transform of the values plus
+    one, with the lambda of every group (e.g., month) fitted by maximum
+    likelihood ('boxcox'; see boxcox_lambdas). Zeros, negative values
+    and non-finite results are set to NaN (see log_values).
+    """
+    if transform != 'boxcox':
+        return(log_values(values, transform))
+
+    log1p_values = log_values(values, 'log1p')
+    lambdas = boxcox_lambdas(log1p_values, groups)[groups]
 
+    with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+        transformed = np.where(
+                lambdas == 0, log1p_values,
+                np.expm1(lambdas * log1p_values) / lambdas)
+
+    transformed[~np.isfinite(transformed)] = np.nan
+    return(transformed)
+
+
+def boxcox_lambdas(log_values, months, lambdas=BOXCOX_LAMBDAS):
+    """ Lambda of the Box-Cox transform of every month, the one (among
+    lambdas) that maximizes the profile log-likelihood of the
+    transformed values. All the lambdas are evaluated at once, as the
+    rows of a (lambda x time) array (see group_index). Months with
+    fewer than three values keep lambda = 1.
+
+    Parameters
+    ----------
+        log_values: numpy.ndarray
+            Logarithm of the (positive) values of the time series.
+        months: numpy.ndarray
+            Month (see month_index), or other group from 0 to 11, of
+            every value.
+        lambdas: numpy.ndarray (default is BOXCOX_LAMBDAS)
+            Candidate lambdas.
+    """
+    valid = np.isfinite(log_values)
+    log_values = log_values[valid]
+    months = months[valid]
+    lam = lambdas[:, np.newaxis]
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        transformed = np.where(
+                lam == 0, log_values, np.expm1(lam * log_values) / lam)
+        count = np.bincount(months, minlength=12)
+        index = group_index(transformed.shape, months).ravel()
+        size = len(lambdas) * 12
+        mean = np.bincount(
+                index, weights=transformed.ravel(), minlength=size).reshape(
+                        len(lambdas), 12) / count
+        anomalies = transformed - mean[:, months]
+        variance = np.bincount(
+                index, weights=(anomalies ** 2).ravel(),
+                minlength=size).reshape(len(lambdas), 12) / count
+        likelihood = (
+                -0.5 * count * np.log(variance) +
+                (lam - 1) * np.bincount(
+                        months, weights=log_values, minlength=12))
+
+    likelihood[~np.isfinite(likelihood)] = -np.inf
+    fitted = lambdas[np.argmax(likelihood, axis=0)]
+    fitted[(count < 3) | np.isinf(likelihood.max(axis=0))] = 1.0
+    return(fitted)
+
+
+def group_medians(values, groups, n_groups=12):
+    """ Median of the non-missing values of each group of a time
+    series (see group_quantiles).
+    """
+    return(group_quantiles(values, groups, 0.5, n_groups))
+
+
+def group_quantiles(values, groups, q, n_groups=12):
+    """ Quantile q (linearly interpolated, as numpy.quantile) of the
+    non-missing values of each group of a time series, from a single
+    sort of the values by group and value.
+    """
+    valid = ~np.isnan(values)
+    values = values[valid]
+    groups = groups[valid]
+    values = values[np.lexsort((values, groups))]
+    count = np.bincount(groups, minlength=n_groups)
+    start = np.cumsum(count) - count
+    quantiles = np.full(n_groups, np.nan)
+    has_values = count > 0
+    position = q * (count[has_values] - 1)
+    lower = np.floor(position).astype('int')
+    upper = np.ceil(position).astype('int')
+    weight = position - lower
+    quantiles[has_values] = (
+            (1 - weight) * values[start[has_values] + lower] +
+            weight * values[start[has_values] + upper])
+    return(quantiles)
+
+
+def robust_zscores(values, groups):
+    """ Standardizes a 1D array with the median and the (scaled) median
+    absolute deviation of the group of every value. In the groups where
+    more than half of the values are equal (e.g., a coarsely rounded
+    series), the MAD is zero, so the scale falls back to
+    the (scaled) interquartile range, then to the (scaled) mean
+    absolute deviation from the median and, lastly, to the standard
+    deviation. The groups without any deviation are not scored.
+    """
+    medians = group_medians(values, groups)
+    deviation = np.abs(values - medians[groups])
+    scale = MAD_SCALE * group_medians(deviation, groups)
+    fallbacks = [
+            lambda: (group_quantiles(values, groups, 0.75) -
+                     group_quantiles(values, groups, 0.25)) / IQR_SCALE,
+            lambda: MEAN_DEVIATION_SCALE * moments_stats(
+                    *group_moments(deviation, groups))[0],
+            lambda: moments_stats(*group_moments(values, groups))[1]]
+
+    for fallback in fallbacks:
+        degenerate = ~(scale > 0)
+
+        if not degenerate.any():
+            break
+
+        scale[degenerate] = fallback()[degenerate]
+
+    scale[~(scale > 0)] = np.nan
+    return((values - medians[groups]) / scale[groups])
+
+
+def rank_zscores(values, groups):
+    """ Normal scores of the ranks of a 1D array within every group:
+    the standard normal quantile of the plotting position
+    (rank - 0.5) / n of every value. Ties share their mean rank and
+    non-finite values are not scored. The scores of a group of n values
+    are capped (see rank_score_cap).
+    """
+    scores = np.full(values.shape, np.nan)
+    valid = np.flatnonzero(np.isfinite(values))
+
+    if not len(valid):
+        return(scores)
+
+    order = valid[np.lexsort((values[valid], groups[valid]))]
+    sorted_values = values[order]
+    sorted_groups = groups[order]
+    count = np.bincount(sorted_groups)
+    start = np.cumsum(count) - count
+
+    # Runs of ties (same group and value) in the sorted values.
+    breaks = np.flatnonzero(
+            (np.diff(sorted_values) != 0) | (np.diff(sorted_groups) != 0))
+    run_starts = np.concatenate([[0], breaks + 1])
+    run_lengths = np.diff(np.concatenate([run_starts, [len(order)]]))
+    run_starts = np.repeat(run_starts, run_lengths)
+    run_lengths = np.repeat(run_lengths, run_lengths)
+    rank = (run_starts - start[sorted_groups] + (run_lengths + 1) / 2.0)
+    scores[order] = normal_ppf((rank - 0.5) / count[sorted_groups])
+    return(scores)
+
+
+def rank_score_cap(n):
+    """ Largest normal score of the ranks of n values (see rank_zscores),
+    the standard normal quantile of (n - 0.5) / n: e.g., 3.29 for 1000
+    values, 3.89 for 10000 and 4.42 for 100000. No score of the 'rank'
+    transform reaches a threshold at or above it.
+    """
+    return(float(normal_ppf(np.array([1 - 0.5 / n]))[0]))
+
+
+def check_threshold(threshold, transform, n):
+    """ Raises a ValueError if the transform is 'rank' and the
+    threshold is at or above the cap of the scores of n values (see
+    rank_score_cap), i.e., if no value could be flagged.
+
+    Parameters
+    ----------
+        threshold: float
+            Threshold of the z-score test.
+        transform: string
+            Scoring transform (see zscore_check).
+        n: integer
+            Length of the time series (the largest group of values).
+    """
+    if transform == 'rank' and threshold >= rank_score_cap(n):
+        raise ValueError(
+                "The 'rank' scores of {} values do not exceed {:.5f}, so "
+                "no value can exceed the threshold ({}). Use a lower "
+                "threshold or another transform.".format(
+                        n, rank_score_cap(n), threshold))
+
+
+def exceedance(scores, threshold, left_tail=True, right_tail=True):
+    """ Test that standardized scores exceed a threshold.
+
+    Parameters
+    ----------
+        scores: xarray.DataArray or numpy.ndarray
+            Standardized values of the interest variable.
+        threshold: float
+            A threshold value to identifie outliers (see zscore_check).
+        left_tail, right_tail: boolean
+            Tails of the distribution in which outliers are sought.
+    """
     if left_tail and right_tail:
-        return(lt | rt)
+        return((scores < -threshold) | (scores > threshold))
 
     elif left_tail:
-        return(lt)
+        return(scores < -threshold)
 
     elif right_tail:
-        return(rt)
+        return(scores > threshold)
+
 
+def month_index(input_ts):
+    """ Month of every time step of a time series, numbered from 0
+    (january) to 11 (december). It serves as the grouping index of the
+    climatology versions of the tests.
 
-def range_test(input_ts, threshold=4.89164, climatology=True):
+    Parameters
+    ----------
+        input_ts: xarray.DataArray or xarray.Dataset
+            Time series with a 'time' dimension.
+    """
+    months = input_ts['time'].values.astype('datetime64[M]')
+    return(months.astype('int') % 12)
+
+
+def group_moments(values, groups, n_groups=12):
+    """ Count, sum and sum of squares of the non-missing values of
+    each group of a time series, or of every row of an array of time
+    series (e.g., variable x time).
+
+    Parameters
+    ----------
+        values: numpy.ndarray
+            Values of the time series, with the time along the last
+            dimension.
+        groups: numpy.ndarray
+            Group (e.g., month_index) of every time step.
+        n_groups: integer (default is 12)
+            Number of groups.
+
+    Returns
+    -------
+        count, total, total_sq: numpy.ndarray
+            Moments of every group, with the groups along the last
+            dimension (e.g., variable x month).
+    """
+    valid = ~np.isnan(values)
+    shape = values.shape[:-1] + (n_groups, )
+    index = group_index(values.shape, groups, n_groups)[valid]
+    values = values[valid]
+    count = np.bincount(index, minlength=np.prod(shape))
+    total = np.bincount(index, weights=values, minlength=np.prod(shape))
+    total_sq = np.bincount(
+            index, weights=values ** 2, minlength=np.prod(shape))
+    return(count.reshape(shape), total.reshape(shape),
+           total_sq.reshape(shape))
+
+
+def group_index(shape, groups, n_groups=12):
+    """ Group of every element of an array with the time along its
+    last dimension (e.g., variable x time). The groups of every row
+    are numbered consecutively (row * n_groups + group), so a single
+    numpy.bincount reduces all the rows at once.
+
+    Parameters
+    ----------
+        shape: tuple
+            Shape of the array.
+        groups: numpy.ndarray
+            Group (e.g., month_index) of every time step.
+        n_groups: integer (default is 12)
+            Number of groups.
+    """
+    if len(shape) == 1:
+        return(groups)
+
+    rows = np.arange(np.prod(shape[:-1])).reshape(shape[:-1] + (1, ))
+    return(rows * n_groups + groups)
+
+
+def moments_stats(count, total, total_sq):
+    """ Mean and (population) standard deviation from the count, sum
+    and sum of squares of a sample (see group_moments).
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        std = np.sqrt(np.maximum(total_sq / count - mean ** 2, 0))
+
+    return(mean, std)
+
+
+@instrument
+def range_test(input_ts, threshold=4.89164, climatology=True,
+               reference=None, transform='log', robust=False):
     """ Test that data point exceeds min/max.
 
     Parameters
     ----------
-        input_ts: xarray.DataArray
-            Time series of streamflow (or other variable).
+        input_ts: xarray.DataArray or xarray.Dataset
+            Time series of streamflow (or other variable), or cube of
+            time series (e.g., station x time), possibly dask-backed.
+            The variables of a dataset (or the rows of a variable x
+            time array) are standardized at once.
         threshold: float (default is 4.89164)
             A threshold value to identifie outliers. It represents the
             deviation of the data point expressed as the number of
@@ -87,6 +563,19 @@ def range_test(input_ts, threshold=4.89164, climatology=True):
         climatology: boolean
             Flag to specify wether to perform the test to the whole
             time series (gross test) or month by month (climatology test).
+        reference: climatology.Climatology (optional)
+            Statistics used to standardize the time series (e.g.,
+            those of a previous run, loaded from a ClimatologyCache),
+            or a dict with those of every variable of a dataset. By
+            default, they are computed from input_ts.
+        transform: string (default is 'log')
+            Scoring transform (see zscore_check). With 'rank', the
+            threshold must be below the cap of the scores (see
+            rank_score_cap).
+        robust: boolean (default is False)
+            Flag to specify wether to standardize with the median and
+            the MAD (see zscore_check). Neither the robust scores nor
+            the 'boxcox' and 'rank' transforms accept a reference.
 
     Reference
     ---------
@@ -100,24 +589,28 @@ def range_test(input_ts, threshold=4.89164, climatology=True):
             Assurance for Stream Flow Observations in Rivers and
             Streams.
     """
-    if climatology:
-        return(input_ts.groupby('time.month').apply(func=zscore_check,
-               threshold=threshold,
-               left_tail=True,
-               right_tail=True).drop('month'))
-
-    else:
-        return(zscore_check(input_ts=input_ts, threshold=threshold))
+    check_threshold(threshold, transform, input_ts.sizes['time'])
+    return(exceedance(
+            scores=series_scores(
+                    input_ts, 'values', climatology, reference,
+                    transform=transform, robust=robust),
+            threshold=threshold))
 
 
-def spikes_data_test(input_ts, threshold=4.89164, climatology=True):
+@instrument
+def spikes_data_test(input_ts, threshold=4.89164, climatology=True,
+                     reference=None, window=3, weights=None,
+                     transform='log', robust=False):
     """Test that data point n-1 exceeds a selected threshold relative
     to the adjacent data point.
 
     Parameters
     ----------
-        input_ts: xarray.DataArray
-            Time series of streamflow (or other variable).
+        input_ts: xarray.DataArray or xarray.Dataset
+            Time series of streamflow (or other variable), or cube of
+            time series (e.g., station x time), possibly dask-backed.
+            The variables of a dataset (or the rows of a variable x
+            time array) are standardized at once.
         threshold: float (default is 4.89164)
             A threshold value to identifie outliers. It represents the
             deviation of the data point expressed as the number of
@@ -125,6 +618,29 @@ def spikes_data_test(input_ts, threshold=4.89164, climatology=True):
             series. The default value (4.89164) guarantees a
             probability of 0.999999 of "normal" values (and a probability
             of 0.0000001 of outliers).
+        reference: climatology.Climatology (optional)
+            Statistics used to standardize the time series (e.g.,
+            those of a previous run, loaded from a ClimatologyCache),
+            or a dict with those of every variable of a dataset. By
+            default, they are computed from input_ts. It holds the
+            statistics of the spikes of the default window, so it
+            cannot be combined with other window or weights.
+        window: integer (default is 3)
+            Number of data points (odd) of the window centered on every
+            data point, whose neighbours define its reference value.
+            E.g., 5 or 7 for hourly data.
+        weights: list (optional)
+            Weights of the data points of the window (the central one
+            is usually zero). By default, the neighbours are weighted
+            alike (see spike_weights).
+        transform: string (default is 'log')
+            Scoring transform (see zscore_check). With 'rank', the
+            threshold must be below the cap of the scores (see
+            rank_score_cap).
+        robust: boolean (default is False)
+            Flag to specify wether to standardize with the median and
+            the MAD (see zscore_check). Neither the robust scores nor
+            the 'boxcox' and 'rank' transforms accept a reference.
 
     Reference
     ---------
@@ -133,34 +649,30 @@ def spikes_data_test(input_ts, threshold=4.89164, climatology=True):
             Assurance for Stream Flow Observations in Rivers and
             Streams.
     """
-    spike_reference_weight = xr.DataArray([0.50, 0.0, 0.50], dims=['window'])
-    spike_reference = input_ts.rolling(time=3, center=True).construct(
-            'window').dot(spike_reference_weight)
-    spikes = abs(input_ts - spike_reference)
-    spikes[spikes == 0] = np.nan
-
-    if climatology:
-        return(spikes.groupby('time.month').apply(
-                func=zscore_check,
-                threshold=threshold,
-                left_tail=False,
-                right_tail=True).drop('month'))
+    if weights is None:
+        weights = spike_weights(window)
 
-    else:
-        return(zscore_check(
-                input_ts=spikes,
-                threshold=threshold,
-                left_tail=False,
-                right_tail=True))
+    check_threshold(threshold, transform, input_ts.sizes['time'])
+    return(exceedance(
+            scores=series_scores(
+                    input_ts, 'spikes', climatology, reference, weights,
+                    transform, robust),
+            threshold=threshold,
+            left_tail=False))
 
 
-def change_rate_test(input_ts, threshold=4.89164, climatology=True):
+@instrument
+def change_rate_test(input_ts, threshold=4.89164, climatology=True,
+                     reference=None, transform='log', robust=False):
     """Excessive rise/fall test.
 
     Parameters
     ----------
-        input_ts: xarray.DataArray
-            Time series of streamflow (or other variable).
+        input_ts: xarray.DataArray or xarray.Dataset
+            Time series of streamflow (or other variable), or cube of
+            time series (e.g., station x time), possibly dask-backed.
+            The variables of a dataset (or the rows of a variable x
+            time array) are standardized at once.
         threshold: float (default is 4.89164)
             A threshold value to identifie outliers. It represents the
             deviation of the data point expressed as the number of
@@ -168,6 +680,19 @@ def change_rate_test(input_ts, threshold=4.89164, climatology=True):
             series. The default value (4.89164) guarantees a
             probability of 0.999999 of "normal" values (and a probability
             of 0.0000001 of outliers).
+        reference: climatology.Climatology (optional)
+            Statistics used to standardize the time series (e.g.,
+            those of a previous run, loaded from a ClimatologyCache),
+            or a dict with those of every variable of a dataset. By
+            default, they are computed from input_ts.
+        transform: string (default is 'log')
+            Scoring transform (see zscore_check). With 'rank', the
+            threshold must be below the cap of the scores (see
+            rank_score_cap).
+        robust: boolean (default is False)
+            Flag to specify wether to standardize with the median and
+            the MAD (see zscore_check). Neither the robust scores nor
+            the 'boxcox' and 'rank' transforms accept a reference.
 
     Reference
     ---------
@@ -181,38 +706,293 @@ def change_rate_test(input_ts, threshold=4.89164, climatology=True):
             the American Water Resources Association, 25(2), 391–399.
             https://doi.org/10.1111/j.1752-1688.1989.tb03076.x
     """
-    change_rate = abs(input_ts.diff(dim='time'))
-    change_rate = change_rate.reindex(time=sorted(input_ts.time.values))
+    check_threshold(threshold, transform, input_ts.sizes['time'])
+    return(exceedance(
+            scores=series_scores(
+                    input_ts, 'change_rate', climatology, reference,
+                    transform=transform, robust=robust),
+            threshold=threshold,
+            left_tail=False))
+
+
+def spike_weights(window=3):
+    """ Weights of a window of data points (odd) that average the
+    neighbours of the central one, e.g., [0.5, 0.0, 0.5].
+    """
+    if window < 3 or window % 2 == 0:
+        raise ValueError(
+                "The window must be an odd number greater than 1.")
+
+    weights = np.full(window, 1.0 / (window - 1))
+    weights[window // 2] = 0.0
+    return(weights)
+
+
+def spikes_series(input_ts, weights=None):
+    """ Magnitude of the spikes of a time series: the absolute
+    difference between every data point and the weighted mean of the
+    window around it (by default, the mean of the adjacent ones; see
+    spikes_data_test). Zero spikes are masked.
+    """
+    if weights is None:
+        weights = spike_weights()
+
+    return(along_time(
+            spike_values, input_ts, 'float', vectorize=False,
+            weights=np.asarray(weights, dtype='float')))
+
+
+def spike_values(values, weights):
+    """ Numpy implementation of spikes_series over an array with the
+    time along its last dimension. The reference of every data point
+    is accumulated from shifted slices of the time series (one per
+    non-zero weight), so no copy of the windows is made. The data
+    points whose window is incomplete have no reference.
+    """
+    half = len(weights) // 2
+    n = values.shape[-1]
+    spikes = np.full(values.shape, np.nan)
+
+    if n <= 2 * half:
+        return(spikes)
+
+    reference = np.zeros(values.shape[:-1] + (n - 2 * half, ))
+    weighted = np.empty(reference.shape)
+
+    for position, weight in enumerate(weights):
+        if weight != 0:
+            np.multiply(
+                    values[..., position:position + n - 2 * half], weight,
+                    out=weighted)
+            reference += weighted
+
+    np.subtract(values[..., half:n - half], reference, out=reference)
+    spikes[..., half:n - half] = np.abs(reference)
+    spikes[spikes == 0] = np.nan
+    return(spikes)
+
+
+def change_rate_series(input_ts):
+    """ Magnitude of the changes of a time series: the absolute
+    difference between every data point and the previous one (see
+    change_rate_test). Zero changes are masked.
+    """
+    return(along_time(
+            change_rate_values, input_ts, 'float', vectorize=False))
+
+
+def change_rate_values(values):
+    """ Numpy implementation of change_rate_series over an array with
+    the time along its last dimension.
+    The first data point, which has no previous one, is padded by
+    position (see time_axis.pad_time).
+    """
+    change_rate = pad_time(np.abs(np.diff(values)), before=1)
     change_rate[change_rate == 0] = np.nan
+    return(change_rate)
 
-    if climatology:
-        return(change_rate.groupby('time.month').apply(
-                func=zscore_check,
-                threshold=threshold,
-                left_tail=False,
-                right_tail=True).drop('month'))
 
-    else:
-        return(zscore_check(
-                input_ts=change_rate,
-                threshold=threshold,
-                left_tail=False,
-                right_tail=True))
+def series_scores(input_ts, name='values', climatology=True, reference=None,
+                  weights=None, transform='log', robust=False):
+    """ Standardized scores of the series tested by the z-score tests:
+    the transformed values ('values'; range_test), the magnitude of
+    spikes ('spikes'; spikes_data_test, with the given weights) or the
+    magnitude of changes ('change_rate'; change_rate_test). The scoring
+    transform and robust standardization are those of zscore_check;
+    the series scored by the logarithm ('log' or 'log1p'; see normal)
+    and not robustly are standardized with their mean and standard
+    deviation (see standardize), the only statistics that a reference
+    holds. A reference holds those of the spikes of the default window
+    (see spike_weights) only. The variables of a dataset are stacked
+    along a 'variable' dimension and scored at once, unless the
+    reference is a dict with the statistics of every variable.
+    """
+    check_transform(transform)
+    moment_scoring = transform in ELEMENTWISE_TRANSFORMS and not robust
+
+    if reference is not None and not moment_scoring:
+        raise ValueError(
+                "A reference can only standardize series scored by the "
+                "logarithm ('log' or 'log1p') and not robustly.")
+
+    # The statistics of a reference are those of the default spikes.
+    if (reference is not None and name == 'spikes' and
+            weights is not None and
+            not np.array_equal(weights, spike_weights())):
+        raise ValueError(
+                "A reference can only standardize the spikes of the "
+                "default window (3 data points, equally weighted "
+                "neighbours).")
+
+    if isinstance(input_ts, xr.Dataset):
+        if reference is not None:
+            return(xr.Dataset(OrderedDict([
+                    (var, series_scores(
+                            input_ts[var], name, climatology, reference[var],
+                            weights, transform, robust))
+                    for var in input_ts.data_vars])))
+
+        return(series_scores(
+                input_ts.to_array(dim='variable'), name, climatology,
+                weights=weights, transform=transform,
+                robust=robust).to_dataset(dim='variable'))
+
+    if name == 'spikes':
+        input_ts = spikes_series(input_ts, weights)
+
+    elif name == 'change_rate':
+        input_ts = change_rate_series(input_ts)
 
+    if moment_scoring:
+        return(standardize(
+                normal(input_ts, transform), name, climatology, reference))
 
+    return(along_time(
+            transformed_zscores, input_ts, 'float',
+            months=month_index(input_ts),
+            transform=transform,
+            robust=robust,
+            climatology=climatology))
+
+
+def threshold_sweep(input_ts, thresholds, name='values', climatology=True,
+                    reference=None, transform='log', robust=False):
+    """ Evaluates a z-score test for many thresholds at once. The
+    standardized scores are computed once (see series_scores) and
+    every data point is located among the sorted thresholds with a
+    binary search, instead of comparing the scores with every
+    threshold.
+
+    Parameters
+    ----------
+        input_ts: xarray.DataArray
+            Time series of streamflow (or other variable), or cube of
+            time series (e.g., station x time), possibly dask-backed.
+        thresholds: list
+            Threshold values to evaluate (up to 255; see zscore_check).
+        name: string (default is 'values')
+            Series tested: 'values' (range_test; both tails), 'spikes'
+            (spikes_data_test) or 'change_rate' (change_rate_test).
+        climatology: boolean (default is True)
+            Flag to specify wether to perform the test to the whole
+            time series or month by month.
+        reference: climatology.Climatology (optional)
+            Statistics used to standardize the time series.
+        transform, robust
+            Scoring of the time series (see range_test).
+
+    Returns
+    -------
+        xarray.Dataset
+            Sorted thresholds ('threshold' coordinate), number of
+            thresholds exceeded by every data point ('level', uint8;
+            the data point is flagged with the k-th threshold when its
+            level is above k, see sweep_flags) and number of flagged
+            data points with every threshold ('count').
+    """
+    thresholds = np.unique(np.asarray(thresholds, dtype='float'))
+
+    if len(thresholds) > np.iinfo('uint8').max:
+        raise ValueError(
+                "Up to {} thresholds can be evaluated at once.".format(
+                        np.iinfo('uint8').max))
+
+    scores = series_scores(
+            input_ts, name, climatology, reference, transform=transform,
+            robust=robust)
+
+    if name == 'values':
+        scores = abs(scores)
+
+    levels = xr.apply_ufunc(
+            exceedance_levels, scores,
+            dask='parallelized',
+            output_dtypes=['uint8'],
+            kwargs={'thresholds': thresholds})
+    counts = xr.apply_ufunc(
+            level_counts, levels,
+            input_core_dims=[['time']],
+            output_core_dims=[['threshold']],
+            vectorize=True,
+            dask='parallelized',
+            output_dtypes=['int'],
+            dask_gufunc_kwargs={
+                    'allow_rechunk': True,
+                    'output_sizes': {'threshold': len(thresholds)}},
+            kwargs={'n_thresholds': len(thresholds)})
+    return(xr.Dataset(
+            data_vars={'level': levels, 'count': counts},
+            coords={'threshold': thresholds}))
+
+
+def exceedance_levels(scores, thresholds):
+    """ Number of (sorted) thresholds exceeded by every score. Missing
+    scores exceed none.
+    """
+    levels = np.searchsorted(thresholds, scores, side='left')
+    levels[np.isnan(scores)] = 0
+    return(levels.astype('uint8'))
+
+
+def level_counts(levels, n_thresholds):
+    """ Number of levels above every threshold position, from a single
+    histogram of the levels.
+    """
+    histogram = np.bincount(levels, minlength=n_thresholds + 1)
+    return(np.cumsum(histogram[::-1])[::-1][1:])
+
+
+def sweep_flags(sweep, threshold):
+    """ Flags of a threshold evaluated by threshold_sweep.
+
+    Parameters
+    ----------
+        sweep: xarray.Dataset
+            Output of threshold_sweep.
+        threshold: float
+            One of the thresholds of the sweep.
+    """
+    position = list(sweep['threshold'].values).index(threshold)
+    return(sweep['level'] > position)
+
+
+@instrument
 def flat_series_test(input_ts, value_tolerance=0.0, repetitions_tolerance=2,
-                     skipzero=True):
-    """ Invariant variable value.
+                     skipzero=True, return_runs=False):
+    """ Invariant variable value. A data point is flagged when it and
+    the previous repetitions_tolerance data points are equivalent,
+    i.e., when the spread (maximum minus minimum) of these values is
+    within value_tolerance, so a slow drift is not flagged however long
+    it lasts. Only repeated values are flagged, so a
+    repetitions_tolerance of 0 is the same as 1. The spreads are found
+    in a single pass, so the cost of the test does not depend on
+    repetitions_tolerance.
 
     Parameters
     ----------
         input_ts: xarray.DataArray
-            Time series of streamflow (or other variable).
-        tolerance: float (default is 0.0)
-            Threshold of difference between two values to define if
-            both are considered equivalent.
-        repetitions_tolerance:
-        skipzero:
+            Time series of streamflow (or other variable), or cube of
+            time series (e.g., station x time), possibly dask-backed.
+            It is not modified.
+        value_tolerance: float (default is 0.0)
+            Maximum spread of a set of values to define if they are
+            considered equivalent.
+        repetitions_tolerance: integer (default is 2)
+            Number of repetitions of a value that are tolerated.
+        skipzero: boolean (default is True)
+            Flag to specify wether to skip the sets of values with
+            zeros (e. g., days without precipitation).
+        return_runs: boolean (default is False)
+            Flag to specify wether to return the runs of flagged values
+            too.
+
+    Returns
+    -------
+        invariant: xarray.DataArray
+            Boolean time series, True where the data point is invariant.
+        runs: xarray.Dataset
+            Only if return_runs is True. Start time ('start') and
+            length ('length') of every run with flagged data points.
 
     Reference
     ---------
@@ -221,28 +1001,152 @@ def flat_series_test(input_ts, value_tolerance=0.0, repetitions_tolerance=2,
             Assurance for Stream Flow Observations in Rivers and
             Streams.
     """
-    invariant = (abs(input_ts.diff(dim='time')) <= value_tolerance)
+    parameters = dict(
+            value_tolerance=value_tolerance,
+            repetitions_tolerance=repetitions_tolerance,
+            skipzero=skipzero)
+
+    if return_runs:
+        if input_ts.ndim != 1:
+            raise ValueError(
+                    "return_runs is only available for one-dimensional "
+                    "time series.")
+
+        starts, lengths = flat_runs(
+                values=input_ts.values.astype('float'), **parameters)
+        runs = xr.Dataset(
+                data_vars={
+                        'start': (['run'], input_ts.time.values[starts]),
+                        'length': (['run'], lengths)})
+        return(along_time(flat_values, input_ts, 'bool', **parameters), runs)
 
-    for recurse in range(1, repetitions_tolerance+1):
-        invariant = invariant * (abs(
-                input_ts.diff(
-                        dim='time',
-                        n=recurse)
-                ) <= value_tolerance)
+    return(along_time(flat_values, input_ts, 'bool', **parameters))
 
-    invariant = invariant.reindex(
-            time=sorted(input_ts.time.values)).astype('bool')
 
-    for i in range(0, repetitions_tolerance + 1):
-        input_ts.values[i] = False
+def along_time(func, input_ts, dtype, vectorize=True, **kwargs):
+    """ Applies a function of 1D arrays (a numpy implementation of a
+    test) along the 'time' dimension of a time series, or of every
+    station of a cube. Dask-backed inputs stay lazy; the chunks along
+    'time' (if any) are merged, so every task holds whole time series.
+
+    Parameters
+    ----------
+        func: function
+            Function whose first argument is the 1D array of values and
+            that returns an array of the same length.
+        input_ts: xarray.DataArray
+            Time series (or cube with a 'time' dimension).
+        dtype: string
+            Data type of the output of func.
+        vectorize: boolean (default is True)
+            Flag to specify wether func is applied to every time series
+            in a loop or, if func works along the last dimension of an
+            array (e.g., station x time), to whole blocks at once.
+        **kwargs
+            Other arguments of func.
+    """
+    result = xr.apply_ufunc(
+            func, input_ts.astype('float'),
+            input_core_dims=[['time']],
+            output_core_dims=[['time']],
+            vectorize=vectorize,
+            dask='parallelized',
+            output_dtypes=[dtype],
+            dask_gufunc_kwargs={'allow_rechunk': True},
+            kwargs=kwargs)
+    return(result.transpose(*input_ts.dims).rename(input_ts.name))
+
+
+def flat_values(values, value_tolerance=0.0, repetitions_tolerance=2,
+                skipzero=True):
+    """ Numpy implementation of flat_series_test over a 1D array. """
+    width = max(repetitions_tolerance, 1) + 1
+    invariant = np.zeros(len(values), dtype='bool')
+
+    if len(values) < width:
+        return(invariant)
+
+    missing = np.isnan(values)
+    spread = window_spread(np.where(missing, 0.0, values), width)
+    invariant[width - 1:] = (
+            (spread <= value_tolerance) &
+            (window_count(missing, width) == 0))
 
     if skipzero:
-        invariant[input_ts == 0] = False
+        invariant[width - 1:] &= window_count(values == 0, width) == 0
 
     return(invariant)
 
 
-def tmp_outlier_test(input_ts, c=7.5, threshold=4.89164):
+def flat_runs(values, value_tolerance=0.0, repetitions_tolerance=2,
+              skipzero=True):
+    """ Runs of flagged data points (see flat_series_test), including
+    the repetitions_tolerance data points that precede the first one.
+
+    Returns
+    -------
+        starts: numpy.ndarray
+            Position of the first value of every run.
+        lengths: numpy.ndarray
+            Number of values of every run.
+    """
+    invariant = flat_values(
+            values, value_tolerance, repetitions_tolerance, skipzero)
+    edges = np.diff(np.concatenate([[0], invariant.astype('int'), [0]]))
+    first = np.flatnonzero(edges == 1)
+    lengths = np.flatnonzero(edges == -1) - first
+    preceding = max(repetitions_tolerance, 1)
+    return(first - preceding, lengths + preceding)
+
+
+def window_spread(values, width):
+    """ Spread (maximum minus minimum) of the values of every window of
+    consecutive values. The cost does not depend on the width of the
+    windows.
+
+    Parameters
+    ----------
+        values: numpy.ndarray
+            Values of the time series (without missing values).
+        width: integer
+            Number of values of every window.
+
+    Returns
+    -------
+        numpy.ndarray
+            Spread of the window that ends at every value, from the
+            width-th value on.
+    """
+    # The minimum is the opposite of the maximum of the opposite values.
+    return(window_maximum(values, width) + window_maximum(-values, width))
+
+
+def window_maximum(values, width):
+    """ Maximum of every window of consecutive values (see
+    window_spread), from the maxima of the blocks of width values up to
+    and from every value (van Herk, 1992; Gil and Werman, 1993).
+    """
+    blocks = -(-len(values) // width)
+    padded = np.full(blocks * width, -np.inf)
+    padded[:len(values)] = values
+    padded = padded.reshape(blocks, width)
+    upto = np.maximum.accumulate(padded, axis=1).ravel()
+    since = np.maximum.accumulate(padded[:, ::-1], axis=1)[:, ::-1].ravel()
+    return(np.maximum(
+            since[:len(values) - width + 1], upto[width - 1:len(values)]))
+
+
+def window_count(mask, width):
+    """ Number of True values of every window of consecutive values
+    (see window_spread).
+    """
+    count = np.concatenate([[0], np.cumsum(mask)])
+    return(count[width:] - count[:-width])
+
+
+@instrument
+def tmp_outlier_test(input_ts, c=7.5, threshold=4.89164,
+                     chunk_elements=2 ** 22):
     """ Applies the biweight mean and biweight standard deviation
     method to detect outliers where (i) data values are much larger (or
     smaller) than neighboring values but are not larger than the
@@ -257,7 +1161,23 @@ def tmp_outlier_test(input_ts, c=7.5, threshold=4.89164):
     Parameters
     ----------
         input_ts: xarray.DataArray
-            Time series of streamflow (or other variable).
+            Time series of streamflow (or other variable), or cube of
+            time series (e.g., station x time), possibly dask-backed.
+        c: float (default is 7.5)
+            Censoring constant of the biweight weights.
+        threshold: float (default is 4.89164)
+            Z-score (computed with the biweight mean and standard
+            deviation) from which a data point is considered an
+            outlier.
+        chunk_elements: integer (default is 2 ** 22)
+            Approximate number of elements of the block of samples
+            processed at once. It bounds the memory used by the test.
+
+    Returns
+    -------
+        xarray.DataArray
+            Boolean time series, True where the data point is an
+            outlier.
 
     Reference
     ---------
@@ -277,55 +1197,126 @@ def tmp_outlier_test(input_ts, c=7.5, threshold=4.89164):
 
 
     """
-    is_outlier = (input_ts.copy() * 0).astype('bool')
     dates = input_ts.time.values.astype('datetime64[D]')
 
-    for date in dates:
-        # Create a new time series (X_i) with the data from the day
-        # before and after the day having the suspect value of the
-        # current year, and the day before, after, and on the day from
-        # all other years in the same station.
-        X_i = xr.DataArray(data=[], coords={'time': []}, dims='time')
-
-        for day in np.arange(date-15, date+16):
-            is_the_month = input_ts['time.month'] == int(
-                    str(day).split('-')[1])
-            is_the_day = input_ts['time.day'] == int(str(day).split('-')[2])
-            X_i = xr.concat(
-                    [X_i, input_ts[(is_the_month) & (is_the_day)]], dim='time')
-
-        X_i = X_i.reindex(time=sorted(X_i.time.values))
-        X_i = X_i.drop(labels=date, dim='time')
-
-        # After X_i series is obtained, the median (M) and absolute
-        # deviatin from the median (MAD) are estimated. The MAD is the
-        # median of the absolute deviations of the values from the
-        # median.
-        M = X_i.median()
-        MAD = np.abs(X_i - M).median()
-
-        # From the MAD, the weights u_i are calculated.
-        u_i = (X_i - M) / (c * MAD)
-        u_i[np.abs(u_i) > 1] = 1
-
-        # With u_i, the biweight mean is estimated.
-        upper = ((X_i - M) * ((1 - (u_i ** 2)) ** 2)).sum()
-        lower = ((1 - (u_i ** 2)) ** 2).sum()
-        Xmean_bi = M + (upper / lower)
-
-        # And the biweight standard deviation.
-        upper = np.sqrt(
-                X_i.size * (((X_i - M) ** 2) * (1 - (u_i ** 2)) ** 4).sum())
-        lower = np.abs(((1 - (u_i ** 2)) * (1 - (5 * (u_i ** 2)))).sum())
-        s_bi = upper / lower
-
-        # The Xmean_bi and s_bi are used to determine the Z-score of a
-        # particular day's observation.
-        Z = (input_ts.sel({'time': date}) - Xmean_bi) / s_bi
-        is_outlier.loc[is_outlier.time == date] = abs(Z) >= threshold
-        print("{} done".format(date))
+    # Create, for every date, a sample (X_i) with the data from the
+    # 15 days before and after the day having the suspect value of the
+    # current year, and from the same calendar days of all other years
+    # in the same station. Samples are gathered as rows of a 2D array,
+    # which are shared by all the stations of a cube.
+    pool_index, pool_of_date = _calendar_window_pools(dates, half_window=15)
+    return(along_time(
+            biweight_outliers, input_ts, 'bool',
+            pool_index=pool_index,
+            pool_of_date=pool_of_date,
+            c=c,
+            threshold=threshold,
+            chunk_elements=chunk_elements))
+
+
+def biweight_outliers(values, pool_index, pool_of_date, c=7.5,
+                      threshold=4.89164, chunk_elements=2 ** 22):
+    """ Numpy implementation of tmp_outlier_test over a 1D array, with
+    the samples of every date given by _calendar_window_pools.
+    """
+    is_outlier = np.zeros(values.shape, dtype='bool')
+    chunk_size = max(1, int(chunk_elements // pool_index.shape[1]))
 
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for first in range(0, len(values), chunk_size):
+            chunk = np.arange(first, min(first + chunk_size, len(values)))
+            X_i_index = pool_index[pool_of_date[chunk]]
+            X_i = np.where(X_i_index >= 0, values[X_i_index], np.nan)
 
+            # The value of the day under test is excluded from its own
+            # sample.
+            X_i[X_i_index == chunk[:, np.newaxis]] = np.nan
+            size = (X_i_index >= 0).sum(axis=1) - 1
+
+            # After X_i samples are obtained, the median (M) and
+            # absolute deviatin from the median (MAD) are estimated.
+            # The MAD is the median of the absolute deviations of the
+            # values from the median.
+            M = np.nanmedian(X_i, axis=1)[:, np.newaxis]
+            MAD = np.nanmedian(np.abs(X_i - M), axis=1)[:, np.newaxis]
+
+            # From the MAD, the weights u_i are calculated.
+            u_i = (X_i - M) / (c * MAD)
+            u_i[np.abs(u_i) > 1] = 1
+
+            # With u_i, the biweight mean is estimated.
+            upper = np.nansum((X_i - M) * ((1 - (u_i ** 2)) ** 2), axis=1)
+            lower = np.nansum((1 - (u_i ** 2)) ** 2, axis=1)
+            Xmean_bi = M[:, 0] + (upper / lower)
+
+            # And the biweight standard deviation.
+            upper = np.sqrt(size * np.nansum(
+                    ((X_i - M) ** 2) * (1 - (u_i ** 2)) ** 4, axis=1))
+            lower = np.abs(np.nansum(
+                    (1 - (u_i ** 2)) * (1 - (5 * (u_i ** 2))), axis=1))
+            s_bi = upper / lower
+
+            # The Xmean_bi and s_bi are used to determine the Z-score
+            # of a particular day's observation.
+            Z = (values[chunk] - Xmean_bi) / s_bi
+            is_outlier[chunk] = np.abs(Z) >= threshold
+
+    return(is_outlier)
+
+
+def _calendar_window_pools(dates, half_window=15):
+    """Gather, for every date, the positions of all the records that
+    share a calendar day (month and day) with the window of
+    +/- half_window days around it.
+
+    Parameters
+    ----------
+        dates: numpy.ndarray
+            Dates of the time series (datetime64[D]).
+        half_window: integer (default is 15)
+            Number of days before and after each date that define its
+            calendar window.
+
+    Returns
+    -------
+        pool_index: numpy.ndarray
+            2D array of integers with one row per distinct calendar
+            window. Each row holds the positions in 'dates' of the
+            records within that window, padded with -1.
+        pool_of_date: numpy.ndarray
+            Row of pool_index that corresponds to each date.
+    """
+    def calendar_day(days):
+        # Position of the day within a leap year (0 to 365).
+        months = days.astype('datetime64[M]')
+        month_number = months.astype('int') % 12
+        day_number = (days - months).astype('int')
+        return(LEAP_YEAR_MONTH_START[month_number] + day_number)
+
+    offsets = np.arange(-half_window, half_window + 1)
+    window_days = calendar_day(dates[:, np.newaxis] + offsets)
+    windows, pool_of_date = np.unique(
+            window_days, axis=0, return_inverse=True)
+    pool_of_date = pool_of_date.ravel()
+
+    # Positions of the records sorted by calendar day, so the records
+    # of any calendar day are a contiguous slice of by_day.
+    record_day = window_days[:, half_window]
+    by_day = np.argsort(record_day, kind='stable')
+    day_count = np.bincount(record_day, minlength=366)
+    day_start = np.cumsum(day_count) - day_count
+    pool_size = day_count[windows].sum(axis=1)
+    pool_index = np.full((len(windows), pool_size.max()), -1, dtype='int')
+
+    for row, window in enumerate(windows):
+        pool_index[row, :pool_size[row]] = np.concatenate([
+                by_day[day_start[day]:day_start[day] + day_count[day]]
+                for day in window])
+
+    return(pool_index, pool_of_date)
+
+
+@instrument
 def missd_ratio_test(input_ts, threshold=0.1):
     """ Test if the missing data in the time series is below (True) the
     defined threshold or if it is above (False).
@@ -333,7 +1324,8 @@ def missd_ratio_test(input_ts, threshold=0.1):
     Parameters
     ----------
         input_ts: xarray.DataArray
-            Time series of streamflow (or other variable).
+            Time series of streamflow (or other variable), or cube of
+            time series (e.g., station x time), possibly dask-backed.
         tolerance: float
             Threshold set up to missing data ratio (i. e.,
             missing_data / available_data). Values reported in the literature
@@ -346,10 +1338,11 @@ def missd_ratio_test(input_ts, threshold=0.1):
         Sciences, 22(8), 4593–4604.
         https://doi.org/10.5194/hess-22-4593-2018
     """
-    gaps = float(input_ts.isnull().sum(dim='time'))
-    return((gaps / input_ts.size) > threshold)
+    gaps = input_ts.isnull().sum(dim='time')
+    return((gaps / input_ts.sizes['time']) > threshold)
 
 
+@instrument
 def minimlength_test(input_ts, threshold=10):
     """ Test if the length of the available records of the variable input_ts
     is above a defined threshold (in years).
@@ -357,6 +1350,36 @@ def minimlength_test(input_ts, threshold=10):
     Parameters
     ----------
         input_ts: xarray.DataArray
-            Time series of streamflow (or other variable).
+            Time series of streamflow (or other variable), or cube of
+            time series (e.g., station x time), possibly dask-backed.
+        threshold: float (default is 10)
+            Minimum length of the available records (see
+            record_length), in years.
     """
-    pass
+    return(record_length(input_ts) > threshold)
+
+
+def record_length(input_ts):
+    """ Effective length of the records of a time series, in years: the
+    number of available values times the time step (the median
+    difference between consecutive times).
+
+    Parameters
+    ----------
+        input_ts: xarray.DataArray
+            Time series of streamflow (or other variable), or cube of
+            time series (e.g., station x time), possibly dask-backed.
+    """
+    return(input_ts.notnull().sum(dim='time') * time_step_years(
+            input_ts['time'].values))
+
+
+def time_step_years(times):
+    """ Time step of a time series (the median difference between
+    consecutive times), in years of 365.25 days.
+    """
+    if len(times) < 2:
+        return(0.0)
+
+    step = np.median(np.diff(times.astype('datetime64[s]').astype('float')))
+    return(step / (365.25 * 86400))
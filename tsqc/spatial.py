@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""Quality control routines. Spatial consistency of a station network.
+
+The values of a variable of every station are aligned in a (station x
+day) array (see align_network), and every observation is compared with
+an estimate from its nearest stations on the same day, weighted by
+their correlation with the station (see buddy_check). The neighbours
+are found with a KD-tree over the stations' coordinates on the unit
+sphere (scipy.spatial.cKDTree; without scipy, by a blockwise search).
+
+Author
+------
+    Roberto A. Real-Rangel (Institute of Engineering UNAM; Mexico)
+
+License
+-------
+    GNU General Public License
+"""
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+
+try:
+    from scipy.spatial import cKDTree
+
+except ImportError:
+    # The neighbours are found by a blockwise search instead.
+    cKDTree = None
+
+from . import data_manager as dmgr
+from . import quality_control_tests as qct
+from .parse_cache import read_station
+from .time_axis import RegularTimeAxis
+
+EARTH_RADIUS = 6371.0   # km
+
+
+def unit_vectors(latitude, longitude):
+    """Cartesian coordinates of points on the unit sphere.
+
+    Parameters
+    ----------
+        latitude, longitude: numpy.ndarray
+            Coordinates of the points, in decimal degrees.
+    """
+    latitude = np.radians(np.asarray(latitude, dtype='float'))
+    longitude = np.radians(np.asarray(longitude, dtype='float'))
+    return(np.column_stack([
+            np.cos(latitude) * np.cos(longitude),
+            np.cos(latitude) * np.sin(longitude),
+            np.sin(latitude)]))
+
+
+def chord_to_distance(chord):
+    """Great-circle distance (km) of a chord of the unit sphere."""
+    return(2 * EARTH_RADIUS * np.arcsin(np.minimum(chord, 2) / 2))
+
+
+class StationIndex(object):
+    """ Spatial index of the stations of a network, built once and
+    queried for the nearest neighbours of every station.
+
+    Parameters
+    ----------
+        latitude, longitude: numpy.ndarray
+            Coordinates of the stations, in decimal degrees.
+        elevation: numpy.ndarray (optional)
+            Elevation of the stations, in meters.
+        stations: list (optional)
+            IDs of the stations.
+    """
+    def __init__(self, latitude, longitude, elevation=None, stations=None):
+        self.points = unit_vectors(latitude, longitude)
+        self.elevation = (
+                None if elevation is None
+                else np.asarray(elevation, dtype='float'))
+        self.stations = stations
+        self.tree = None if cKDTree is None else cKDTree(self.points)
+
+    @classmethod
+    def from_network(cls, network):
+        """Index of the stations of a network aligned with
+        align_network.
+        """
+        return(cls(
+                latitude=network['latitude'].values,
+                longitude=network['longitude'].values,
+                elevation=network['elevation'].values,
+                stations=list(network['station'].values)))
+
+    def __len__(self):
+        return(len(self.points))
+
+    def nearest(self, k, block_size=1024):
+        """Chord length and position of the k nearest points to every
+        station (itself included), from the closest to the farthest.
+        """
+        if self.tree is not None:
+            chord, index = self.tree.query(self.points, k=k)
+            return(chord.reshape(len(self), k), index.reshape(len(self), k))
+
+        chord = np.empty((len(self), k))
+        index = np.empty((len(self), k), dtype='int')
+
+        for first in range(0, len(self), block_size):
+            block = self.points[first:first + block_size]
+            block_chord = np.sqrt(np.maximum(
+                    2 - 2 * np.dot(block, self.points.T), 0))
+            nearest = np.argpartition(block_chord, k - 1, axis=1)[:, :k]
+            nearest_chord = np.take_along_axis(block_chord, nearest, axis=1)
+            order = np.argsort(nearest_chord, axis=1)
+            chord[first:first + block_size] = np.take_along_axis(
+                    nearest_chord, order, axis=1)
+            index[first:first + block_size] = np.take_along_axis(
+                    nearest, order, axis=1)
+
+        return(chord, index)
+
+    def query(self, k=5, max_distance=None, max_elevation_difference=None):
+        """ Nearest neighbours of every station.
+
+        Parameters
+        ----------
+            k: integer (default is 5)
+                Number of neighbours.
+            max_distance: float (optional)
+                Maximum distance to a neighbour, in km.
+            max_elevation_difference: float (optional)
+                Maximum difference of elevation with a neighbour, in
+                meters.
+
+        Returns
+        -------
+            distance: numpy.ndarray
+                (station x k) distances to the neighbours, in km.
+            neighbours: numpy.ndarray
+                (station x k) positions of the neighbours, or -1 if a
+                station has fewer neighbours within the limits.
+        """
+        n = len(self)
+        k_query = min(k + 1, n)
+        chord, index = self.nearest(k_query)
+
+        # Drop every station from its own neighbours (the last one, if
+        # other stations share its coordinates and it was not found).
+        is_self = index == np.arange(n)[:, np.newaxis]
+        is_self[~is_self.any(axis=1), -1] = True
+        shape = (n, k_query - 1)
+        distance = chord_to_distance(chord[~is_self].reshape(shape))
+        neighbours = index[~is_self].reshape(shape)
+        is_missing = np.zeros(shape, dtype='bool')
+
+        if max_distance is not None:
+            is_missing |= distance > max_distance
+
+        if (max_elevation_difference is not None and
+                self.elevation is not None):
+            is_missing |= np.abs(
+                    self.elevation[neighbours] -
+                    self.elevation[:, np.newaxis]) > max_elevation_difference
+
+        neighbours[is_missing] = -1
+        distance[is_missing] = np.nan
+
+        # Pad to k neighbours for networks smaller than k + 1 stations.
+        padding = k - shape[1]
+        return(
+                np.pad(distance, [(0, 0), (0, padding)],
+                       constant_values=np.nan),
+                np.pad(neighbours, [(0, 0), (0, padding)],
+                       constant_values=-1))
+
+
+def station_coordinates(dataset):
+    """Latitude, longitude and elevation of a station dataset, taken
+    from its attributes (see data_manager.read_bdcn_file).
+    """
+    return(OrderedDict([
+            (i.lower(), float(dataset.attrs.get(i, np.nan)))
+            for i in ['Latitude', 'Longitude', 'Elevation']]))
+
+
+def align_network(datasets, var):
+    """ Aligns a variable of several stations in a (station x day)
+    array. Every record is placed by position in a daily axis that
+    spans all of them (see time_axis.RegularTimeAxis).
+
+    Parameters
+    ----------
+        datasets: dict
+            Daily datasets (e.g., as returned by
+            data_manager.read_bdcn_file) of every station ID.
+        var: string
+            Variable to align (e.g., 'tmax').
+
+    Returns
+    -------
+        xarray.DataArray
+            Values of the variable, with the latitude, longitude and
+            elevation of every station as coordinates.
+    """
+    stations = list(datasets)
+    starts = [datasets[i]['time'].values[0] for i in stations]
+    ends = [datasets[i]['time'].values[-1] for i in stations]
+    axis = RegularTimeAxis.from_dates(np.concatenate([starts, ends]))
+    values = np.full((len(stations), len(axis)), np.nan)
+
+    for row, station in enumerate(stations):
+        first = axis.positions(starts[row])
+        station_values = datasets[station][var].values
+        values[row, first:first + len(station_values)] = station_values
+
+    coordinates = [station_coordinates(datasets[i]) for i in stations]
+    return(xr.DataArray(
+            values,
+            dims=['station', 'time'],
+            coords=OrderedDict(
+                    [('station', stations), ('time', axis.values)] + [
+                            (i, ('station', [j[i] for j in coordinates]))
+                            for i in ['latitude', 'longitude', 'elevation']]),
+            name=var))
+
+
+def read_network(input_files, var, reader='bdcn', config=None):
+    """Reads the station files of a network (through the parse cache,
+    if it is set in the configuration) and aligns a variable (see
+    align_network).
+    """
+    datasets = OrderedDict()
+
+    for input_file in input_files:
+        if config is None:
+            dataset = dmgr.READERS[reader](input_file)
+
+        else:
+            dataset = read_station(input_file, reader, config)
+
+        datasets[dataset.attrs.get('StationID', str(input_file))] = dataset
+
+    return(align_network(datasets, var))
+
+
+def neighbour_correlation(anomalies, neighbour_anomalies, min_overlap=365):
+    """ Pearson correlation of every station with each of its
+    neighbours, over the days both have values.
+
+    Parameters
+    ----------
+        anomalies: numpy.ndarray
+            (station x day) anomalies.
+        neighbour_anomalies: numpy.ndarray
+            (station x neighbour x day) anomalies of the neighbours.
+        min_overlap: integer (default is 365)
+            Minimum number of common days. Pairs with fewer have no
+            correlation (NaN).
+    """
+    x = anomalies[:, np.newaxis, :]
+    valid = ~np.isnan(x) & ~np.isnan(neighbour_anomalies)
+    x = np.where(valid, x, 0)
+    y = np.where(valid, neighbour_anomalies, 0)
+    n = valid.sum(axis=-1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_mean = x.sum(axis=-1) / n
+        y_mean = y.sum(axis=-1) / n
+        covariance = (x * y).sum(axis=-1) / n - x_mean * y_mean
+        x_std = np.sqrt((x ** 2).sum(axis=-1) / n - x_mean ** 2)
+        y_std = np.sqrt((y ** 2).sum(axis=-1) / n - y_mean ** 2)
+        correlation = covariance / (x_std * y_std)
+
+    correlation[n < min_overlap] = np.nan
+    return(correlation)
+
+
+def standardize_rows(values):
+    """Standardizes every row of an array with the mean and the
+    (population) standard deviation of its non-missing values.
+    """
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=1, keepdims=True)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(valid, values, 0).sum(axis=1, keepdims=True) / count
+        anomalies = values - mean
+        std = np.sqrt(np.where(valid, anomalies ** 2, 0).sum(
+                axis=1, keepdims=True) / count)
+        return(anomalies / std)
+
+
+def buddy_check(network, index=None, k=5, threshold=4.89164,
+                min_neighbours=2, min_overlap=365, max_distance=None,
+                chunk_elements=2 ** 22):
+    """ Spatial consistency (buddy) test. Every value is compared with
+    the estimate of its k nearest stations on the same day: the mean
+    of their monthly anomalies (see quality_control_tests.
+    monthly_standard), weighted by the squared (positive) correlation
+    of each neighbour with the station. A data point is flagged when
+    its departure from the estimate, standardized over the record of
+    the station, exceeds the threshold. It suits spatially coherent
+    variables (e.g., temperature) better than precipitation.
+
+    Parameters
+    ----------
+        network: xarray.DataArray
+            (station x day) values of the variable, with latitude and
+            longitude coordinates (see align_network).
+        index: StationIndex (optional)
+            Spatial index of the stations of the network. By default,
+            it is built from its coordinates.
+        k: integer (default is 5)
+            Number of neighbours of every station.
+        threshold: float (default is 4.89164)
+            A threshold value to identifie outliers (see
+            quality_control_tests.zscore_check).
+        min_neighbours: integer (default is 2)
+            Minimum number of neighbours with values on a day to test
+            a data point.
+        min_overlap: integer (default is 365)
+            Minimum number of common days to weight a neighbour.
+        max_distance: float (optional)
+            Maximum distance to a neighbour, in km.
+        chunk_elements: integer (default is 2 ** 22)
+            Maximum number of elements of the (station x neighbour x
+            day) blocks in which the network is processed.
+
+    Returns
+    -------
+        xarray.DataArray
+            Boolean (station x day) flags, True where the data point is
+            not consistent with its neighbours.
+
+    Reference
+    ---------
+        Hubbard, K. G., Goddard, S., Sorensen, W. D., Wells, N., &
+            Osugi, T. T. (2005). Performance of quality assurance
+            procedures for an applied climate information system.
+            Journal of Atmospheric and Oceanic Technology, 22(1),
+            105–112.
+    """
+    if index is None:
+        index = StationIndex.from_network(network)
+
+    _, neighbours = index.query(k=k, max_distance=max_distance)
+    anomalies = np.asarray(qct.monthly_zscores(
+            network.values.astype('float'), qct.month_index(network)))
+    anomalies[~np.isfinite(anomalies)] = np.nan
+    flags = np.zeros(anomalies.shape, dtype='bool')
+    n_stations, n_days = anomalies.shape
+    block_size = max(1, chunk_elements // (k * n_days))
+
+    # The missing neighbours (-1) take the last row, all NaN.
+    padded = np.vstack([anomalies, np.full((1, n_days), np.nan)])
+
+    for first in range(0, n_stations, block_size):
+        block = slice(first, first + block_size)
+        values = anomalies[block]
+        neighbour_values = padded[neighbours[block]]
+        weights = np.clip(neighbour_correlation(
+                values, neighbour_values, min_overlap), 0, None) ** 2
+        weights[np.isnan(weights)] = 0
+        weights = np.where(
+                np.isnan(neighbour_values), 0, weights[:, :, np.newaxis])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            estimate = (
+                    np.nansum(weights * neighbour_values, axis=1) /
+                    weights.sum(axis=1))
+            estimate[(weights > 0).sum(axis=1) < min_neighbours] = np.nan
+            residual = values - estimate
+            scores = standardize_rows(residual)
+
+        flags[block] = qct.exceedance(scores, threshold)
+
+    return(xr.DataArray(
+            flags, dims=network.dims, coords=network.coords,
+            name=network.name))
@@ -1,64 +1,288 @@
-# -*- coding: utf-8 -*-
-"""Statistical tables
-
-Author
-------
-    Roberto A. Real-Rangel (Institute of Engineering UNAM; Mexico)
-
-License
--------
-    GNU General Public License
-"""
-import numpy as np
-
-
-def von_neumann_ratio(n, a=0.05):
-    """ Critical values for the rank von Neumann Ratio test.
-    Critical vaues in terms of approximating functions of the form
-    f_a(n), where a is the significance level of the test.
-
-    Parameters
-    ----------
-        n: integer
-            Size of the sample.
-        a: float (optional; default value is 0.05)
-            Significance level (alpha).
-
-    References
-    ----------
-        Bartels, R. (1982). The Rank Version of von Neumann’s Ratio
-            Test for Randomness. Journal of the American Statistical
-            Association, 77(377), 40–46.
-            https://doi.org/10.1080/01621459.1982.10477764
-    """
-    table_n = [
-            10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25,
-            26, 27, 28, 29, 30, 32, 34, 36, 38, 40, 42, 44, 46, 48, 50, 55,
-            60, 65, 70, 75, 80, 85, 90, 95, 100]
-    table_values = {
-            0.005: [0.62, 0.67, 0.71, 0.74, 0.78, 0.81, 0.84, 0.87, 0.89,
-                    0.92, 0.94, 0.96, 0.98, 1.00, 1.02, 1.04, 1.05, 1.07,
-                    1.08, 1.10, 1.11, 1.13, 1.16, 1.18, 1.20, 1.22, 1.24,
-                    1.25, 1.27, 1.28, 1.29, 1.33, 1.35, 1.38, 1.40, 1.42,
-                    1.44, 1.45, 1.47, 1.48, 1.49],
-            0.010: [0.72, 0.77, 0.81, 0.84, 0.87, 0.90, 0.93, 0.96, 0.98,
-                    1.01, 1.03, 1.05, 1.07, 1.09, 1.10, 1.12, 1.13, 1.15,
-                    1.16, 1.18, 1.19, 1.21, 1.23, 1.25, 1.27, 1.29, 1.30,
-                    1.32, 1.33, 1.35, 1.36, 1.39, 1.41, 1.43, 1.45, 1.47,
-                    1.49, 1.50, 1.52, 1.53, 1.54],
-            0.025: [0.89, 0.93, 0.96, 1.00, 1.03, 1.05, 1.08, 1.10, 1.13,
-                    1.15, 1.17, 1.18, 1.20, 1.22, 1.23, 1.25, 1.26, 1.27,
-                    1.28, 1.30, 1.31, 1.33, 1.35, 1.36, 1.38, 1.39, 1.41,
-                    1.42, 1.43, 1.45, 1.46, 1.48, 1.50, 1.52, 1.54, 1.55,
-                    1.57, 1.58, 1.59, 1.60, 1.61],
-            0.050: [1.04, 1.08, 1.11, 1.14, 1.17, 1.19, 1.21, 1.24, 1.26,
-                    1.27, 1.29, 1.31, 1.32, 1.33, 1.35, 1.36, 1.37, 1.38,
-                    1.39, 1.40, 1.41, 1.43, 1.45, 1.46, 1.48, 1.49, 1.50,
-                    1.51, 1.52, 1.53, 1.54, 1.56, 1.58, 1.60, 1.61, 1.62,
-                    1.64, 1.65, 1.66, 1.66, 1.67],
-            0.100: [1.23, 1.26, 1.29, 1.32, 1.34, 1.36, 1.38, 1.40, 1.41,
-                    1.43, 1.44, 1.45, 1.46, 1.48, 1.49, 1.50, 1.51, 1.51,
-                    1.52, 1.53, 1.54, 1.55, 1.57, 1.58, 1.59, 1.60, 1.61,
-                    1.62, 1.63, 1.63, 1.64, 1.66, 1.67, 1.68, 1.70, 1.71,
-                    1.71, 1.72, 1.73, 1.74, 1.74]}
-    return(np.interp(n, table_n, table_values[a]))
+# -*- coding: utf-8 -*-
+"""Statistical tables
+
+The critical values of the tests are tabulated in module-level arrays
+(sample sizes, significance levels and a (significance level x sample
+size) table of values), interpolated across both by interpolate_table.
+
+Author
+------
+    Roberto A. Real-Rangel (Institute of Engineering UNAM; Mexico)
+
+License
+-------
+    GNU General Public License
+"""
+import numpy as np
+
+# Critical values of the rank von Neumann ratio test (Bartels, 1982).
+VON_NEUMANN_N = np.array([
+        10, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26,
+        27, 28, 29, 30, 32, 34, 36, 38, 40, 42, 44, 46, 48, 50, 55, 60, 65,
+        70, 75, 80, 85, 90, 95, 100])
+VON_NEUMANN_ALPHA = np.array([0.005, 0.010, 0.025, 0.050, 0.100])
+VON_NEUMANN_VALUES = np.array([
+        [0.62, 0.67, 0.71, 0.74, 0.78, 0.81, 0.84, 0.87, 0.89, 0.92, 0.94,
+         0.96, 0.98, 1.00, 1.02, 1.04, 1.05, 1.07, 1.08, 1.10, 1.11, 1.13,
+         1.16, 1.18, 1.20, 1.22, 1.24, 1.25, 1.27, 1.28, 1.29, 1.33, 1.35,
+         1.38, 1.40, 1.42, 1.44, 1.45, 1.47, 1.48, 1.49],
+        [0.72, 0.77, 0.81, 0.84, 0.87, 0.90, 0.93, 0.96, 0.98, 1.01, 1.03,
+         1.05, 1.07, 1.09, 1.10, 1.12, 1.13, 1.15, 1.16, 1.18, 1.19, 1.21,
+         1.23, 1.25, 1.27, 1.29, 1.30, 1.32, 1.33, 1.35, 1.36, 1.39, 1.41,
+         1.43, 1.45, 1.47, 1.49, 1.50, 1.52, 1.53, 1.54],
+        [0.89, 0.93, 0.96, 1.00, 1.03, 1.05, 1.08, 1.10, 1.13, 1.15, 1.17,
+         1.18, 1.20, 1.22, 1.23, 1.25, 1.26, 1.27, 1.28, 1.30, 1.31, 1.33,
+         1.35, 1.36, 1.38, 1.39, 1.41, 1.42, 1.43, 1.45, 1.46, 1.48, 1.50,
+         1.52, 1.54, 1.55, 1.57, 1.58, 1.59, 1.60, 1.61],
+        [1.04, 1.08, 1.11, 1.14, 1.17, 1.19, 1.21, 1.24, 1.26, 1.27, 1.29,
+         1.31, 1.32, 1.33, 1.35, 1.36, 1.37, 1.38, 1.39, 1.40, 1.41, 1.43,
+         1.45, 1.46, 1.48, 1.49, 1.50, 1.51, 1.52, 1.53, 1.54, 1.56, 1.58,
+         1.60, 1.61, 1.62, 1.64, 1.65, 1.66, 1.66, 1.67],
+        [1.23, 1.26, 1.29, 1.32, 1.34, 1.36, 1.38, 1.40, 1.41, 1.43, 1.44,
+         1.45, 1.46, 1.48, 1.49, 1.50, 1.51, 1.51, 1.52, 1.53, 1.54, 1.55,
+         1.57, 1.58, 1.59, 1.60, 1.61, 1.62, 1.63, 1.63, 1.64, 1.66, 1.67,
+         1.68, 1.70, 1.71, 1.71, 1.72, 1.73, 1.74, 1.74]])
+
+# Critical values of the SNHT (Wijngaard et al., 2003).
+SNHT_N = np.array([20, 30, 40, 50, 70, 100])
+SNHT_ALPHA = np.array([0.010, 0.050])
+SNHT_VALUES = np.array([
+        [9.56, 10.45, 11.01, 11.38, 11.89, 12.32],
+        [6.95, 7.65, 8.10, 8.45, 8.80, 9.15]])
+
+# Critical values of the Buishand range test, R / sqrt(n) (Buishand,
+# 1982), and their limit for large samples.
+BUISHAND_N = np.array([10, 20, 30, 40, 50, 100])
+BUISHAND_ALPHA = np.array([0.010, 0.050, 0.100])
+BUISHAND_VALUES = np.array([
+        [1.38, 1.60, 1.70, 1.74, 1.78, 1.86],
+        [1.28, 1.43, 1.50, 1.53, 1.55, 1.62],
+        [1.21, 1.34, 1.40, 1.42, 1.44, 1.50]])
+BUISHAND_ASYMPTOTIC = np.array([2.00, 1.75, 1.62])
+
+
+def check_alpha(a, table_alpha):
+    """ Raises a ValueError if a significance level is outside the
+    range of a table.
+    """
+    a = np.asarray(a, dtype='float')
+
+    if np.any((a < table_alpha[0]) | (a > table_alpha[-1]) | np.isnan(a)):
+        raise ValueError(
+                "The significance level must be between {} and {}.".format(
+                        table_alpha[0], table_alpha[-1]))
+
+
+def interpolate_table(n, a, table_n, table_alpha, table_values):
+    """ Critical values from a table, interpolated linearly across the
+    sample size and across the logarithm of the significance level.
+    Sample sizes outside the table return NaN.
+
+    Parameters
+    ----------
+        n: integer or numpy.ndarray
+            Sizes of the samples.
+        a: float or numpy.ndarray
+            Significance levels (alpha), broadcastable with n. They
+            must be within the range of table_alpha.
+        table_n: numpy.ndarray
+            Sample sizes of the table (increasing).
+        table_alpha: numpy.ndarray
+            Significance levels of the table (increasing).
+        table_values: numpy.ndarray
+            (significance level x sample size) critical values.
+    """
+    check_alpha(a, table_alpha)
+    n, a = np.broadcast_arrays(
+            np.asarray(n, dtype='float'), np.asarray(a, dtype='float'))
+
+    # Every row of the table interpolated at the sample sizes, and the
+    # rows that bracket every significance level.
+    by_n = np.array([np.interp(n, table_n, row) for row in table_values])
+    upper = np.clip(
+            np.searchsorted(table_alpha, a), 1, len(table_alpha) - 1)
+    lower = upper - 1
+    log_alpha = np.log(table_alpha)
+    weight = (np.log(a) - log_alpha[lower]) / (
+            log_alpha[upper] - log_alpha[lower])
+    values = np.array(
+            (1 - weight) * np.take_along_axis(by_n, lower[np.newaxis], 0)[0] +
+            weight * np.take_along_axis(by_n, upper[np.newaxis], 0)[0])
+    values[(n < table_n[0]) | (n > table_n[-1]) | np.isnan(n)] = np.nan
+    return(values)
+
+
+def von_neumann_ratio(n, a=0.05):
+    """ Critical values for the rank von Neumann Ratio test.
+    Critical vaues in terms of approximating functions of the form
+    f_a(n), where a is the significance level of the test. For samples
+    larger than 100, the ratio is approximately normal, with mean 2
+    and variance 4 (n - 2) (5 n^2 - 2 n - 9) / (5 n (n + 1) (n - 1)^2).
+
+    Parameters
+    ----------
+        n: integer or numpy.ndarray
+            Size of the sample (at least 10). Smaller samples return
+            NaN.
+        a: float or numpy.ndarray (optional; default value is 0.05)
+            Significance level (alpha), between 0.005 and 0.1.
+
+    References
+    ----------
+        Bartels, R. (1982). The Rank Version of von Neumann’s Ratio
+            Test for Randomness. Journal of the American Statistical
+            Association, 77(377), 40–46.
+            https://doi.org/10.1080/01621459.1982.10477764
+    """
+    values = interpolate_table(
+            n, a, VON_NEUMANN_N, VON_NEUMANN_ALPHA, VON_NEUMANN_VALUES)
+    n, a = np.broadcast_arrays(
+            np.asarray(n, dtype='float'), np.asarray(a, dtype='float'))
+    is_large = n > VON_NEUMANN_N[-1]
+    large_n = n[is_large]
+    variance = (
+            4 * (large_n - 2) * (5 * large_n ** 2 - 2 * large_n - 9) /
+            (5 * large_n * (large_n + 1) * (large_n - 1) ** 2))
+    values[is_large] = 2 + normal_ppf(a[is_large]) * np.sqrt(variance)
+    return(values[()] if values.ndim == 0 else values)
+
+
+def snht(n, a=0.05):
+    """ Critical values for the standard normal homogeneity test
+    (SNHT) for a single break.
+
+    Parameters
+    ----------
+        n: integer or numpy.ndarray
+            Size of the sample (from 20 to 100). Other sizes return
+            NaN.
+        a: float or numpy.ndarray (optional; default value is 0.05)
+            Significance level (alpha), between 0.01 and 0.05.
+
+    References
+    ----------
+        Alexandersson, H. (1986). A homogeneity test applied to
+            precipitation data. Journal of Climatology, 6(6), 661–675.
+            https://doi.org/10.1002/joc.3370060607
+
+        Wijngaard, J. B., Klein Tank, A. M. G., & Können, G. P. (2003).
+            Homogeneity of 20th century European daily temperature and
+            precipitation series. International Journal of Climatology,
+            23(6), 679–692. https://doi.org/10.1002/joc.906
+    """
+    values = interpolate_table(n, a, SNHT_N, SNHT_ALPHA, SNHT_VALUES)
+    return(values[()] if values.ndim == 0 else values)
+
+
+def buishand_range(n, a=0.05):
+    """ Critical values for the Buishand range test, in terms of the
+    rescaled adjusted range divided by the square root of the size of
+    the sample (R / sqrt(n)). For samples larger than 100, they are
+    interpolated linearly in 1 / sqrt(n) towards their limit.
+
+    Parameters
+    ----------
+        n: integer or numpy.ndarray
+            Size of the sample (at least 10). Smaller samples return
+            NaN.
+        a: float or numpy.ndarray (optional; default value is 0.05)
+            Significance level (alpha), between 0.01 and 0.1.
+
+    References
+    ----------
+        Buishand, T. A. (1982). Some methods for testing the
+            homogeneity of rainfall records. Journal of Hydrology,
+            58(1–2), 11–27. https://doi.org/10.1016/0022-1694(82)90066-X
+    """
+    values = interpolate_table(
+            n, a, BUISHAND_N, BUISHAND_ALPHA, BUISHAND_VALUES)
+    n, a = np.broadcast_arrays(
+            np.asarray(n, dtype='float'), np.asarray(a, dtype='float'))
+    is_large = n > BUISHAND_N[-1]
+    at_100 = interpolate_table(
+            BUISHAND_N[-1], a[is_large], BUISHAND_N, BUISHAND_ALPHA,
+            BUISHAND_VALUES)
+    limit = interpolate_table(
+            1, a[is_large], np.array([1]), BUISHAND_ALPHA,
+            BUISHAND_ASYMPTOTIC[:, np.newaxis])
+    weight = np.sqrt(BUISHAND_N[-1] / n[is_large])
+    values[is_large] = limit + weight * (at_100 - limit)
+    return(values[()] if values.ndim == 0 else values)
+
+
+def pettitt(n, a=0.05):
+    """ Critical values for the Pettitt test, from the approximation
+    of its significance probability p = 2 exp(-6 K^2 / (n^3 + n^2)).
+
+    Parameters
+    ----------
+        n: integer or numpy.ndarray
+            Size of the sample.
+        a: float or numpy.ndarray (optional; default value is 0.05)
+            Significance level (alpha), between 0 and 1.
+
+    References
+    ----------
+        Pettitt, A. N. (1979). A non-parametric approach to the
+            change-point problem. Applied Statistics, 28(2), 126–135.
+            https://doi.org/10.2307/2346729
+    """
+    a = np.asarray(a, dtype='float')
+
+    if np.any((a <= 0) | (a >= 1) | np.isnan(a)):
+        raise ValueError("The significance level must be between 0 and 1.")
+
+    n = np.asarray(n, dtype='float')
+    return(np.sqrt(-np.log(a / 2.0) * (n ** 3 + n ** 2) / 6.0))
+
+
+def normal_ppf(p):
+    """ Percent point function (inverse of the cumulative distribution
+    function) of the standard normal distribution, by the rational
+    approximation of Acklam (relative error below 1.15e-9).
+
+    Parameters
+    ----------
+        p: float or numpy.ndarray
+            Probabilities. Those outside [0, 1] (or NaN) return NaN; 0
+            and 1 return -inf and inf.
+
+    References
+    ----------
+        Acklam, P. J. (2003). An algorithm for computing the inverse
+            normal cumulative distribution function. Unpublished note.
+    """
+    a = [-3.969683028665376e+01, 2.209460984245205e+02,
+         -2.759285104469687e+02, 1.383577518672690e+02,
+         -3.066479806614716e+01, 2.506628277459239e+00]
+    b = [-5.447609879822406e+01, 1.615858368580409e+02,
+         -1.556989798598866e+02, 6.680131188771972e+01,
+         -1.328068155288572e+01, 1.0]
+    c = [-7.784894002430293e-03, -3.223964580411365e-01,
+         -2.400758277161838e+00, -2.549732539343734e+00,
+         4.374664141464968e+00, 2.938163982698783e+00]
+    d = [7.784695709041462e-03, 3.224671290700398e-01,
+         2.445134137142996e+00, 3.754408661907416e+00, 1.0]
+    p_low = 0.02425
+    p = np.asarray(p, dtype='float')
+    x = np.full(p.shape, np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Central region.
+        central = (p >= p_low) & (p <= 1 - p_low)
+        q = p[central] - 0.5
+        r = q * q
+        x[central] = q * np.polyval(a, r) / np.polyval(b, r)
+
+        # Tails (the upper one by symmetry).
+        lower = (p >= 0) & (p < p_low)
+        q = np.sqrt(-2 * np.log(p[lower]))
+        x[lower] = np.polyval(c, q) / np.polyval(d, q)
+        upper = (p > 1 - p_low) & (p <= 1)
+        q = np.sqrt(-2 * np.log1p(-p[upper]))
+        x[upper] = -np.polyval(c, q) / np.polyval(d, q)
+
+    x[p == 0] = -np.inf
+    x[p == 1] = np.inf
+
+    return(x[()] if x.ndim == 0 else x)
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""Quality control routines. Level 1 tests for streaming observations.
+
+Author
+------
+    Roberto A. Real-Rangel (Institute of Engineering UNAM; Mexico)
+
+License
+-------
+    GNU General Public License
+"""
+from collections import OrderedDict
+from collections import deque
+import math
+
+import numpy as np
+
+from . import quality_control_tests as qct
+from .incremental import stored_moments
+from .pipeline import level1_parameters
+from .pipeline import moment_scoring
+from .pipeline import scored_series
+
+STREAMING_TESTS = [
+        'gross_range_test', 'climatology_test', 'spikes_data_test',
+        'change_rate_test', 'flat_series_test']
+
+
+def log_value(value, transform='log'):
+    """Natural logarithm of a value ('log') or of the value plus one
+    ('log1p'), as quality_control_tests.log_values (i.e., nan for zero,
+    negative and missing values).
+    """
+    if transform == 'log1p':
+        return(math.log1p(value) if value > 0 else float('nan'))
+
+    return(math.log(value) if value > 0 else float('nan'))
+
+
+class StreamingQC(object):
+    """ Performs the level 1 tests on the observations of a variable as
+    they are received, one at a time (push) or in micro-batches
+    (push_many). The climatology (monthly mean and standard deviation
+    of the scored series; see pipeline.scored_series) is frozen when
+    the object is created, so every observation is tested in constant
+    time and memory.
+
+    Only the series scored by the logarithm ('log' or 'log1p') and not
+    robustly can be standardized with a frozen climatology (see
+    pipeline.moment_scoring).
+
+    The spikes data test needs the next observation, so the flags of an
+    observation are emitted when the following one is received (or
+    when flush is called). A gap in the time steps breaks the windows
+    of the spikes, change rate and flat series tests.
+
+    Parameters
+    ----------
+        moments: dict
+            Monthly count, sum and sum of squares of the scored series
+            of the variable (see pipeline.series_moments).
+        config: dict
+            Settings loaded from the configuration file (config.toml).
+        step: numpy.timedelta64 (default is one day)
+            Time step between consecutive observations.
+
+    Reference
+    ---------
+        IOOS. (2018). Manual for Real-Time Quality Control of Stream
+            Flow Observations: A Guide to Quality Control and Quality
+            Assurance for Stream Flow Observations in Rivers and
+            Streams.
+    """
+    def __init__(self, moments, config, step=np.timedelta64(1, 'D')):
+        parameters = level1_parameters(config)
+
+        if not moment_scoring(parameters):
+            raise ValueError(
+                    "The streaming tests can only standardize series "
+                    "scored by the logarithm ('log' or 'log1p') and not "
+                    "robustly.")
+
+        self.tests = [i for i in STREAMING_TESTS
+                      if config['level_1_tests'].get(i)]
+        self.threshold = parameters['threshold']
+        self.value_tolerance = parameters['value_tolerance']
+        self.repetitions_tolerance = parameters['repetitions_tolerance']
+        self.skipzero = parameters['skipzero']
+        self.transform = parameters['transform']
+        self.step = step
+        self.climatology = OrderedDict()
+
+        for name in ['values', 'spikes', 'change_rate']:
+            mean, std = qct.moments_stats(*moments[name])
+            self.climatology[name] = (mean.tolist(), std.tolist())
+
+        mean, std = qct.moments_stats(*[i.sum() for i in moments['values']])
+        self.gross = (float(mean), float(std))
+        self.reset()
+
+    @classmethod
+    def from_history(cls, input_ts, config, step=np.timedelta64(1, 'D')):
+        """Creates the object with the climatology of a historical time
+        series (xarray.DataArray), and continues it.
+        """
+        months = qct.month_index(input_ts)
+        values = input_ts.values.astype('float')
+        transform = level1_parameters(config)['transform']
+        moments = OrderedDict([
+                (name, qct.group_moments(series, months))
+                for name, series in scored_series(values, transform).items()])
+        streaming = cls(moments=moments, config=config, step=step)
+        streaming.push_many(input_ts['time'].values, values)
+        streaming.pending = None
+        return(streaming)
+
+    @classmethod
+    def from_statistics(cls, statistics, var, config,
+                        step=np.timedelta64(1, 'D')):
+        """Creates the object with the statistics saved by the
+        incremental tests (see incremental.level1_statistics), and
+        continues the record from their tail.
+        """
+        moments = OrderedDict([
+                (name, stored_moments(statistics, var, name))
+                for name in ['values', 'spikes', 'change_rate']])
+        streaming = cls(moments=moments, config=config, step=step)
+        streaming.push_many(
+                statistics['tail_time'].values,
+                statistics[var + '_tail'].values)
+        streaming.pending = None
+        return(streaming)
+
+    def reset(self):
+        """Forgets the previous observations (but not the climatology)."""
+        self.previous_time = None
+        self.previous_value = float('nan')
+        self.recent = deque(
+                maxlen=max(self.repetitions_tolerance, 1) + 1)
+        self.pending = None
+        self.pending_previous = float('nan')
+
+    def zscore(self, name, value, month):
+        """Standardized score of a value of a scored series."""
+        mean, std = self.climatology[name]
+
+        try:
+            return((log_value(value, self.transform) - mean[month]) /
+                   std[month])
+
+        except ZeroDivisionError:
+            return(float('nan'))
+
+    def push(self, time, value):
+        """Receives an observation.
+
+        Parameters
+        ----------
+            time: numpy.datetime64
+                Time of the observation.
+            value: float
+                Value of the observation (nan if missing).
+
+        Returns
+        -------
+            list
+                Tuples (time, value, flags) of the observations whose
+                flags are final; flags is an OrderedDict with the result
+                of every enabled test.
+        """
+        time = np.datetime64(time)
+        value = float(value)
+        month = int(time.astype('datetime64[M]').astype('int')) % 12
+        emitted = []
+
+        if (self.previous_time is not None and
+                time - self.previous_time != self.step):
+            emitted.extend(self.flush())
+            self.reset()
+
+        previous_value = self.previous_value
+        flags = OrderedDict([(i, False) for i in self.tests])
+        threshold = self.threshold
+
+        if 'gross_range_test' in flags:
+            mean, std = self.gross
+            z = ((log_value(value, self.transform) - mean) / std if std
+                 else float('nan'))
+            flags['gross_range_test'] = abs(z) > threshold
+
+        if 'climatology_test' in flags:
+            z = self.zscore('values', value, month)
+            flags['climatology_test'] = abs(z) > threshold
+
+        if 'change_rate_test' in flags:
+            change = abs(value - previous_value)
+            change = change if change != 0 else float('nan')
+            flags['change_rate_test'] = (
+                    self.zscore('change_rate', change, month) > threshold)
+
+        if 'flat_series_test' in flags:
+            # The spread of this value and the previous ones (see
+            # quality_control_tests.flat_values); missing values break
+            # the window.
+            recent = self.recent
+
+            if value == value:
+                recent.append(value)
+
+            else:
+                recent.clear()
+
+            flags['flat_series_test'] = (
+                    len(recent) == recent.maxlen and
+                    max(recent) - min(recent) <= self.value_tolerance and
+                    not (self.skipzero and 0 in recent))
+
+        # The pending observation waits for this one to be tested for
+        # spikes.
+        if self.pending is not None:
+            pending_time, pending_value, pending_flags, pending_month = (
+                    self.pending)
+
+            if 'spikes_data_test' in pending_flags:
+                spike = abs(pending_value - 0.5 * (
+                        self.pending_previous + value))
+                spike = spike if spike != 0 else float('nan')
+                pending_flags['spikes_data_test'] = (self.zscore(
+                        'spikes', spike, pending_month) > threshold)
+
+            emitted.append((pending_time, pending_value, pending_flags))
+
+        self.pending_previous = previous_value
+        self.pending = (time, value, flags, month)
+        self.previous_time = time
+        self.previous_value = value
+        return(emitted)
+
+    def push_many(self, times, values):
+        """Receives a micro-batch of observations (see push)."""
+        emitted = []
+
+        for time, value in zip(times, values):
+            emitted.extend(self.push(time, value))
+
+        return(emitted)
+
+    def flush(self):
+        """Emits the flags of the last observation, whose spike cannot
+        be computed (as in the last value of a time series).
+        """
+        emitted = []
+
+        if self.pending is not None:
+            emitted.append(self.pending[:3])
+            self.pending = None
+
+        return(emitted)
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""Quality control routines. Telemetry of the tests and readers.
+
+The instrumented functions (the tests of quality_control_tests, the
+readers of data_manager and pipeline.run_level1) record, per call, the
+wall time, CPU time, increase of the peak resident set size (RSS) of
+the process and size of the input, and the depth of the call within
+other instrumented calls (0 for the top-level ones). Telemetry is
+off by default, and then an instrumented function only adds one
+dictionary lookup per call. It is enabled with the environment variable TSQC_TELEMETRY=1 or
+with the [telemetry] section of the configuration.
+
+Author
+------
+    Roberto A. Real-Rangel (Institute of Engineering UNAM; Mexico)
+
+License
+-------
+    GNU General Public License
+"""
+from collections import OrderedDict
+import csv
+import functools
+import json
+import math
+import os
+import time
+
+try:
+    import resource
+
+except ImportError:
+    # Not available in Windows OS; the RSS is not recorded.
+    resource = None
+
+ENVIRONMENT_VARIABLE = 'TSQC_TELEMETRY'
+RECORD_FIELDS = [
+        'station', 'function', 'depth', 'wall_seconds', 'cpu_seconds',
+        'rss_delta', 'input_size']
+DEFAULT_TELEMETRY = OrderedDict([
+        ('enabled', False),
+        ('report', 'telemetry.json')])
+
+_state = {
+        'enabled': os.environ.get(ENVIRONMENT_VARIABLE, '').lower() in [
+                '1', 'true', 'yes', 'on'],
+        'station': '',
+        'depth': 0,
+        'records': []}
+
+
+def telemetry_parameters(config):
+    """Parameters of the telemetry, taken from the [telemetry] section
+    of the configuration (if any) and completed with DEFAULT_TELEMETRY.
+    The environment variable TSQC_TELEMETRY also enables it.
+    """
+    parameters = DEFAULT_TELEMETRY.copy()
+    parameters.update(config.get('telemetry', {}))
+    parameters['enabled'] = parameters['enabled'] or _state['enabled']
+    return(parameters)
+
+
+def configure(config):
+    """Enables the telemetry if it is set in the configuration."""
+    if telemetry_parameters(config)['enabled']:
+        enable()
+
+
+def enable():
+    _state['enabled'] = True
+
+
+def disable():
+    _state['enabled'] = False
+
+
+def is_enabled():
+    return(_state['enabled'])
+
+
+def set_station(station):
+    """Station of the next recorded calls."""
+    _state['station'] = station
+
+
+def collect():
+    """Returns and clears the records of the calls."""
+    records = _state['records']
+    _state['records'] = []
+    return(records)
+
+
+def peak_rss():
+    """Peak resident set size of the process, in bytes (NaN if it is not
+    available).
+    """
+    if resource is None:
+        return(float('nan'))
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes; macOS, bytes.
+    return(peak if os.uname()[0] == 'Darwin' else peak * 1024)
+
+
+def input_size(value):
+    """Size of the input of a call, in bytes: the size of an array (or
+    dataset) or of a file.
+    """
+    if hasattr(value, 'nbytes'):
+        return(int(value.nbytes))
+
+    try:
+        return(os.path.getsize(str(value)))
+
+    except (OSError, TypeError, ValueError):
+        return(float('nan'))
+
+
+def instrument(func):
+    """Decorator that records the calls of a function while the
+    telemetry is enabled.
+    """
+    name = '.'.join([func.__module__.split('.')[-1], func.__name__])
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _state['enabled']:
+            return(func(*args, **kwargs))
+
+        arguments = args + tuple(kwargs.values())
+        depth = _state['depth']
+        _state['depth'] = depth + 1
+        rss = peak_rss()
+        cpu = time.process_time()
+        wall = time.perf_counter()
+
+        try:
+            return(func(*args, **kwargs))
+
+        finally:
+            _state['depth'] = depth
+            _state['records'].append(OrderedDict([
+                    ('station', _state['station']),
+                    ('function', name),
+                    ('depth', depth),
+                    ('wall_seconds', time.perf_counter() - wall),
+                    ('cpu_seconds', time.process_time() - cpu),
+                    ('rss_delta', peak_rss() - rss),
+                    ('input_size', input_size(
+                            arguments[0]) if arguments else float('nan'))]))
+
+    return(wrapper)
+
+
+def summary(records, key='function'):
+    """Aggregates the records of the calls by function (or station).
+    The time of a call includes that of the instrumented calls nested
+    in it (e.g., the tests called by pipeline.run_level1), so only the
+    top-level calls are aggregated by station.
+
+    Returns
+    -------
+        list
+            Number of calls, total wall and CPU times, largest increase
+            of the peak RSS and total input size of every function (or
+            station), from the slowest to the fastest.
+    """
+    groups = OrderedDict()
+
+    if key == 'station':
+        records = [i for i in records if i['depth'] == 0]
+
+    for record in records:
+        group = groups.setdefault(record[key], OrderedDict([
+                (key, record[key]),
+                ('calls', 0),
+                ('wall_seconds', 0.0),
+                ('cpu_seconds', 0.0),
+                ('rss_delta', 0),
+                ('input_size', 0)]))
+        group['calls'] += 1
+        group['wall_seconds'] += record['wall_seconds']
+        group['cpu_seconds'] += record['cpu_seconds']
+
+        # Missing measurements (NaN) are left out.
+        if not math.isnan(record['rss_delta']):
+            group['rss_delta'] = max(group['rss_delta'], record['rss_delta'])
+
+        if not math.isnan(record['input_size']):
+            group['input_size'] += record['input_size']
+
+    return(sorted(groups.values(), key=lambda x: -x['wall_seconds']))
+
+
+def _json_records(records):
+    """Replaces the missing measurements (NaN) of the records by None,
+    which is written as null in JSON.
+    """
+    return([
+            OrderedDict([
+                    (field, None if (
+                            isinstance(value, float) and math.isnan(value))
+                     else value)
+                    for field, value in record.items()])
+            for record in records])
+
+
+def write_report(records, output_file):
+    """Writes the records of a run to a JSON file (every call and their
+    summaries by function and by station; missing measurements are
+    null) or, if the extension of the file is .csv, to a CSV file
+    (every call).
+    """
+    output_file = str(output_file)
+
+    if output_file.lower().endswith('.csv'):
+        with open(output_file, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=RECORD_FIELDS)
+            writer.writeheader()
+            writer.writerows(records)
+
+    else:
+        with open(output_file, 'w') as f:
+            json.dump(OrderedDict([
+                    ('functions', _json_records(summary(records, 'function'))),
+                    ('stations', _json_records(summary(records, 'station'))),
+                    ('calls', _json_records(records))]),
+                    f, indent=4, allow_nan=False)
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""Quality control routines. Regular time axis of the station records.
+
+A regular time axis is described by its first time, its step and its
+length, so the position of any date is found by arithmetic instead of
+by label lookups. The readers place the parsed records directly in
+their position of the axis (see RegularTimeAxis.place), and the tests
+pad their outputs by position (see pad_time).
+
+Author
+------
+    Roberto A. Real-Rangel (Institute of Engineering UNAM; Mexico)
+
+License
+-------
+    GNU General Public License
+"""
+import numpy as np
+import xarray as xr
+
+DAY = np.timedelta64(1, 'D')
+
+
+class RegularTimeAxis(object):
+    """ Time axis of evenly spaced times.
+
+    Parameters
+    ----------
+        start: numpy.datetime64
+            First time of the axis.
+        step: numpy.timedelta64 (default is one day)
+            Difference between consecutive times.
+        length: integer (default is 0)
+            Number of times.
+    """
+    def __init__(self, start, step=DAY, length=0):
+        self.start = np.datetime64(start)
+        self.step = np.timedelta64(step)
+        self.length = int(length)
+
+    @classmethod
+    def from_dates(cls, dates, step=DAY):
+        """Shortest axis (starting at the earliest date) that holds a
+        set of dates, which do not need to be sorted or unique.
+        """
+        dates = np.asarray(dates)
+
+        if not len(dates):
+            raise ValueError("Cannot build a time axis without dates.")
+
+        start = dates.min()
+        return(cls(
+                start=start, step=step,
+                length=(dates.max() - start) // step + 1))
+
+    @classmethod
+    def from_index(cls, times):
+        """Axis of an index of times (e.g., the 'time' coordinate of a
+        dataset), which must be evenly spaced.
+        """
+        times = np.asarray(times)
+
+        if len(times) < 2:
+            return(cls(
+                    start=times[0] if len(times) else np.datetime64('NaT'),
+                    length=len(times)))
+
+        steps = np.diff(times)
+
+        if (steps != steps[0]).any() or steps[0] <= np.timedelta64(0):
+            raise ValueError("The times are not evenly spaced.")
+
+        return(cls(start=times[0], step=steps[0], length=len(times)))
+
+    def __len__(self):
+        return(self.length)
+
+    def __eq__(self, other):
+        return(
+                isinstance(other, RegularTimeAxis) and
+                self.start == other.start and self.step == other.step and
+                self.length == other.length)
+
+    def __ne__(self, other):
+        return(not self == other)
+
+    def __repr__(self):
+        return("RegularTimeAxis(start={}, step={}, length={})".format(
+                self.start, self.step, self.length))
+
+    @property
+    def end(self):
+        """Last time of the axis."""
+        return(self.start + self.step * (self.length - 1))
+
+    @property
+    def values(self):
+        """Times of the axis (numpy.ndarray of numpy.datetime64)."""
+        return(self.start + self.step * np.arange(self.length))
+
+    def positions(self, dates):
+        """Position of every date in the axis (the dates between two
+        times of the axis belong to the earliest one).
+        """
+        return((np.asarray(dates) - self.start) // self.step)
+
+    def place(self, dates, values, duplicates='first'):
+        """ Places a set of records in their positions of the axis.
+        The times without records are filled with NaN.
+
+        Parameters
+        ----------
+            dates: numpy.ndarray
+                Dates of the records, within the axis.
+            values: numpy.ndarray
+                Values of the records, with the records along the first
+                dimension.
+            duplicates: string (default is 'first')
+                What to do with the records of repeated dates: keep the
+                first one ('first') or none of them ('drop').
+
+        Returns
+        -------
+            numpy.ndarray
+                Array of floats of length len(self) along the first
+                dimension.
+        """
+        position = self.positions(dates)
+        kept = unique_records(position, duplicates)
+        values = np.asarray(values)[kept]
+        placed = np.full((self.length, ) + values.shape[1:], np.nan)
+        placed[position[kept]] = values
+        return(placed)
+
+    def to_dataset(self, data_vars):
+        """ Dataset of variables defined over the axis.
+
+        Parameters
+        ----------
+            data_vars: dict
+                Arrays of every variable, of length len(self).
+        """
+        return(xr.Dataset(
+                data_vars={
+                        var: (['time'], values)
+                        for var, values in data_vars.items()},
+                coords={'time': self.values}))
+
+
+def unique_records(dates, duplicates='first'):
+    """ Records that remain after the treatment of the repeated dates.
+
+    Parameters
+    ----------
+        dates: numpy.ndarray
+            Dates of the records (or their positions in a time axis).
+        duplicates: string (default is 'first')
+            What to do with the records of repeated dates: keep the
+            first one ('first') or none of them ('drop').
+
+    Returns
+    -------
+        numpy.ndarray
+            Positions of the remaining records, sorted by date.
+    """
+    if duplicates == 'first':
+        _, index = np.unique(dates, return_index=True)
+        return(index)
+
+    elif duplicates == 'drop':
+        _, index, counts = np.unique(
+                dates, return_index=True, return_counts=True)
+        return(index[counts == 1])
+
+    raise ValueError(
+            "Unknown treatment of duplicates '{}'.".format(duplicates))
+
+
+def pad_time(values, before=0, after=0, fill_value=np.nan):
+    """ Pads an array along its last dimension (time) by position,
+    e.g., to restore the length of the result of numpy.diff.
+
+    Parameters
+    ----------
+        values: numpy.ndarray
+            Array to pad.
+        before, after: integer (default is 0)
+            Number of elements added at the start and at the end.
+        fill_value: float (default is numpy.nan)
+            Value of the added elements.
+    """
+    padded = np.full(
+            values.shape[:-1] + (values.shape[-1] + before + after, ),
+            fill_value, dtype=np.result_type(values, fill_value))
+    padded[..., before:before + values.shape[-1]] = values
+    return(padded)